@@ -0,0 +1,178 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+import numpy as np
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 4096, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self._on_remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._set_locked(key, value)
+
+    def _set_locked(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else 0.0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            evicted, _ = self._data.popitem(last=False)
+            self._on_remove(evicted)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._on_remove(key)
+        return entry[1] if entry else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._on_clear()
+
+    def _on_remove(self, key: Hashable) -> None:
+        pass
+
+    def _on_clear(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class TaggedCache(LRUCache):
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None, history: int = 1024):
+        super().__init__(max_entries, ttl_seconds)
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self._index: Dict[Hashable, Set[Hashable]] = {}
+        self._history: "deque[tuple[int, Optional[Set[Hashable]]]]" = deque(maxlen=history)
+        self._sequence = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    def set_tagged(self, key: Hashable, value: Any, tags: Iterable[Hashable], since: Optional[int] = None) -> bool:
+        tags = set(tags)
+        with self._lock:
+            if since is not None and self._invalidated_since(since, tags):
+                self.stale_writes += 1
+                return False
+            self._on_remove(key)
+            self._tags[key] = tags
+            for tag in tags:
+                self._index.setdefault(tag, set()).add(key)
+            self._set_locked(key, value)
+        return True
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        tags = set(tags)
+        with self._lock:
+            self._sequence += 1
+            self._history.append((self._sequence, tags))
+            keys = set().union(*(self._index.get(tag, ()) for tag in tags))
+            for key in keys:
+                self._data.pop(key, None)
+                self._on_remove(key)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def _invalidated_since(self, since: int, tags: Set[Hashable]) -> bool:
+        if since == self._sequence:
+            return False
+        if not self._history or self._history[0][0] > since + 1:
+            return True
+        return any(seq > since and (touched is None or not tags.isdisjoint(touched)) for seq, touched in self._history)
+
+    def _on_remove(self, key: Hashable) -> None:
+        for tag in self._tags.pop(key, ()):
+            keys = self._index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[tag]
+
+    def _on_clear(self) -> None:
+        self._tags.clear()
+        self._index.clear()
+        self._sequence += 1
+        self._history.append((self._sequence, None))
+
+    def stats(self) -> dict:
+        return {**super().stats(), "invalidations": self.invalidations, "stale_writes": self.stale_writes}
+
+
+class SqliteVectorStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self._connect().execute(
+            "SELECT vector FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def set(self, key: str, vector: np.ndarray) -> None:
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                (key, np.asarray(vector, dtype=np.float32).tobytes()),
+            )
+        except sqlite3.OperationalError:
+            pass
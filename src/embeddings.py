@@ -0,0 +1,288 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+import psycopg
+from sqlmodel import Session, select, text
+
+from src.database import EmbeddingVersion, EMBEDDING_DIM, engine
+from src.index import (
+    ANN_KINDS,
+    QUANTIZATIONS,
+    build_index_sql,
+    default_quantization,
+    drop_index,
+    index_name,
+    list_category_indexes,
+    reset_partial_categories,
+    resolve_params,
+    sql_literal,
+)
+from src.ml import get_configured_model_name, get_model, get_model_name, set_active_model_name
+from src.search import vector_literal
+from src.search_cache import listener_url
+
+logger = logging.getLogger(__name__)
+
+SHADOW_COLUMN = "embedding_next"
+SHADOW_MODEL_COLUMN = "embedding_next_model"
+SWITCH_ATTEMPTS = 5
+VERSION_CHANNEL = "embedding_version"
+
+_watcher: Optional[threading.Thread] = None
+
+def get_active_version(session: Session) -> Optional[EmbeddingVersion]:
+    return session.exec(select(EmbeddingVersion).where(EmbeddingVersion.status == "active")).first()
+
+def list_versions(session: Session) -> List[EmbeddingVersion]:
+    return session.exec(select(EmbeddingVersion).order_by(EmbeddingVersion.created_at)).all()
+
+def ensure_embedding_version(session: Session) -> str:
+    active = get_active_version(session)
+    configured = get_configured_model_name()
+    if active is None:
+        logger.info(f"Registering {configured} as the active embedding model.")
+        session.add(EmbeddingVersion(
+            model=configured, dim=EMBEDDING_DIM, status="active", phase="active",
+            activated_at=datetime.utcnow(),
+        ))
+        session.exec(
+            text("UPDATE documents SET embedding_model = :model WHERE embedding_model IS NULL"),
+            params={"model": configured},
+        )
+        session.commit()
+        return configured
+    if active.model != configured:
+        logger.warning(
+            f"EMBEDDING_MODEL={configured} differs from the stored embeddings ({active.model}); "
+            f"serving with {active.model}. Run src.scripts.reembed to switch models."
+        )
+    return active.model
+
+def refresh_active_model() -> str:
+    with Session(engine) as session:
+        model = ensure_embedding_version(session)
+    if model != get_model_name():
+        logger.info(f"Active embedding model is now {model}.")
+        set_active_model_name(model)
+        reset_partial_categories()
+    return model
+
+def start_version_watcher(interval: float = 5.0) -> None:
+    global _watcher
+    if _watcher is not None:
+        return
+
+    def run():
+        while True:
+            try:
+                with psycopg.connect(listener_url(), autocommit=True) as conn:
+                    conn.execute(f"LISTEN {VERSION_CHANNEL}")
+                    while True:
+                        refresh_active_model()
+                        for _ in conn.notifies(timeout=interval, stop_after=1):
+                            pass
+            except Exception:
+                logger.exception("Embedding version watcher failed, reconnecting")
+                time.sleep(interval)
+
+    _watcher = threading.Thread(target=run, name="embedding-version-watcher", daemon=True)
+    _watcher.start()
+
+class ReembedJob:
+    def __init__(self, model: str, batch_size: int = 128, sleep_ms: float = 0, index_kind: str = "hnsw"):
+        self.model = model
+        self.batch_size = batch_size
+        self.sleep = sleep_ms / 1000
+        self.index_kind = index_kind
+        self.quantizations = list(dict.fromkeys(["none", default_quantization()]))
+        self.dim = get_model(model).get_sentence_embedding_dimension()
+        self.category_indexes: List[dict] = []
+
+    def _update_version(self, session: Session, **fields) -> None:
+        version = session.get(EmbeddingVersion, self.model)
+        for key, value in fields.items():
+            setattr(version, key, value)
+        session.add(version)
+        session.commit()
+
+    def prepare(self) -> None:
+        if self.dim != EMBEDDING_DIM:
+            raise ValueError(
+                f"{self.model} produces {self.dim}-dimensional embeddings but EMBEDDING_DIM is {EMBEDDING_DIM}; "
+                "re-embedding only supports models of the same dimension"
+            )
+        with Session(engine) as session:
+            active = get_active_version(session)
+            if active is not None and active.model == self.model:
+                raise ValueError(f"{self.model} is already the active embedding model")
+            building = session.exec(
+                select(EmbeddingVersion).where(EmbeddingVersion.status == "building")
+            ).first()
+            if building is not None and building.model != self.model:
+                raise ValueError(f"Re-embedding into {building.model} is already in progress")
+
+            session.exec(text(f"ALTER TABLE documents ADD COLUMN IF NOT EXISTS {SHADOW_COLUMN} vector({self.dim})"))
+            session.exec(text(f"ALTER TABLE documents ADD COLUMN IF NOT EXISTS {SHADOW_MODEL_COLUMN} VARCHAR"))
+            total = session.exec(text("SELECT count(*) FROM documents")).one()[0]
+            done = session.exec(text(f"SELECT count(*) FROM documents WHERE {SHADOW_COLUMN} IS NOT NULL")).one()[0]
+
+            version = session.get(EmbeddingVersion, self.model)
+            if version is None:
+                version = EmbeddingVersion(model=self.model, dim=self.dim)
+            version.status, version.phase, version.error = "building", "embedding", None
+            version.rows_total, version.rows_done = total, done
+            session.add(version)
+            session.commit()
+
+    def embed_pending(self) -> int:
+        model = get_model(self.model)
+        last_id, processed = 0, 0
+        while True:
+            with Session(engine) as session:
+                rows = session.exec(
+                    text(f"""
+                        SELECT id, content FROM documents
+                        WHERE id > :last_id AND {SHADOW_COLUMN} IS NULL
+                        ORDER BY id LIMIT :batch_size
+                    """),
+                    params={"last_id": last_id, "batch_size": self.batch_size},
+                ).all()
+                if not rows:
+                    return processed
+
+                vectors = np.asarray(model.encode([r.content for r in rows], batch_size=len(rows)), dtype=np.float32)
+                session.exec(
+                    text(f"""
+                        UPDATE documents d
+                        SET {SHADOW_COLUMN} = CAST(v.vec AS vector), {SHADOW_MODEL_COLUMN} = :model
+                        FROM unnest(CAST(:ids AS int[]), CAST(:vecs AS text[])) AS v(id, vec)
+                        WHERE d.id = v.id
+                    """),
+                    params={
+                        "model": self.model,
+                        "ids": [r.id for r in rows],
+                        "vecs": [vector_literal(v) for v in vectors],
+                    },
+                )
+                session.exec(
+                    text("UPDATE embedding_versions SET rows_done = rows_done + :n WHERE model = :model"),
+                    params={"n": len(rows), "model": self.model},
+                )
+                session.commit()
+
+            last_id = rows[-1].id
+            processed += len(rows)
+            if self.sleep:
+                time.sleep(self.sleep)
+
+    def shadow_index_name(self, quantization: str = "none") -> str:
+        if quantization == "none":
+            return f"documents_{SHADOW_COLUMN}_{self.index_kind}_idx"
+        return f"documents_{SHADOW_COLUMN}_{quantization}_{self.index_kind}_idx"
+
+    def shadow_category_index_name(self, name: str) -> str:
+        return name.replace("documents_cat_", "documents_next_cat_", 1)
+
+    def build_index(self) -> None:
+        with Session(engine) as session:
+            self._update_version(session, phase="indexing")
+        for quantization in self.quantizations:
+            drop_index(self.shadow_index_name(quantization))
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(build_index_sql(
+                    self.index_kind, resolve_params(self.index_kind), self.shadow_index_name(quantization),
+                    expression=SHADOW_COLUMN, quantization=quantization, dim=self.dim,
+                )))
+        self.category_indexes = list_category_indexes()
+        for index in self.category_indexes:
+            shadow = self.shadow_category_index_name(index["name"])
+            drop_index(shadow)
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(build_index_sql(
+                    index["kind"], resolve_params(index["kind"]), shadow, expression=SHADOW_COLUMN,
+                    where=f"category = {sql_literal(index['category'])}", dim=self.dim,
+                )))
+
+    def switch(self) -> bool:
+        with Session(engine) as session:
+            self._update_version(session, phase="switching")
+
+        for _ in range(SWITCH_ATTEMPTS):
+            self.embed_pending()
+            with Session(engine) as session:
+                session.exec(text("LOCK TABLE documents IN SHARE ROW EXCLUSIVE MODE"))
+                missing = session.exec(
+                    text(f"SELECT EXISTS (SELECT 1 FROM documents WHERE {SHADOW_COLUMN} IS NULL)")
+                ).one()[0]
+                if missing:
+                    session.rollback()
+                    continue
+
+                session.exec(text("ALTER TABLE documents RENAME COLUMN embedding TO embedding_prev"))
+                session.exec(text("ALTER TABLE documents RENAME COLUMN embedding_model TO embedding_model_prev"))
+                session.exec(text(f"ALTER TABLE documents RENAME COLUMN {SHADOW_COLUMN} TO embedding"))
+                session.exec(text(f"ALTER TABLE documents RENAME COLUMN {SHADOW_MODEL_COLUMN} TO embedding_model"))
+                for kind in ANN_KINDS:
+                    for quantization in QUANTIZATIONS:
+                        session.exec(text(
+                            f"ALTER INDEX IF EXISTS {index_name(kind, quantization=quantization)} "
+                            f"RENAME TO {index_name(kind, '_prev', quantization)}"
+                        ))
+                for quantization in self.quantizations:
+                    session.exec(text(
+                        f"ALTER INDEX {self.shadow_index_name(quantization)} "
+                        f"RENAME TO {index_name(self.index_kind, quantization=quantization)}"
+                    ))
+                for index in self.category_indexes:
+                    session.exec(text(
+                        f"ALTER INDEX IF EXISTS {index['name']} RENAME TO {index['name'][:-len('_idx')]}_prev_idx"
+                    ))
+                    session.exec(text(
+                        f"ALTER INDEX {self.shadow_category_index_name(index['name'])} RENAME TO {index['name']}"
+                    ))
+                session.exec(
+                    text("UPDATE embedding_versions SET status = 'retired', phase = 'retired' WHERE status = 'active'")
+                )
+                session.exec(
+                    text("""
+                        UPDATE embedding_versions
+                        SET status = 'active', phase = 'active', activated_at = :now
+                        WHERE model = :model
+                    """),
+                    params={"now": datetime.utcnow(), "model": self.model},
+                )
+                session.exec(
+                    text("SELECT pg_notify(:channel, :model)"), params={"channel": VERSION_CHANNEL, "model": self.model}
+                )
+                session.commit()
+
+            with Session(engine) as session:
+                session.exec(text("ALTER TABLE documents DROP COLUMN embedding_prev, DROP COLUMN embedding_model_prev"))
+                session.commit()
+            reset_partial_categories()
+            logger.info(f"Switched embeddings to {self.model}.")
+            return True
+
+        logger.warning("Documents kept arriving without shadow embeddings; switch postponed.")
+        return False
+
+    def run(self, switch: bool = True) -> bool:
+        try:
+            self.prepare()
+            logger.info(f"Re-embedding corpus with {self.model} (dim={self.dim})...")
+            self.embed_pending()
+            self.build_index()
+            return self.switch() if switch else False
+        except Exception as e:
+            with Session(engine) as session:
+                if session.get(EmbeddingVersion, self.model) is not None:
+                    self._update_version(session, error=str(e))
+            raise
+
+def version_poll_interval() -> float:
+    return float(os.getenv("EMBEDDING_VERSION_POLL_S", "5"))
@@ -0,0 +1,495 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.database import (
+    DEFAULT_NAMESPACE,
+    Document,
+    DocumentFeedback,
+    Interaction,
+    InteractionRollup,
+    QueryFeedback,
+    engine,
+)
+from src.ml import normalize_query
+from src.search_cache import (
+    get_response_cache,
+    invalidate_documents,
+    notify_clear_statement,
+    notify_statements,
+    response_cache_enabled,
+    touched_documents,
+)
+
+logger = logging.getLogger(__name__)
+
+BULK_INSERT_CHUNK = 1000
+
+FEEDBACK_SCOPES = ("global", "query", "blend")
+AGGREGATE_KEYS = {
+    DocumentFeedback: ("namespace", "document_id"),
+    QueryFeedback: ("namespace", "query_key", "document_id"),
+}
+
+def query_key(query: str) -> str:
+    return hashlib.blake2b(normalize_query(query).encode("utf-8"), digest_size=8).hexdigest()
+
+def assign_query_keys(interactions: List[Interaction]) -> None:
+    for inter in interactions:
+        if inter.query_key is None:
+            inter.query_key = query_key(inter.query_text)
+
+def default_feedback_scope() -> str:
+    scope = os.getenv("FEEDBACK_SCOPE", "blend")
+    if scope not in FEEDBACK_SCOPES:
+        raise ValueError(f"Unknown FEEDBACK_SCOPE '{scope}', expected one of {list(FEEDBACK_SCOPES)}")
+    return scope
+
+def global_feedback_weight() -> float:
+    return float(os.getenv("GLOBAL_FEEDBACK_WEIGHT", "0.25"))
+
+def decay_enabled() -> bool:
+    return os.getenv("FEEDBACK_DECAY", "0") == "1"
+
+def half_life_seconds() -> float:
+    return float(os.getenv("FEEDBACK_HALF_LIFE_HOURS", "168")) * 3600
+
+def decay_weight(age_seconds: float) -> float:
+    return 0.5 ** (max(age_seconds, 0.0) / half_life_seconds())
+
+def feedback_value_sql(alias: str, decay: bool = False) -> str:
+    if not decay:
+        return f"{alias}.total_score"
+    age = f"GREATEST(extract(epoch FROM (now() AT TIME ZONE 'utc') - {alias}.decayed_at)::float8, 0)"
+    return f"({alias}.decayed_score * power(0.5, {age} / {half_life_seconds()!r}))"
+
+def aggregate_upsert_statements(model, interactions: List[Interaction]) -> list:
+    keys = AGGREGATE_KEYS[model]
+    now = datetime.utcnow()
+    totals: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0.0])
+    for inter in interactions:
+        key = tuple(getattr(inter, column) for column in keys)
+        totals[key][0] += inter.score_delta
+        totals[key][1] += 1
+        totals[key][2] += inter.score_delta * decay_weight((now - inter.created_at).total_seconds())
+    rows = [
+        {
+            **dict(zip(keys, key)),
+            "total_score": score,
+            "interactions": count,
+            "decayed_score": decayed,
+            "decayed_at": now,
+            "updated_at": now,
+        }
+        for key, (score, count, decayed) in sorted(totals.items())
+    ]
+    return [aggregate_upsert_chunk(model, rows[i : i + BULK_INSERT_CHUNK]) for i in range(0, len(rows), BULK_INSERT_CHUNK)]
+
+def aggregate_upsert_chunk(model, rows: List[Dict[str, Any]]):
+    keys = AGGREGATE_KEYS[model]
+    stmt = insert(model).values(rows)
+    elapsed = func.greatest(func.extract("epoch", stmt.excluded.decayed_at - model.decayed_at), 0)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[getattr(model, column) for column in keys],
+        set_={
+            "total_score": model.total_score + stmt.excluded.total_score,
+            "interactions": model.interactions + stmt.excluded.interactions,
+            "decayed_score": func.coalesce(model.decayed_score * func.power(0.5, elapsed / half_life_seconds()), 0)
+            + stmt.excluded.decayed_score,
+            "decayed_at": stmt.excluded.decayed_at,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    return stmt
+
+def feedback_upsert_statements(interactions: List[Interaction]) -> list:
+    assign_query_keys(interactions)
+    return [stmt for model in AGGREGATE_KEYS for stmt in aggregate_upsert_statements(model, interactions)]
+
+def upsert_feedback_aggregate(session: Session, interactions: List[Interaction]) -> None:
+    for stmt in feedback_upsert_statements(interactions):
+        session.exec(stmt)
+    if response_cache_enabled():
+        for stmt, params in notify_statements(touched_documents(interactions)):
+            session.exec(stmt, params=params)
+
+def invalidate_cached_searches(interactions: List[Interaction]) -> None:
+    if response_cache_enabled():
+        invalidate_documents(touched_documents(interactions))
+
+def clear_cached_searches(session: Session) -> None:
+    if response_cache_enabled():
+        stmt, params = notify_clear_statement()
+        session.exec(stmt, params=params)
+        session.commit()
+        get_response_cache().clear()
+
+def record_feedback(session: Session, interactions: List[Interaction]) -> None:
+    assign_query_keys(interactions)
+    session.add_all(interactions)
+    upsert_feedback_aggregate(session, interactions)
+    session.commit()
+    invalidate_cached_searches(interactions)
+
+async def record_feedback_async(session: AsyncSession, interactions: List[Interaction]) -> None:
+    assign_query_keys(interactions)
+    session.add_all(interactions)
+    for stmt in feedback_upsert_statements(interactions):
+        await session.exec(stmt)
+    if response_cache_enabled():
+        for stmt, params in notify_statements(touched_documents(interactions)):
+            await session.exec(stmt, params=params)
+    await session.commit()
+    invalidate_cached_searches(interactions)
+
+def bulk_record_feedback(session: Session, interactions: List[Interaction]) -> None:
+    assign_query_keys(interactions)
+    for i in range(0, len(interactions), BULK_INSERT_CHUNK):
+        chunk = interactions[i : i + BULK_INSERT_CHUNK]
+        rows = [inter.model_dump(exclude={"id"}) for inter in chunk]
+        session.exec(insert(Interaction).values(rows))
+    upsert_feedback_aggregate(session, interactions)
+    session.commit()
+    invalidate_cached_searches(interactions)
+
+def feedback_value_column(model, decay: bool = False):
+    if not decay:
+        return model.total_score
+    return literal_column(feedback_value_sql(model.__tablename__, decay)).label("total_score")
+
+def feedback_map_statement(doc_ids: List[int], namespace: str = DEFAULT_NAMESPACE, decay: bool = False):
+    return select(DocumentFeedback.document_id, feedback_value_column(DocumentFeedback, decay)).where(
+        DocumentFeedback.namespace == namespace,
+        DocumentFeedback.document_id.in_(doc_ids),
+    )
+
+def get_feedback_map(
+    session: Session, doc_ids: List[int], namespace: str = DEFAULT_NAMESPACE, decay: bool = False
+) -> Dict[int, float]:
+    if not doc_ids:
+        return {}
+    rows = session.exec(feedback_map_statement(doc_ids, namespace, decay)).all()
+    return {row.document_id: row.total_score for row in rows}
+
+async def get_feedback_map_async(
+    session: AsyncSession, doc_ids: List[int], namespace: str = DEFAULT_NAMESPACE, decay: bool = False
+) -> Dict[int, float]:
+    if not doc_ids:
+        return {}
+    rows = (await session.exec(feedback_map_statement(doc_ids, namespace, decay))).all()
+    return {row.document_id: row.total_score for row in rows}
+
+def query_feedback_map_statement(keys: List[str], doc_ids: List[int], namespace: str = DEFAULT_NAMESPACE, decay: bool = False):
+    return select(QueryFeedback.query_key, QueryFeedback.document_id, feedback_value_column(QueryFeedback, decay)).where(
+        QueryFeedback.namespace == namespace,
+        QueryFeedback.query_key.in_(keys),
+        QueryFeedback.document_id.in_(doc_ids),
+    )
+
+def group_query_feedback(rows) -> Dict[str, Dict[int, float]]:
+    grouped: Dict[str, Dict[int, float]] = defaultdict(dict)
+    for row in rows:
+        grouped[row.query_key][row.document_id] = row.total_score
+    return grouped
+
+def blend_feedback(global_map: Dict[int, float], query_map: Dict[int, float], scope: str) -> Dict[int, float]:
+    if scope == "global":
+        return global_map
+    if scope == "query":
+        return query_map
+    weight = global_feedback_weight()
+    blended = {doc_id: weight * score for doc_id, score in global_map.items()}
+    blended.update(query_map)
+    return blended
+
+def get_scoped_feedback_maps(
+    session: Session,
+    doc_ids: List[int],
+    keys: List[str],
+    namespace: str = DEFAULT_NAMESPACE,
+    scope: str = "blend",
+    decay: bool = False,
+) -> Dict[str, Dict[int, float]]:
+    if not doc_ids:
+        return {key: {} for key in keys}
+    global_map = get_feedback_map(session, doc_ids, namespace, decay) if scope != "query" else {}
+    query_maps = {}
+    if scope != "global":
+        rows = session.exec(query_feedback_map_statement(keys, doc_ids, namespace, decay)).all()
+        query_maps = group_query_feedback(rows)
+    return {key: blend_feedback(global_map, query_maps.get(key, {}), scope) for key in keys}
+
+async def get_scoped_feedback_maps_async(
+    session: AsyncSession,
+    doc_ids: List[int],
+    keys: List[str],
+    namespace: str = DEFAULT_NAMESPACE,
+    scope: str = "blend",
+    decay: bool = False,
+) -> Dict[str, Dict[int, float]]:
+    if not doc_ids:
+        return {key: {} for key in keys}
+    global_map = await get_feedback_map_async(session, doc_ids, namespace, decay) if scope != "query" else {}
+    query_maps = {}
+    if scope != "global":
+        rows = (await session.exec(query_feedback_map_statement(keys, doc_ids, namespace, decay))).all()
+        query_maps = group_query_feedback(rows)
+    return {key: blend_feedback(global_map, query_maps.get(key, {}), scope) for key in keys}
+
+def max_feedback_statements(namespace: str, scope: str, key: Optional[str], decay: bool = False) -> Dict[str, object]:
+    statements = {}
+    if scope != "query":
+        column = DocumentFeedback.decayed_score if decay else DocumentFeedback.total_score
+        statements["global"] = select(func.max(column)).where(DocumentFeedback.namespace == namespace)
+    if scope != "global":
+        column = QueryFeedback.decayed_score if decay else QueryFeedback.total_score
+        statements["query"] = select(func.max(column)).where(
+            QueryFeedback.namespace == namespace, QueryFeedback.query_key == key
+        )
+    return statements
+
+def combine_max_feedback(maxima: Dict[str, Optional[float]], scope: str) -> float:
+    global_max = float(maxima.get("global") or 0)
+    query_max = float(maxima.get("query") or 0)
+    if scope == "global":
+        return global_max
+    if scope == "query":
+        return query_max
+    return max(query_max, global_feedback_weight() * global_max)
+
+def get_max_feedback(
+    session: Session, namespace: str = DEFAULT_NAMESPACE, scope: str = "blend", key: Optional[str] = None, decay: bool = False
+) -> float:
+    statements = max_feedback_statements(namespace, scope, key, decay)
+    return combine_max_feedback({name: session.exec(stmt).one() for name, stmt in statements.items()}, scope)
+
+async def get_max_feedback_async(
+    session: AsyncSession, namespace: str = DEFAULT_NAMESPACE, scope: str = "blend", key: Optional[str] = None, decay: bool = False
+) -> float:
+    statements = max_feedback_statements(namespace, scope, key, decay)
+    return combine_max_feedback({name: (await session.exec(stmt)).one() for name, stmt in statements.items()}, scope)
+
+def backfill_query_keys(session: Session) -> int:
+    texts = session.exec(select(Interaction.query_text).where(Interaction.query_key.is_(None)).distinct()).all()
+    for i in range(0, len(texts), BULK_INSERT_CHUNK):
+        chunk = list(texts[i : i + BULK_INSERT_CHUNK])
+        session.exec(text("""
+            UPDATE interactions i SET query_key = k.query_key
+            FROM unnest(CAST(:texts AS text[]), CAST(:keys AS text[])) AS k(query_text, query_key)
+            WHERE i.query_key IS NULL AND i.query_text = k.query_text
+        """), params={"texts": chunk, "keys": [query_key(t) for t in chunk]})
+    return len(texts)
+
+def reset_feedback(session: Session, namespace: Optional[str] = None) -> None:
+    if namespace is None:
+        session.exec(text("TRUNCATE document_feedback, query_feedback, interactions, interaction_rollups"))
+    else:
+        for table in ("document_feedback", "query_feedback", "interactions", "interaction_rollups"):
+            session.exec(text(f"DELETE FROM {table} WHERE namespace = :namespace"), params={"namespace": namespace})
+    session.commit()
+    clear_cached_searches(session)
+
+FEEDBACK_EVENTS_SQL = """
+    SELECT namespace, query_key, document_id, score_delta, 1 AS events, created_at
+    FROM interactions
+    UNION ALL
+    SELECT namespace, query_key, document_id, total_score, interactions, day + interval '12 hours'
+    FROM interaction_rollups
+"""
+
+def rebuild_feedback_aggregate(session: Session) -> int:
+    session.exec(text("LOCK TABLE interactions, interaction_rollups IN SHARE MODE"))
+    backfill_query_keys(session)
+    session.exec(text("DELETE FROM document_feedback"))
+    session.exec(text("DELETE FROM query_feedback"))
+    age = "GREATEST(extract(epoch FROM (now() AT TIME ZONE 'utc') - created_at)::float8, 0)"
+    decayed = f"SUM(score_delta * power(0.5, {age} / {half_life_seconds()!r}))"
+    session.exec(text(f"""
+        INSERT INTO query_feedback (namespace, query_key, document_id, total_score, interactions, decayed_score, decayed_at, updated_at)
+        SELECT namespace, query_key, document_id, SUM(score_delta), SUM(events), {decayed},
+               now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+        FROM ({FEEDBACK_EVENTS_SQL}) e
+        GROUP BY namespace, query_key, document_id
+    """))
+    result = session.exec(text(f"""
+        INSERT INTO document_feedback (namespace, document_id, total_score, interactions, decayed_score, decayed_at, updated_at)
+        SELECT namespace, document_id, SUM(score_delta), SUM(events), {decayed},
+               now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+        FROM ({FEEDBACK_EVENTS_SQL}) e
+        GROUP BY namespace, document_id
+    """))
+    session.commit()
+    clear_cached_searches(session)
+    logger.info(f"Rebuilt feedback aggregate for {result.rowcount} documents.")
+    return result.rowcount
+
+def verify_feedback_aggregate(session: Session) -> List[Dict[str, int]]:
+    mismatches = []
+    for model, keys in AGGREGATE_KEYS.items():
+        table = model.__tablename__
+        columns = ", ".join(f"COALESCE(a.{key}, r.{key}) AS {key}" for key in keys)
+        joined = " AND ".join(f"r.{key} = a.{key}" for key in keys)
+        rows = session.exec(text(f"""
+            SELECT '{table}' AS aggregate, {columns},
+                   COALESCE(a.total_score, 0) AS aggregate_score,
+                   COALESCE(r.total_score, 0) AS raw_score,
+                   COALESCE(a.interactions, 0) AS aggregate_count,
+                   COALESCE(r.interactions, 0) AS raw_count
+            FROM {table} a
+            FULL OUTER JOIN (
+                SELECT {", ".join(keys)}, SUM(score_delta) AS total_score, SUM(events) AS interactions
+                FROM ({FEEDBACK_EVENTS_SQL}) e
+                GROUP BY {", ".join(keys)}
+            ) r ON {joined}
+            WHERE COALESCE(a.total_score, 0) <> COALESCE(r.total_score, 0)
+               OR COALESCE(a.interactions, 0) <> COALESCE(r.interactions, 0)
+            ORDER BY {", ".join(str(i + 2) for i in range(len(keys)))}
+        """)).mappings().all()
+        mismatches.extend(dict(row) for row in rows)
+    return mismatches
+
+def ensure_feedback_aggregate(session: Session) -> None:
+    has_raw = (
+        session.exec(select(Interaction.id).limit(1)).first() is not None
+        or session.exec(select(InteractionRollup.document_id).limit(1)).first() is not None
+    )
+    has_aggregate = session.exec(select(DocumentFeedback.document_id).limit(1)).first() is not None
+    has_query_aggregate = session.exec(select(QueryFeedback.document_id).limit(1)).first() is not None
+    if has_raw and not (has_aggregate and has_query_aggregate):
+        logger.info("Feedback aggregate is empty, rebuilding from interactions...")
+        rebuild_feedback_aggregate(session)
+        return
+    undecayed = session.exec(select(DocumentFeedback.document_id).where(DocumentFeedback.decayed_at.is_(None)).limit(1)).first()
+    if undecayed is not None:
+        logger.info("Feedback aggregate has no decayed scores yet, rebuilding from interactions...")
+        rebuild_feedback_aggregate(session)
+
+class BufferFullError(RuntimeError):
+    pass
+
+class FeedbackBuffer:
+    def __init__(self, flush_size: int = 500, flush_interval_ms: float = 1000, max_pending: int = 100_000):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self._known_ids: Set[int] = set()
+        self._pending: List[Interaction] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def load_known_ids(self) -> None:
+        with Session(engine) as session:
+            self._known_ids = set(session.exec(select(Document.id)).all())
+        logger.info(f"Feedback buffer knows {len(self._known_ids)} document ids.")
+
+    def knows(self, document_id: int) -> bool:
+        return document_id in self._known_ids
+
+    def remember(self, document_id: int) -> None:
+        self._known_ids.add(document_id)
+
+    def is_known(self, session: Session, document_id: int) -> bool:
+        if document_id in self._known_ids:
+            return True
+        if session.get(Document, document_id):
+            self._known_ids.add(document_id)
+            return True
+        return False
+
+    def add(self, inter: Interaction) -> int:
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise BufferFullError("Feedback buffer is full")
+            self._pending.append(inter)
+            pending = len(self._pending)
+        if pending >= self.flush_size:
+            self._wakeup.set()
+        return pending
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[: self.flush_size]
+                    del self._pending[: len(batch)]
+                if not batch:
+                    return flushed
+                try:
+                    with Session(engine) as session:
+                        bulk_record_feedback(session, batch)
+                except Exception:
+                    logger.exception(f"Feedback flush of {len(batch)} events failed, re-queueing")
+                    with self._lock:
+                        self._pending[:0] = batch
+                    self.failed_flushes += 1
+                    return flushed
+                self.flushed += len(batch)
+                self.flushes += 1
+                flushed += len(batch)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        self.load_known_ids()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="feedback-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> int:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        flushed = self.flush()
+        if self.pending:
+            logger.error(f"{self.pending} feedback events could not be flushed on shutdown")
+        return flushed
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "known_documents": len(self._known_ids),
+        }
+
+_buffer: Optional[FeedbackBuffer] = None
+
+def buffering_enabled() -> bool:
+    return os.getenv("FEEDBACK_BUFFERED", "0") == "1"
+
+def get_feedback_buffer() -> FeedbackBuffer:
+    global _buffer
+    if _buffer is None:
+        _buffer = FeedbackBuffer(
+            flush_size=int(os.getenv("FEEDBACK_FLUSH_SIZE", "500")),
+            flush_interval_ms=float(os.getenv("FEEDBACK_FLUSH_INTERVAL_MS", "1000")),
+            max_pending=int(os.getenv("FEEDBACK_MAX_PENDING", "100000")),
+        )
+    return _buffer
@@ -0,0 +1,353 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Union
+
+from sqlmodel import text
+
+from src.database import EMBEDDING_DIM, engine
+
+logger = logging.getLogger(__name__)
+
+ANN_KINDS: Dict[str, Dict[str, int]] = {
+    "hnsw": {"m": 16, "ef_construction": 64},
+    "ivfflat": {"lists": 100},
+}
+
+QUANTIZATIONS: Dict[str, Dict[str, str]] = {
+    "none": {"expression": "{column}", "query": "{q}", "opclass": "vector_cosine_ops", "operator": "<=>"},
+    "halfvec": {
+        "expression": "({column}::halfvec({dim}))",
+        "query": "CAST({q} AS halfvec({dim}))",
+        "opclass": "halfvec_cosine_ops",
+        "operator": "<=>",
+    },
+    "binary": {
+        "expression": "(binary_quantize({column})::bit({dim}))",
+        "query": "binary_quantize({q})::bit({dim})",
+        "opclass": "bit_hamming_ops",
+        "operator": "<~>",
+    },
+}
+
+BUILD_LOCK = "ann_index_build"
+
+PARTIAL_PREDICATE = re.compile(r"WHERE \(\(category\)::text = '((?:[^']|'')*)'::text\)$")
+
+_partial_categories: Dict[str, Any] = {"expires_at": 0.0, "categories": set()}
+_vector_version: Optional[tuple] = None
+_partial_refresher: Optional[threading.Thread] = None
+_partial_refresh = threading.Event()
+
+_build_lock = threading.Lock()
+_build_state: Dict[str, Any] = {
+    "running": False,
+    "kind": None,
+    "quantization": None,
+    "params": None,
+    "started_at": None,
+    "finished_at": None,
+    "error": None,
+}
+
+def index_name(kind: str, suffix: str = "", quantization: str = "none") -> str:
+    if quantization == "none":
+        return f"documents_embedding_{kind}{suffix}_idx"
+    return f"documents_embedding_{quantization}_{kind}{suffix}_idx"
+
+def category_index_name(category: str, kind: str = "hnsw") -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", category.lower()).strip("_")[:20]
+    digest = hashlib.md5(category.encode("utf-8")).hexdigest()[:10]
+    return f"documents_cat_{slug}_{digest}_{kind}_idx"
+
+def sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def default_quantization() -> str:
+    return os.getenv("SEARCH_QUANTIZATION", "none")
+
+def resolve_quantization(quantization: str) -> Dict[str, str]:
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {sorted(QUANTIZATIONS)}")
+    return QUANTIZATIONS[quantization]
+
+def quantized_distance_sql(quantization: str, column: str, q: str, dim: int = EMBEDDING_DIM) -> str:
+    spec = resolve_quantization(quantization)
+    return f"{spec['expression'].format(column=column, dim=dim)} {spec['operator']} {spec['query'].format(q=q, dim=dim)}"
+
+def resolve_params(kind: str, params: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    if kind not in ANN_KINDS:
+        raise ValueError(f"Unknown index kind '{kind}', expected one of {sorted(ANN_KINDS)}")
+    resolved = dict(ANN_KINDS[kind])
+    for key, value in (params or {}).items():
+        if value is None:
+            continue
+        if key not in resolved:
+            raise ValueError(f"Unknown {kind} parameter '{key}'")
+        resolved[key] = int(value)
+    return resolved
+
+def build_index_sql(
+    kind: str,
+    params: Dict[str, int],
+    name: str,
+    concurrently: bool = True,
+    expression: str = "embedding",
+    opclass: Optional[str] = None,
+    where: Optional[str] = None,
+    quantization: str = "none",
+    dim: int = EMBEDDING_DIM,
+) -> str:
+    spec = resolve_quantization(quantization)
+    expression = spec["expression"].format(column=expression, dim=dim)
+    opclass = opclass or spec["opclass"]
+    with_clause = ", ".join(f"{k} = {int(v)}" for k, v in params.items())
+    sql = (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON documents USING {kind} ({expression} {opclass}) WITH ({with_clause})"
+    )
+    if where:
+        sql += f" WHERE {where}"
+    return sql
+
+def _autocommit():
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+def index_status() -> Dict[str, Any]:
+    with _autocommit() as conn:
+        indexes = conn.execute(text("""
+            SELECT i.relname AS name, am.amname AS kind, ix.indisvalid AS valid,
+                   pg_relation_size(i.oid) AS size_bytes, pg_get_indexdef(i.oid) AS definition
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_class t ON t.oid = ix.indrelid
+            JOIN pg_am am ON am.oid = i.relam
+            WHERE t.relname = 'documents' AND am.amname IN ('hnsw', 'ivfflat')
+            ORDER BY i.relname
+        """)).mappings().all()
+        progress = conn.execute(text("""
+            SELECT c.relname AS name, p.phase, p.blocks_done, p.blocks_total,
+                   p.tuples_done, p.tuples_total
+            FROM pg_stat_progress_create_index p
+            LEFT JOIN pg_class c ON c.oid = p.index_relid
+            WHERE p.relid = 'documents'::regclass
+        """)).mappings().all()
+    return {
+        "indexes": [dict(row) for row in indexes],
+        "in_progress": [dict(row) for row in progress],
+        "build": dict(_build_state),
+    }
+
+def list_ann_indexes() -> List[Dict[str, Any]]:
+    return index_status()["indexes"]
+
+def drop_index(name: str, concurrently: bool = True) -> None:
+    with _autocommit() as conn:
+        conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"))
+
+def create_index(
+    kind: str = "hnsw",
+    params: Optional[Dict[str, int]] = None,
+    concurrently: bool = True,
+    rebuild: bool = False,
+    maintenance_work_mem: Optional[str] = None,
+    quantization: str = "none",
+) -> str:
+    resolved = resolve_params(kind, params)
+    resolve_quantization(quantization)
+    name = index_name(kind, quantization=quantization)
+    existing = {row["name"]: row for row in list_ann_indexes()}
+
+    if name in existing and not existing[name]["valid"]:
+        logger.warning(f"Dropping invalid index {name} left by a failed build")
+        drop_index(name, concurrently)
+        existing.pop(name)
+
+    target = index_name(kind, "_new", quantization) if name in existing and rebuild else name
+    if target == name and name in existing:
+        return name
+
+    if target != name:
+        drop_index(target, concurrently)
+
+    logger.info(f"Building {kind} index {target} ({quantization}) with {resolved}...")
+    with _autocommit() as conn:
+        if maintenance_work_mem:
+            conn.execute(text("SELECT set_config('maintenance_work_mem', :v, false)"), {"v": maintenance_work_mem})
+        try:
+            conn.execute(text(build_index_sql(kind, resolved, target, concurrently, quantization=quantization)))
+        finally:
+            if maintenance_work_mem:
+                conn.execute(text("RESET maintenance_work_mem"))
+
+    if target != name:
+        drop_index(name, concurrently)
+        with _autocommit() as conn:
+            conn.execute(text(f"ALTER INDEX {target} RENAME TO {name}"))
+
+    if rebuild:
+        for other in ANN_KINDS:
+            if other != kind and index_name(other, quantization=quantization) in existing:
+                drop_index(index_name(other, quantization=quantization), concurrently)
+
+    logger.info(f"Index {name} is ready.")
+    return name
+
+def ensure_default_index(background: bool = False) -> None:
+    kind = os.getenv("ANN_INDEX", "hnsw")
+    if kind == "none":
+        return
+    names = {row["name"] for row in list_ann_indexes()}
+    missing = [
+        quantization for quantization in dict.fromkeys(["none", default_quantization()])
+        if not any(index_name(other, quantization=quantization) in names for other in ANN_KINDS)
+    ]
+    if background:
+        if missing:
+            start_background_build(kind, quantization=missing)
+        return
+    for quantization in missing:
+        create_index(kind, quantization=quantization)
+
+def category_counts() -> Dict[str, int]:
+    with _autocommit() as conn:
+        rows = conn.execute(text(
+            "SELECT category, count(*) FROM documents WHERE category IS NOT NULL GROUP BY category"
+        )).all()
+    return {category: count for category, count in rows}
+
+def create_category_indexes(
+    kind: str = "hnsw",
+    params: Optional[Dict[str, int]] = None,
+    max_fraction: float = 0.2,
+    min_rows: int = 1000,
+    concurrently: bool = True,
+) -> List[str]:
+    resolved = resolve_params(kind, params)
+    counts = category_counts()
+    total = sum(counts.values()) or 1
+    names = []
+    for category, count in sorted(counts.items()):
+        if count < min_rows or count / total > max_fraction:
+            continue
+        name = category_index_name(category, kind)
+        logger.info(f"Building partial {kind} index {name} for category {category!r} ({count} rows)...")
+        with _autocommit() as conn:
+            conn.execute(text(build_index_sql(kind, resolved, name, concurrently, where=f"category = {sql_literal(category)}")))
+        names.append(name)
+    reset_partial_categories()
+    return names
+
+def drop_category_indexes(concurrently: bool = True) -> List[str]:
+    names = [row["name"] for row in list_ann_indexes() if row["name"].startswith("documents_cat_")]
+    for name in names:
+        drop_index(name, concurrently)
+    reset_partial_categories()
+    return names
+
+def list_category_indexes() -> List[Dict[str, Any]]:
+    indexes = []
+    for row in list_ann_indexes():
+        match = PARTIAL_PREDICATE.search(row["definition"])
+        if row["valid"] and match and row["name"].startswith("documents_cat_"):
+            indexes.append({"name": row["name"], "kind": row["kind"], "category": match.group(1).replace("''", "'")})
+    return indexes
+
+def reset_partial_categories() -> None:
+    _partial_categories["expires_at"] = 0.0
+    _partial_refresh.set()
+
+def refresh_partial_categories(ttl: float = 60.0) -> Set[str]:
+    categories = {index["category"] for index in list_category_indexes()}
+    _partial_categories.update(expires_at=time.monotonic() + ttl, categories=categories)
+    return categories
+
+def partial_index_categories(ttl: float = 60.0) -> Set[str]:
+    if _partial_refresher is None and _partial_categories["expires_at"] < time.monotonic():
+        refresh_partial_categories(ttl)
+    return _partial_categories["categories"]
+
+def start_partial_index_refresher(interval: float = 60.0) -> None:
+    global _partial_refresher
+    if _partial_refresher is not None:
+        return
+    vector_version()
+    refresh_partial_categories(interval)
+
+    def run():
+        while True:
+            _partial_refresh.wait(interval)
+            _partial_refresh.clear()
+            try:
+                refresh_partial_categories(interval)
+            except Exception:
+                logger.exception("Failed to refresh partial index categories")
+
+    _partial_refresher = threading.Thread(target=run, name="partial-index-refresher", daemon=True)
+    _partial_refresher.start()
+
+def vector_version() -> tuple:
+    global _vector_version
+    if _vector_version is None:
+        with _autocommit() as conn:
+            version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar() or "0"
+        _vector_version = tuple(int(part) for part in re.findall(r"\d+", version))
+    return _vector_version
+
+def iterative_scan_enabled() -> bool:
+    setting = os.getenv("FILTER_ITERATIVE_SCAN", "auto")
+    if setting == "auto":
+        return vector_version() >= (0, 8, 0)
+    return setting == "1"
+
+@contextmanager
+def build_lock() -> Iterator[bool]:
+    with _autocommit() as conn:
+        locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:name))"), {"name": BUILD_LOCK}).scalar()
+        try:
+            yield locked
+        finally:
+            if locked:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": BUILD_LOCK})
+
+def start_background_build(
+    kind: str,
+    params: Optional[Dict[str, int]] = None,
+    rebuild: bool = False,
+    quantization: Union[str, List[str]] = "none",
+) -> bool:
+    resolved = resolve_params(kind, params)
+    quantizations = [quantization] if isinstance(quantization, str) else list(quantization)
+    for name in quantizations:
+        resolve_quantization(name)
+    with _build_lock:
+        if _build_state["running"]:
+            return False
+        _build_state.update(
+            running=True, kind=kind, quantization=quantizations[0], params=resolved,
+            started_at=datetime.utcnow(), finished_at=None, error=None,
+        )
+
+    def run():
+        try:
+            with build_lock() as locked:
+                if not locked:
+                    logger.info("Another process is building an ANN index, skipping this build")
+                    _build_state["error"] = "Another process is building an ANN index"
+                    return
+                for name in quantizations:
+                    _build_state["quantization"] = name
+                    create_index(kind, resolved, concurrently=True, rebuild=rebuild, quantization=name)
+        except Exception as e:
+            logger.exception("Index build failed")
+            _build_state["error"] = str(e)
+        finally:
+            _build_state.update(running=False, finished_at=datetime.utcnow())
+
+    threading.Thread(target=run, name="ann-index-build", daemon=True).start()
+    return True
@@ -1,24 +1,105 @@
 import time
 import os
 import logging
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Literal
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field, field_validator
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.database import init_db, get_session, Document, Interaction
-from src.ml import get_model
-from src.search import search_documents
+from src.database import (
+    init_db,
+    get_session,
+    get_async_session,
+    pool_status,
+    engine,
+    async_engine,
+    DEFAULT_NAMESPACE,
+    Document,
+    Interaction,
+)
+from src.ml import (
+    get_model,
+    get_model_name,
+    get_backend,
+    get_query_cache,
+    get_encoder,
+    batching_enabled,
+    normalize_query,
+    stop_encoder,
+)
+from src.search import (
+    SearchFilters,
+    explain_candidates,
+    explain_candidates_async,
+    ranked_documents,
+    ranked_documents_async,
+    resolve_depth,
+    search_documents,
+    search_documents_async,
+    search_documents_batch,
+    search_keyset_page,
+    search_keyset_page_async,
+)
+from src.pagination import (
+    decode_cursor,
+    get_cursor_store,
+    keyset_cursor,
+    pagination_depth,
+    request_fingerprint,
+    session_page,
+    start_session,
+)
+from src.ranking import UnknownStrategyError, available_strategies
+from src.index import ensure_default_index, index_status, start_background_build, start_partial_index_refresher
+from src.embeddings import list_versions, refresh_active_model, start_version_watcher, version_poll_interval
+from src.feedback import (
+    record_feedback,
+    record_feedback_async,
+    ensure_feedback_aggregate,
+    buffering_enabled,
+    get_feedback_buffer,
+    BufferFullError,
+)
+from src.partitions import maintain_interactions, maintenance_interval, partition_status, start_partition_maintainer
+from src.snapshot import ensure_snapshot, get_snapshot, refresh_interval, snapshot_enabled, start_snapshot_refresher
+from src.search_cache import document_tags, get_response_cache, response_cache_enabled, start_invalidation_listener
+from src.metrics import TimingMiddleware, current_timings, gauge, get_registry, set_label, stage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn")
 
 class SearchRequest(BaseModel):
     query: str
-    limit: int = 10
+    limit: int = Field(default=10, ge=1, le=1000)
     strategy: str = "log"
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    probes: Optional[int] = Field(default=None, ge=1, le=10000)
+    ranking: Optional[Literal["python", "sql"]] = None
+    quantization: Optional[Literal["none", "halfvec", "binary"]] = None
+    namespace: str = Field(default=DEFAULT_NAMESPACE, min_length=1, max_length=128)
+    feedback_scope: Optional[Literal["global", "query", "blend"]] = None
+    decay: Optional[bool] = None
+    depth: Optional[Literal["fixed", "adaptive"]] = None
+    category: Optional[str] = Field(default=None, min_length=1, max_length=256)
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    engine: Optional[Literal["postgres", "snapshot"]] = None
+    paginate: bool = False
+    cursor: Optional[str] = Field(default=None, max_length=16384)
+    include_timings: bool = False
+    explain: bool = False
+
+    @field_validator("created_after", "created_before")
+    @classmethod
+    def naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
 
 class SearchResult(BaseModel):
     id: int
@@ -26,43 +107,390 @@ class SearchResult(BaseModel):
     category: Optional[str] = None
     score: float
     original_score: float
-    feedback_score: int
+    feedback_score: float
 
 class SearchResponse(BaseModel):
     results: List[SearchResult]
     execution_time_ms: float
+    candidate_depth: Optional[int] = None
+    timings: Optional[Dict[str, float]] = None
+    plan: Optional[Dict[str, Any]] = None
+    next_cursor: Optional[str] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(min_length=1, max_length=1000)
+    limit: int = Field(default=10, ge=1, le=1000)
+    strategy: str = "log"
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    probes: Optional[int] = Field(default=None, ge=1, le=10000)
+    quantization: Optional[Literal["none", "halfvec", "binary"]] = None
+    namespace: str = Field(default=DEFAULT_NAMESPACE, min_length=1, max_length=128)
+    feedback_scope: Optional[Literal["global", "query", "blend"]] = None
+    decay: Optional[bool] = None
+
+class QueryResults(BaseModel):
+    query: str
+    results: List[SearchResult]
+    execution_time_ms: float
+
+class BatchSearchResponse(BaseModel):
+    results: List[QueryResults]
+    timings: Dict[str, float]
+    execution_time_ms: float
 
 class FeedbackRequest(BaseModel):
     document_id: int
     query: str
     score_delta: int = 1
+    namespace: str = Field(default=DEFAULT_NAMESPACE, min_length=1, max_length=128)
+
+class IndexBuildRequest(BaseModel):
+    kind: Literal["hnsw", "ivfflat"] = "hnsw"
+    quantization: Literal["none", "halfvec", "binary"] = "none"
+    m: Optional[int] = Field(default=None, ge=2, le=100)
+    ef_construction: Optional[int] = Field(default=None, ge=4, le=1000)
+    lists: Optional[int] = Field(default=None, ge=1, le=32768)
+    rebuild: bool = False
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting app...")
     init_db()
+    maintain_interactions()
+    start_partition_maintainer(maintenance_interval())
+    ensure_default_index(background=True)
+    start_partial_index_refresher()
+    with Session(engine) as session:
+        ensure_feedback_aggregate(session)
+    refresh_active_model()
+    start_version_watcher(version_poll_interval())
     get_model()
+    if batching_enabled():
+        get_encoder().start()
+    if buffering_enabled():
+        get_feedback_buffer().start()
+    if response_cache_enabled():
+        start_invalidation_listener()
+    if snapshot_enabled():
+        ensure_snapshot(get_model_name())
+        start_snapshot_refresher(get_model_name, refresh_interval())
     yield
     logger.info("Stopping app...")
+    if buffering_enabled():
+        flushed = get_feedback_buffer().stop()
+        logger.info(f"Flushed {flushed} buffered feedback events.")
+    stop_encoder()
+    await async_engine.dispose()
 
 app = FastAPI(title="Adaptive Search Engine", lifespan=lifespan)
+app.add_middleware(TimingMiddleware)
+
+def search_response(
+    results: list,
+    elapsed: float,
+    include_timings: bool,
+    candidates: Optional[List[int]] = None,
+    plan: Optional[Dict[str, Any]] = None,
+    next_cursor: Optional[str] = None,
+) -> dict:
+    response = {"results": results, "execution_time_ms": round(elapsed, 2), "next_cursor": next_cursor}
+    if candidates is not None:
+        response["candidate_depth"] = len(candidates)
+    if plan is not None:
+        response["plan"] = plan
+    timings = current_timings()
+    if include_timings and timings is not None:
+        response["timings"] = {name: round(ms, 3) for name, ms in timings.stages.items()}
+    return response
+
+def search_cache_key(req: SearchRequest) -> tuple:
+    return (
+        get_model_name(),
+        normalize_query(req.query),
+        *req.model_dump(exclude={"query", "include_timings", "explain", "paginate", "cursor"}).values(),
+    )
+
+def pagination_fingerprint(req: SearchRequest) -> str:
+    excluded = {"query", "limit", "paginate", "cursor", "include_timings", "explain"}
+    return request_fingerprint(normalize_query(req.query), *req.model_dump(exclude=excluded).values())
+
+def first_page_depth(req: SearchRequest) -> Optional[int]:
+    return max(pagination_depth(), req.limit) if req.paginate else None
+
+def search_next_page(req: SearchRequest, session: Session):
+    payload = decode_cursor(req.cursor, pagination_fingerprint(req))
+    served = session_page(payload, req.limit)
+    if served is not None:
+        page, next_cursor = served
+        with stage("content"):
+            return ranked_documents(session, page), next_cursor
+    set_label("page_source", "keyset")
+    seen = [doc_id for doc_id, _ in payload["seen"]]
+    results, rows, exhausted = search_keyset_page(
+        session, req.query, req.limit, payload["distance"], seen, payload["offset"], req.strategy,
+        req.ef_search, req.probes, req.namespace, req.feedback_scope, req.decay, search_filters(req),
+    )
+    return results, keyset_cursor(payload, rows, exhausted)
+
+async def search_next_page_async(req: SearchRequest, session: AsyncSession):
+    payload = decode_cursor(req.cursor, pagination_fingerprint(req))
+    served = session_page(payload, req.limit)
+    if served is not None:
+        page, next_cursor = served
+        with stage("content"):
+            return await ranked_documents_async(session, page), next_cursor
+    set_label("page_source", "keyset")
+    seen = [doc_id for doc_id, _ in payload["seen"]]
+    results, rows, exhausted = await search_keyset_page_async(
+        session, req.query, req.limit, payload["distance"], seen, payload["offset"], req.strategy,
+        req.ef_search, req.probes, req.namespace, req.feedback_scope, req.decay, search_filters(req),
+    )
+    return results, keyset_cursor(payload, rows, exhausted)
+
+def search_filters(req: SearchRequest) -> SearchFilters:
+    return SearchFilters(req.category, req.created_after, req.created_before)
+
+def cache_lookup(req: SearchRequest):
+    if req.explain or req.paginate or req.cursor or not response_cache_enabled():
+        return None, None, 0
+    cache = get_response_cache()
+    key = search_cache_key(req)
+    with stage("cache"):
+        return key, cache.get(key), cache.sequence
+
+def label_strategy(name: str) -> None:
+    set_label("strategy", name if name in available_strategies() else "invalid")
+
+def observe_depth(req: SearchRequest, candidates: List[int]) -> None:
+    get_registry("depth").observe(len(candidates), depth=req.depth or "default", strategy=req.strategy)
+
+def cache_store(req: SearchRequest, key, results: list, candidates: List[int], since: int) -> None:
+    if key is not None:
+        adaptive = not req.paginate and resolve_depth(req.depth, req.quantization) == "adaptive"
+        get_response_cache().set_tagged(key, results, document_tags(req.namespace, candidates, adaptive), since)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/api/v1/stats")
+def stats_api():
+    stats = {
+        "model": {"name": get_model_name(), "backend": get_backend()},
+        "embedding_cache": get_query_cache().stats(),
+        "db_pool": pool_status(),
+    }
+    if batching_enabled():
+        stats["encoder"] = get_encoder().stats()
+    if buffering_enabled():
+        stats["feedback_buffer"] = get_feedback_buffer().stats()
+    if response_cache_enabled():
+        stats["response_cache"] = get_response_cache().stats()
+    if snapshot_enabled():
+        stats["vector_snapshot"] = get_snapshot(get_model_name()).stats()
+    stats["pagination"] = get_cursor_store().stats()
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_api():
+    lines = get_registry().render("search_stage_duration_ms")
+    lines.extend(get_registry("depth").render("search_candidate_depth"))
+    lines.append("# TYPE db_pool_connections gauge")
+    for pool, values in pool_status().items():
+        for state, value in values.items():
+            lines.append(gauge("db_pool_connections", value, pool=pool, state=state))
+    lines.append("# TYPE embedding_cache gauge")
+    for key, value in get_query_cache().stats().items():
+        if isinstance(value, (int, float)):
+            lines.append(gauge("embedding_cache", value, stat=key))
+    if batching_enabled():
+        lines.append("# TYPE encoder gauge")
+        for key, value in get_encoder().stats().items():
+            if isinstance(value, (int, float)):
+                lines.append(gauge("encoder", value, stat=key))
+    if buffering_enabled():
+        lines.append("# TYPE feedback_buffer gauge")
+        for key, value in get_feedback_buffer().stats().items():
+            lines.append(gauge("feedback_buffer", value, stat=key))
+    if response_cache_enabled():
+        lines.append("# TYPE response_cache gauge")
+        for key, value in get_response_cache().stats().items():
+            lines.append(gauge("response_cache", value, stat=key))
+    if snapshot_enabled():
+        lines.append("# TYPE vector_snapshot gauge")
+        for key, value in get_snapshot(get_model_name()).stats().items():
+            if isinstance(value, (int, float)):
+                lines.append(gauge("vector_snapshot", value, stat=key))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 @app.post("/api/v1/search", response_model=SearchResponse)
 def search_api(req: SearchRequest, session: Session = Depends(get_session)):
-    start = time.time()
-    results = search_documents(session, req.query, req.limit, req.strategy)
-    elapsed = (time.time() - start) * 1000
-    return {"results": results, "execution_time_ms": round(elapsed, 2)}
+    start = time.perf_counter()
+    label_strategy(req.strategy)
+    if req.cursor:
+        try:
+            results, next_cursor = search_next_page(req, session)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return search_response(results, (time.perf_counter() - start) * 1000, req.include_timings, next_cursor=next_cursor)
+    key, cached, since = cache_lookup(req)
+    if cached is not None:
+        return search_response(cached, (time.perf_counter() - start) * 1000, req.include_timings)
+    candidates: List[int] = []
+    page_depth = first_page_depth(req)
+    try:
+        results = search_documents(
+            session, req.query, page_depth or req.limit, req.strategy, req.ef_search, req.probes, req.ranking, req.quantization,
+            req.namespace, req.feedback_scope, req.decay, candidates, "fixed" if page_depth else req.depth, search_filters(req),
+            req.engine, page_depth,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    next_cursor = None
+    if page_depth:
+        next_cursor = start_session(pagination_fingerprint(req), results, req.limit, page_depth)
+        results = results[: req.limit]
+    cache_store(req, key, results, candidates, since)
+    observe_depth(req, candidates)
+    elapsed = (time.perf_counter() - start) * 1000
+    plan = None
+    if req.explain:
+        plan = explain_candidates(
+            session, req.query, req.limit, req.quantization, search_filters(req), req.ef_search, req.probes
+        )
+    return search_response(results, elapsed, req.include_timings, candidates, plan, next_cursor)
+
+@app.post("/api/v1/search/batch", response_model=BatchSearchResponse)
+def search_batch_api(req: BatchSearchRequest, session: Session = Depends(get_session)):
+    start = time.perf_counter()
+    label_strategy(req.strategy)
+    try:
+        batch = search_documents_batch(
+            session, req.queries, req.limit, req.strategy, req.ef_search, req.probes, req.quantization, req.namespace,
+            req.feedback_scope, req.decay,
+        )
+    except UnknownStrategyError as e:
+        raise HTTPException(400, str(e))
+    elapsed = (time.perf_counter() - start) * 1000
+    return {**batch, "execution_time_ms": round(elapsed, 2)}
 
 @app.post("/api/v1/feedback")
 def feedback_api(req: FeedbackRequest, session: Session = Depends(get_session)):
-    if not session.get(Document, req.document_id):
+    if buffering_enabled():
+        buffer = get_feedback_buffer()
+        with stage("validate"):
+            known = buffer.is_known(session, req.document_id)
+        if not known:
+            raise HTTPException(404, "Document not found")
+        inter = Interaction(
+            document_id=req.document_id, namespace=req.namespace, query_text=req.query, score_delta=req.score_delta
+        )
+        try:
+            with stage("write"):
+                pending = buffer.add(inter)
+        except BufferFullError as e:
+            raise HTTPException(503, str(e))
+        return {"status": "ok", "new_score_delta": req.score_delta, "pending": pending}
+
+    with stage("validate"):
+        document = session.get(Document, req.document_id)
+    if not document:
         raise HTTPException(404, "Document not found")
-    inter = Interaction(document_id=req.document_id, query_text=req.query, score_delta=req.score_delta)
-    session.add(inter)
-    session.commit()
+    inter = Interaction(
+        document_id=req.document_id, namespace=req.namespace, query_text=req.query, score_delta=req.score_delta
+    )
+    with stage("write"):
+        record_feedback(session, [inter])
     return {"status": "ok", "new_score_delta": req.score_delta}
+
+@app.post("/api/v1/async/search", response_model=SearchResponse)
+async def search_async_api(req: SearchRequest, session: AsyncSession = Depends(get_async_session)):
+    start = time.perf_counter()
+    label_strategy(req.strategy)
+    if req.cursor:
+        try:
+            results, next_cursor = await search_next_page_async(req, session)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return search_response(results, (time.perf_counter() - start) * 1000, req.include_timings, next_cursor=next_cursor)
+    key, cached, since = cache_lookup(req)
+    if cached is not None:
+        return search_response(cached, (time.perf_counter() - start) * 1000, req.include_timings)
+    candidates: List[int] = []
+    page_depth = first_page_depth(req)
+    try:
+        results = await search_documents_async(
+            session, req.query, page_depth or req.limit, req.strategy, req.ef_search, req.probes, req.ranking, req.quantization,
+            req.namespace, req.feedback_scope, req.decay, candidates, "fixed" if page_depth else req.depth, search_filters(req),
+            req.engine, page_depth,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    next_cursor = None
+    if page_depth:
+        next_cursor = start_session(pagination_fingerprint(req), results, req.limit, page_depth)
+        results = results[: req.limit]
+    cache_store(req, key, results, candidates, since)
+    observe_depth(req, candidates)
+    elapsed = (time.perf_counter() - start) * 1000
+    plan = None
+    if req.explain:
+        plan = await explain_candidates_async(
+            session, req.query, req.limit, req.quantization, search_filters(req), req.ef_search, req.probes
+        )
+    return search_response(results, elapsed, req.include_timings, candidates, plan, next_cursor)
+
+@app.post("/api/v1/async/feedback")
+async def feedback_async_api(req: FeedbackRequest, session: AsyncSession = Depends(get_async_session)):
+    inter = Interaction(
+        document_id=req.document_id, namespace=req.namespace, query_text=req.query, score_delta=req.score_delta
+    )
+    if buffering_enabled():
+        buffer = get_feedback_buffer()
+        if not buffer.knows(req.document_id):
+            with stage("validate"):
+                document = await session.get(Document, req.document_id)
+            if not document:
+                raise HTTPException(404, "Document not found")
+            buffer.remember(req.document_id)
+        try:
+            with stage("write"):
+                pending = buffer.add(inter)
+        except BufferFullError as e:
+            raise HTTPException(503, str(e))
+        return {"status": "ok", "new_score_delta": req.score_delta, "pending": pending}
+
+    with stage("validate"):
+        document = await session.get(Document, req.document_id)
+    if not document:
+        raise HTTPException(404, "Document not found")
+    with stage("write"):
+        await record_feedback_async(session, [inter])
+    return {"status": "ok", "new_score_delta": req.score_delta}
+
+@app.get("/api/v1/admin/index")
+def index_status_api():
+    return index_status()
+
+@app.get("/api/v1/admin/interactions")
+def interactions_status_api(session: Session = Depends(get_session)):
+    return {"partitions": partition_status(session)}
+
+@app.post("/api/v1/admin/interactions/maintain")
+def interactions_maintain_api():
+    return maintain_interactions()
+
+@app.get("/api/v1/admin/embeddings")
+def embeddings_status_api(session: Session = Depends(get_session)):
+    return {"active_model": get_model_name(), "versions": list_versions(session)}
+
+@app.post("/api/v1/admin/index", status_code=202)
+def index_build_api(req: IndexBuildRequest):
+    params = req.model_dump(exclude={"kind", "quantization", "rebuild"}, exclude_none=True)
+    try:
+        started = start_background_build(req.kind, params, req.rebuild, req.quantization)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if not started:
+        raise HTTPException(409, "An index build is already running")
+    return {"status": "started", "kind": req.kind, "quantization": req.quantization}
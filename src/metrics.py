@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BUCKETS_DEPTH = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class RequestTimings:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.labels: Dict[str, str] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - start) * 1000)
+
+@contextmanager
+def collect_timings() -> Iterator[RequestTimings]:
+    timings = _current.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+def set_label(key: str, value: str) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.labels[key] = value
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels) -> str:
+    return ",".join(f'{k}="{escape_label(v)}"' for k, v in labels)
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS_MS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[Tuple[str, str], ...], Histogram] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def observe_request(self, endpoint: str, timings: RequestTimings, total_ms: float) -> None:
+        labels = {"strategy": "", **timings.labels}
+        self.observe(total_ms, endpoint=endpoint, stage="total", **labels)
+        for name, ms in timings.stages.items():
+            self.observe(ms, endpoint=endpoint, stage=name, **labels)
+
+    def render(self, name: str) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        with self._lock:
+            items = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in sorted(self._histograms.items())]
+        for key, counts, total, count, buckets in items:
+            labels = format_labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {total}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+_registry = MetricsRegistry()
+_registries = {"stage": _registry, "depth": MetricsRegistry(BUCKETS_DEPTH)}
+
+def get_registry(name: str = "stage") -> MetricsRegistry:
+    return _registries[name]
+
+def metrics_enabled() -> bool:
+    return os.getenv("METRICS_ENABLED", "1") == "1"
+
+def server_timing_header(timings: RequestTimings, total_ms: float) -> str:
+    entries = [f"{name};dur={ms:.2f}" for name, ms in timings.stages.items()]
+    entries.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(entries)
+
+class TimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        recorded = False
+
+        def record() -> float:
+            nonlocal recorded
+            total_ms = (time.perf_counter() - start) * 1000
+            route = scope.get("route")
+            if route is not None and not recorded:
+                recorded = True
+                _registry.observe_request(route.path, timings, total_ms)
+            return total_ms
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total_ms = record()
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings, total_ms).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+
+def gauge(name: str, value: float, **labels: str) -> str:
+    if labels:
+        return f"{name}{{{format_labels(labels.items())}}} {value}"
+    return f"{name} {value}"
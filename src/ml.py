@@ -1,11 +1,177 @@
+import asyncio
+import logging
 import os
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
-_model = None
+from src.cache import LRUCache, SqliteVectorStore
+from src.encoder import BatchEncoder
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_models: Dict[str, SentenceTransformer] = {}
+_active_model_name: Optional[str] = None
+_query_cache: Optional[LRUCache] = None
+_disk_store: Optional[SqliteVectorStore] = None
+_encoder: Optional[BatchEncoder] = None
+
+def get_configured_model_name() -> str:
+    return os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+def get_model_name() -> str:
+    return _active_model_name or get_configured_model_name()
+
+def set_active_model_name(name: str) -> None:
+    global _active_model_name
+    _active_model_name = name
+    for loaded in list(_models):
+        if loaded != name:
+            _models.pop(loaded, None)
+
+def get_backend() -> str:
+    backend = os.getenv("EMBEDDING_BACKEND", "torch")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected one of {list(BACKENDS)}")
+    return backend
+
+def onnx_export_dir(name: str) -> str:
+    return os.path.join(os.getenv("ONNX_EXPORT_DIR", "data/.cache/onnx"), name.replace("/", "__"))
+
+def onnx_int8_file() -> str:
+    return f"onnx/model_qint8_{os.getenv('ONNX_QUANTIZATION_CONFIG', 'avx2')}.onnx"
+
+def export_onnx(name: str, quantize: bool = False) -> str:
+    target = onnx_export_dir(name)
+    if not any(os.path.exists(os.path.join(target, path)) for path in ("onnx/model.onnx", "model.onnx")):
+        logger.info(f"Exporting {name} to ONNX in {target}...")
+        tmp = f"{target}.tmp-{os.getpid()}"
+        SentenceTransformer(name, backend="onnx").save_pretrained(tmp)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+    if quantize and not os.path.exists(os.path.join(target, onnx_int8_file())):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        config = os.getenv("ONNX_QUANTIZATION_CONFIG", "avx2")
+        logger.info(f"Quantizing {name} ONNX export to int8 ({config})...")
+        export_dynamic_quantized_onnx_model(SentenceTransformer(target, backend="onnx"), config, target)
+    return target
+
+def load_model(name: str, backend: Optional[str] = None) -> SentenceTransformer:
+    backend = backend or get_backend()
+    if backend == "torch":
+        return SentenceTransformer(name)
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    threads = int(os.getenv("ONNX_THREADS", "0"))
+    if threads:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        model_kwargs["session_options"] = options
+    if backend == "onnx-int8":
+        model_kwargs["file_name"] = onnx_int8_file()
+    return SentenceTransformer(export_onnx(name, backend == "onnx-int8"), backend="onnx", model_kwargs=model_kwargs)
+
+def get_model(name: Optional[str] = None) -> SentenceTransformer:
+    name = name or get_model_name()
+    model = _models.get(name)
+    if model is None:
+        model = _models[name] = load_model(name)
+    return model
+
+def batching_enabled() -> bool:
+    return os.getenv("ENCODER_BATCHING", "1") == "1"
+
+def get_encoder() -> BatchEncoder:
+    global _encoder
+    if _encoder is None:
+        _encoder = BatchEncoder(
+            lambda texts: get_model().encode(texts, batch_size=len(texts)),
+            max_batch_size=int(os.getenv("ENCODER_MAX_BATCH", "32")),
+            max_wait_ms=float(os.getenv("ENCODER_MAX_WAIT_MS", "2")),
+        )
+    return _encoder
+
+def stop_encoder() -> None:
+    if _encoder is not None:
+        _encoder.stop()
+
+def encode_texts(texts: list[str]) -> list[np.ndarray]:
+    if batching_enabled():
+        return get_encoder().encode_many(texts)
+    return list(np.asarray(get_model().encode(texts), dtype=np.float32))
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def get_query_cache() -> LRUCache:
+    global _query_cache, _disk_store
+    if _query_cache is None:
+        ttl = float(os.getenv("EMBEDDING_CACHE_TTL", "0")) or None
+        _query_cache = LRUCache(int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")), ttl)
+        path = os.getenv("EMBEDDING_CACHE_PATH")
+        if path:
+            _disk_store = SqliteVectorStore(path)
+    return _query_cache
+
+def _cache_key(normalized: str) -> str:
+    return f"{get_model_name()}\x00{get_backend()}\x00{normalized}"
+
+def _cached(key: str) -> Optional[np.ndarray]:
+    cache = get_query_cache()
+    vector = cache.get(key)
+    if vector is None and _disk_store is not None:
+        vector = _disk_store.get(key)
+        if vector is not None:
+            cache.set(key, vector)
+    return vector
+
+def _remember(key: str, vector: np.ndarray) -> np.ndarray:
+    if _disk_store is not None:
+        _disk_store.set(key, vector)
+    vector.setflags(write=False)
+    get_query_cache().set(key, vector)
+    return vector
+
+def encode_query(query: str) -> np.ndarray:
+    normalized = normalize_query(query)
+    key = _cache_key(normalized)
+    vector = _cached(key)
+    if vector is None:
+        vector = _remember(key, encode_texts([normalized])[0])
+    return vector
+
+def encode_queries(queries: List[str]) -> List[np.ndarray]:
+    keys = [_cache_key(normalize_query(q)) for q in queries]
+    vectors = [_cached(key) for key in keys]
+
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], []).append(i)
+    if missing:
+        texts = [normalize_query(queries[positions[0]]) for positions in missing.values()]
+        encoded = np.asarray(get_model().encode(texts, batch_size=min(len(texts), 256)), dtype=np.float32)
+        for (key, positions), vector in zip(missing.items(), encoded):
+            vector = _remember(key, vector)
+            for i in positions:
+                vectors[i] = vector
+    return vectors
 
-def get_model() -> SentenceTransformer:
-    global _model
-    if _model is None:
-        model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-        _model = SentenceTransformer(model_name)
-    return _model
+async def encode_query_async(query: str) -> np.ndarray:
+    normalized = normalize_query(query)
+    key = _cache_key(normalized)
+    vector = _cached(key)
+    if vector is None:
+        if batching_enabled():
+            encoded = await asyncio.wrap_future(get_encoder().submit(normalized))
+        else:
+            encoded = (await asyncio.to_thread(encode_texts, [normalized]))[0]
+        vector = _remember(key, encoded)
+    return vector
@@ -0,0 +1,92 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import secrets
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.cache import LRUCache
+
+CURSOR_VERSION = 2
+
+_store: Optional[LRUCache] = None
+
+def pagination_depth() -> int:
+    return int(os.getenv("PAGINATION_DEPTH", "200"))
+
+def get_cursor_store() -> LRUCache:
+    global _store
+    if _store is None:
+        ttl = float(os.getenv("PAGINATION_TTL", "600")) or None
+        _store = LRUCache(int(os.getenv("PAGINATION_SESSIONS", "1024")), ttl)
+    return _store
+
+def request_fingerprint(*parts: Any) -> str:
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    raw = json.dumps({"v": CURSOR_VERSION, **payload}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, fingerprint: str) -> Dict[str, Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        payload["distance"], payload["offset"] = float(payload["distance"]), int(payload["offset"])
+        payload["seen"] = [(int(doc_id), float(distance)) for doc_id, distance in payload["seen"]]
+        valid = payload["v"] == CURSOR_VERSION and isinstance(payload["fp"], str)
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        valid = False
+    if not valid:
+        raise ValueError("Invalid cursor")
+    if payload["fp"] != fingerprint:
+        raise ValueError("Cursor does not belong to this query")
+    return payload
+
+def still_ahead(seen: List[Tuple[int, float]], boundary: float) -> List[Tuple[int, float]]:
+    kept = {}
+    for doc_id, distance in seen:
+        if distance >= boundary:
+            kept[doc_id] = distance
+    return list(kept.items())
+
+def continuation(rows: List[Tuple[int, float]], shown: int) -> Tuple[float, List[Tuple[int, float]]]:
+    remaining = rows[shown:]
+    boundary = min(distance for _, distance in remaining) if remaining else max(distance for _, distance in rows)
+    return boundary, still_ahead(rows[:shown], boundary)
+
+def window_cursor(session_id: str, fingerprint: str, entry: Dict[str, Any], offset: int) -> Optional[str]:
+    rows = entry["rows"]
+    if offset >= len(rows) and not entry["more"]:
+        return None
+    boundary, seen = continuation([(doc_id, 1 - similarity) for doc_id, _, similarity, _ in rows], offset)
+    return encode_cursor({"sid": session_id, "fp": fingerprint, "offset": offset, "distance": boundary, "seen": seen})
+
+def start_session(fingerprint: str, results: List[Dict[str, Any]], limit: int, depth: int) -> Optional[str]:
+    if not results:
+        return None
+    entry = {
+        "fp": fingerprint,
+        "rows": [(r["id"], r["score"], r["original_score"], r["feedback_score"]) for r in results],
+        "more": len(results) >= depth,
+    }
+    session_id = secrets.token_urlsafe(12)
+    get_cursor_store().set(session_id, entry)
+    return window_cursor(session_id, fingerprint, entry, min(limit, len(results)))
+
+def session_page(payload: Dict[str, Any], limit: int) -> Optional[Tuple[List[Tuple[int, float, float, float]], Optional[str]]]:
+    entry = get_cursor_store().get(payload["sid"]) if payload.get("sid") else None
+    offset = payload["offset"]
+    if entry is None or entry["fp"] != payload["fp"] or offset >= len(entry["rows"]):
+        return None
+    page = entry["rows"][offset : offset + limit]
+    return page, window_cursor(payload["sid"], payload["fp"], entry, offset + len(page))
+
+def keyset_cursor(payload: Dict[str, Any], rows: List[Tuple[int, float]], exhausted: bool) -> Optional[str]:
+    if exhausted or not rows:
+        return None
+    boundary = max(distance for _, distance in rows)
+    seen = still_ahead(list(payload["seen"]) + list(rows), boundary)
+    return encode_cursor({
+        "sid": None, "fp": payload["fp"], "offset": payload["offset"] + len(rows), "distance": boundary, "seen": seen,
+    })
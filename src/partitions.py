@@ -0,0 +1,189 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlmodel import Session, text
+
+from src.database import engine
+from src.feedback import backfill_query_keys, clear_cached_searches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITION = "interactions_default"
+PARTITION_NAME = re.compile(r"^interactions_p(\d{4})(\d{2})$")
+MAINTENANCE_LOCK = "interactions_maintenance"
+
+ROLLUP_SQL = """
+    {prefix}
+    INSERT INTO interaction_rollups (namespace, query_key, document_id, day, total_score, interactions)
+    SELECT namespace, query_key, document_id, created_at::date, SUM(score_delta), COUNT(*)
+    FROM {source}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (namespace, query_key, document_id, day) DO UPDATE
+    SET total_score = interaction_rollups.total_score + EXCLUDED.total_score,
+        interactions = interaction_rollups.interactions + EXCLUDED.interactions
+"""
+
+EXPIRE_ROLLUPS_SQL = text("""
+    WITH dropped AS (
+        DELETE FROM interaction_rollups WHERE day < :cutoff
+        RETURNING namespace, query_key, document_id, total_score, interactions
+    ), by_query AS (
+        UPDATE query_feedback f
+        SET total_score = f.total_score - d.total_score, interactions = f.interactions - d.interactions
+        FROM (
+            SELECT namespace, query_key, document_id, SUM(total_score) AS total_score, SUM(interactions) AS interactions
+            FROM dropped GROUP BY 1, 2, 3
+        ) d
+        WHERE f.namespace = d.namespace AND f.query_key = d.query_key AND f.document_id = d.document_id
+    ), by_document AS (
+        UPDATE document_feedback f
+        SET total_score = f.total_score - d.total_score, interactions = f.interactions - d.interactions
+        FROM (
+            SELECT namespace, document_id, SUM(total_score) AS total_score, SUM(interactions) AS interactions
+            FROM dropped GROUP BY 1, 2
+        ) d
+        WHERE f.namespace = d.namespace AND f.document_id = d.document_id
+    )
+    SELECT count(*) FROM dropped
+""")
+
+_maintainer: Optional[threading.Thread] = None
+
+def raw_retention_days() -> int:
+    return int(os.getenv("INTERACTIONS_RETENTION_DAYS", "90"))
+
+def rollup_retention_days() -> int:
+    return int(os.getenv("ROLLUP_RETENTION_DAYS", "0"))
+
+def partitions_ahead() -> int:
+    return int(os.getenv("INTERACTIONS_PARTITIONS_AHEAD", "2"))
+
+def maintenance_interval() -> float:
+    return float(os.getenv("INTERACTIONS_MAINTENANCE_S", "3600"))
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"interactions_p{month:%Y%m}"
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+def utc_midnight(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+def list_partitions(session: Session) -> List[str]:
+    return list(session.exec(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'interactions'::regclass
+        ORDER BY c.relname
+    """)).scalars().all())
+
+def create_partition(session: Session, month: date) -> bool:
+    name = partition_name(month)
+    if name in list_partitions(session):
+        return False
+    start, end = utc_midnight(month), utc_midnight(add_months(month, 1))
+    session.exec(text(f"CREATE TABLE {name} (LIKE interactions INCLUDING DEFAULTS)"))
+    session.exec(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), params={"start": start, "end": end})
+    session.exec(text(
+        f"ALTER TABLE interactions ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return True
+
+def ensure_partitions(session: Session, today: date, ahead: int, cutoff: Optional[date] = None) -> List[str]:
+    months = {add_months(month_start(today), i) for i in range(ahead + 1)}
+    parked = session.exec(text(
+        f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {DEFAULT_PARTITION}"
+    )).scalars().all()
+    months.update(month for month in parked if cutoff is None or add_months(month, 1) > cutoff)
+    return [partition_name(month) for month in sorted(months) if create_partition(session, month)]
+
+def compact_partition(session: Session, name: str) -> int:
+    rows = session.exec(text(ROLLUP_SQL.format(prefix="", source=name))).rowcount
+    session.exec(text(f"ALTER TABLE interactions DETACH PARTITION {name}"))
+    session.exec(text(f"DROP TABLE {name}"))
+    return rows
+
+def compact_default_partition(session: Session, cutoff: date) -> int:
+    prefix = f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff RETURNING *)"
+    return session.exec(text(ROLLUP_SQL.format(prefix=prefix, source="moved")), params={"cutoff": utc_midnight(cutoff)}).rowcount
+
+def compact_interactions(session: Session, cutoff: date) -> Dict[str, int]:
+    backfill_query_keys(session)
+    compacted = {}
+    for name in list_partitions(session):
+        month = partition_month(name)
+        if month is not None and add_months(month, 1) <= cutoff:
+            compacted[name] = compact_partition(session, name)
+    rows = compact_default_partition(session, cutoff)
+    if rows:
+        compacted[DEFAULT_PARTITION] = rows
+    return compacted
+
+def expire_rollups(session: Session, cutoff: date) -> int:
+    return session.exec(EXPIRE_ROLLUPS_SQL, params={"cutoff": cutoff}).scalar() or 0
+
+def maintain_interactions(now: Optional[datetime] = None) -> Dict[str, Any]:
+    today = (now or datetime.utcnow()).date()
+    retention, rollup_retention = raw_retention_days(), rollup_retention_days()
+    cutoff = today - timedelta(days=retention) if retention > 0 else None
+    with Session(engine) as session:
+        locked = session.exec(text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), params={"name": MAINTENANCE_LOCK}).scalar()
+        if not locked:
+            return {"skipped": True}
+        session.exec(text("SET LOCAL TimeZone = 'UTC'"))
+        report = {"created": ensure_partitions(session, today, partitions_ahead(), cutoff), "compacted": {}, "expired_rollups": 0}
+        if cutoff is not None:
+            report["compacted"] = compact_interactions(session, cutoff)
+        if rollup_retention > 0:
+            report["expired_rollups"] = expire_rollups(session, today - timedelta(days=rollup_retention))
+        session.commit()
+        if report["expired_rollups"]:
+            clear_cached_searches(session)
+    if report["created"] or report["compacted"] or report["expired_rollups"]:
+        logger.info(f"Interactions maintenance: {report}")
+    return report
+
+def partition_status(session: Session) -> List[Dict[str, Any]]:
+    rows = session.exec(text("""
+        SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bounds,
+               c.reltuples::bigint AS estimated_rows, pg_total_relation_size(c.oid) AS size_bytes
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'interactions'::regclass
+        ORDER BY c.relname
+    """)).mappings().all()
+    return [dict(row) for row in rows]
+
+def start_partition_maintainer(interval: float = 3600.0) -> None:
+    global _maintainer
+    if _maintainer is not None or interval <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                maintain_interactions()
+            except Exception:
+                logger.exception("Interactions maintenance failed")
+
+    _maintainer = threading.Thread(target=run, name="interactions-maintainer", daemon=True)
+    _maintainer.start()
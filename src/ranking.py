@@ -0,0 +1,99 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List
+
+import numpy as np
+
+class UnknownStrategyError(ValueError):
+    pass
+
+class RankingStrategy(ABC):
+    @abstractmethod
+    def score(self, similarity: np.ndarray, feedback: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def sql(self, sim: str, fb: str) -> str:
+        ...
+
+    def upper_bound(self, similarity: np.ndarray, max_feedback: float) -> np.ndarray:
+        return np.maximum(
+            self.score(similarity, np.zeros_like(similarity)),
+            self.score(similarity, np.full_like(similarity, max_feedback)),
+        )
+
+    def params(self) -> Dict[str, float]:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+@dataclass(frozen=True)
+class LogStrategy(RankingStrategy):
+    alpha: float = 0.05
+
+    def score(self, similarity, feedback):
+        return similarity * (1 + self.alpha * np.log1p(feedback))
+
+    def sql(self, sim, fb):
+        return f"{sim} * (1 + {float(self.alpha)!r} * ln(1 + {fb}))"
+
+@dataclass(frozen=True)
+class LinearStrategy(RankingStrategy):
+    beta: float = 0.001
+
+    def score(self, similarity, feedback):
+        return similarity + self.beta * feedback
+
+    def sql(self, sim, fb):
+        return f"{sim} + ({float(self.beta)!r} * {fb})"
+
+@dataclass(frozen=True)
+class SigmoidStrategy(RankingStrategy):
+    k: float = 50
+    gain: float = 0.5
+
+    def score(self, similarity, feedback):
+        return similarity * (1 + self.gain * (feedback / (feedback + self.k)))
+
+    def sql(self, sim, fb):
+        return f"{sim} * (1 + {float(self.gain)!r} * ({fb}::float8 / ({fb} + {float(self.k)!r})))"
+
+_registry: Dict[str, RankingStrategy] = {}
+
+def register_strategy(name: str, strategy: RankingStrategy) -> None:
+    _registry[name] = strategy
+
+def get_strategy(name: str) -> RankingStrategy:
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownStrategyError(
+            f"Unknown strategy '{name}', expected one of {available_strategies()}"
+        ) from None
+
+def available_strategies() -> List[str]:
+    return sorted(_registry)
+
+def configure_strategy(name: str, **params: float) -> RankingStrategy:
+    strategy = replace(get_strategy(name), **{k: float(v) for k, v in params.items()})
+    register_strategy(name, strategy)
+    return strategy
+
+def score_candidates(name: str, similarity, feedback) -> np.ndarray:
+    similarity = np.asarray(similarity, dtype=np.float64)
+    feedback = np.maximum(np.asarray(feedback, dtype=np.float64), 0)
+    return get_strategy(name).score(similarity, feedback)
+
+def score_upper_bound(name: str, similarity, max_feedback: float) -> np.ndarray:
+    similarity = np.asarray(similarity, dtype=np.float64)
+    return get_strategy(name).upper_bound(similarity, max(float(max_feedback), 0.0))
+
+def score_sql(name: str, sim: str, fb: str) -> str:
+    return get_strategy(name).sql(sim, f"GREATEST({fb}, 0)")
+
+register_strategy("log", LogStrategy())
+register_strategy("linear", LinearStrategy())
+register_strategy("sigmoid", SigmoidStrategy())
+
+for _name, _params in json.loads(os.getenv("RANKING_PARAMS", "{}")).items():
+    configure_strategy(_name, **_params)
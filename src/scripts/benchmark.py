@@ -1,19 +1,28 @@
+import argparse
 import json
 import logging
+import multiprocessing
+import os
 import sys
 import random
-from typing import List, Dict
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
 import pandas as pd
 from datasets import load_dataset
-from sqlmodel import Session, select, delete, func
+from sqlmodel import Session, select, func
 from tqdm import tqdm
 
 from src.database import engine, init_db, Interaction, Document, User
-from src.search import search_documents
+from src.search import search_documents, search_documents_batch
+from src.feedback import record_feedback, reset_feedback as reset_feedback_tables
+from src.scripts.simulation import ClickSimulator
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("benchmark")
 
+INITIAL_SEARCH_BATCH = 64
+
 def get_default_user_id():
     with Session(engine) as session:
         user = session.exec(select(User)).first()
@@ -29,10 +38,9 @@ def check_db_data():
             logger.error("Database is empty! Run 'make load' first.")
             sys.exit(1)
 
-def reset_feedback():
+def reset_feedback(namespace: Optional[str] = None):
     with Session(engine) as session:
-        session.exec(delete(Interaction))
-        session.commit()
+        reset_feedback_tables(session, namespace)
 
 def get_valid_queries(limit: int = None):
     queries_dataset = load_dataset("BeIR/nfcorpus", "queries", split="queries")
@@ -59,6 +67,16 @@ def get_rank(results, target_id):
             return i + 1
     return 21 
 
+def initial_results(session, queries: List[tuple], strategy: str, namespace: str) -> List[List[Dict]]:
+    results = []
+    for i in range(0, len(queries), INITIAL_SEARCH_BATCH):
+        chunk = [q_text for _, q_text in queries[i : i + INITIAL_SEARCH_BATCH]]
+        batch = search_documents_batch(
+            session, chunk, limit=20, strategy=strategy, namespace=namespace, feedback_scope="global"
+        )
+        results.extend(item["results"] for item in batch["results"])
+    return results
+
 def run_detailed_experiment(
     exp_name: str,
     strategies: List[str],
@@ -66,17 +84,20 @@ def run_detailed_experiment(
     max_clicks: int,
     noise_prob: float,
     checkpoints: List[int],
-    user_id: int
+    user_id: int,
+    rng: Optional[random.Random] = None,
+    namespace: str = "benchmark",
 ) -> List[Dict]:
     
+    rng = rng or random
     raw_data = []
 
     for strategy in strategies:
-        reset_feedback()
+        reset_feedback(namespace)
         
         with Session(engine) as session:
-            for q_id, q_text in tqdm(queries, desc=f"[{exp_name}] {strategy}"):
-                results_init = search_documents(session, q_text, limit=20, strategy=strategy)
+            all_initial = initial_results(session, queries, strategy, namespace)
+            for (q_id, q_text), results_init in tqdm(zip(queries, all_initial), total=len(queries), desc=f"[{exp_name}] {strategy}"):
                 if len(results_init) < 5:
                     continue
                 
@@ -98,21 +119,23 @@ def run_detailed_experiment(
 
                 current_clicks = 0
                 for i in range(1, max_clicks + 1):
-                    is_noise = random.random() < noise_prob
+                    is_noise = rng.random() < noise_prob
                     click_target_id = distractor_doc["id"] if is_noise else target_doc["id"]
                     
                     inter = Interaction(
                         user_id=user_id,
                         document_id=click_target_id,
+                        namespace=namespace,
                         query_text=q_text,
                         score_delta=1
                     )
-                    session.add(inter)
-                    session.commit()
+                    record_feedback(session, [inter])
                     current_clicks += 1
 
                     if current_clicks in checkpoints:
-                        results_current = search_documents(session, q_text, limit=20, strategy=strategy)
+                        results_current = search_documents(
+                            session, q_text, limit=20, strategy=strategy, namespace=namespace, feedback_scope="global"
+                        )
                         t_rank = get_rank(results_current, target_doc["id"])
                         d_rank = get_rank(results_current, distractor_doc["id"])
                         
@@ -128,38 +151,119 @@ def run_detailed_experiment(
 
     return raw_data
 
+def validate_simulation(simulator: ClickSimulator, queries: List[tuple], strategies: List[str], user_id: int, seed: int) -> bool:
+    namespace = f"benchmark:validate:{uuid.uuid4().hex[:8]}"
+    checkpoints = list(range(6))
+    try:
+        live = run_detailed_experiment(
+            "Validation", strategies, queries,
+            max_clicks=5, noise_prob=0.2, checkpoints=checkpoints, user_id=user_id,
+            rng=random.Random(seed), namespace=namespace,
+        )
+    finally:
+        reset_feedback(namespace)
+    simulated = simulator.run(
+        "Validation", strategies, queries,
+        max_clicks=5, noise_prob=0.2, checkpoints=checkpoints, rng=random.Random(seed)
+    )
+    mismatches = [(row, sim) for row, sim in zip(live, simulated) if row != sim]
+    if len(live) != len(simulated):
+        logger.error(f"Validation produced {len(live)} live rows but {len(simulated)} simulated rows")
+        return False
+    for row, sim in mismatches[:10]:
+        logger.error(f"Mismatch: live={row} simulated={sim}")
+    logger.info(f"Validation: {len(live) - len(mismatches)}/{len(live)} rows match the database path")
+    return not mismatches
+
+_worker_simulator: Optional[ClickSimulator] = None
+
+def _init_worker(queries: Optional[List[tuple]], candidates) -> None:
+    global _worker_simulator
+    if candidates is not None:
+        _worker_simulator = ClickSimulator(queries, candidates)
+
+def run_job(job: Dict) -> List[Dict]:
+    rng = random.Random(f"{job['seed']}:{job['experiment']}:{job['strategy']}")
+    if job["engine"] == "memory":
+        rows = _worker_simulator.run(job["experiment"], [job["strategy"]], job["queries"], rng=rng, **job["params"])
+    else:
+        namespace = f"benchmark:{job['run_id']}:{job['experiment']}:{job['strategy']}:{job['seed']}"
+        try:
+            rows = run_detailed_experiment(
+                job["experiment"], [job["strategy"]], job["queries"],
+                user_id=job["user_id"], rng=rng, namespace=namespace, **job["params"]
+            )
+        finally:
+            reset_feedback(namespace)
+    for row in rows:
+        row["seed"] = job["seed"]
+    return rows
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["memory", "db"], default="memory",
+                        help="memory replays clicks over cached candidate sets; db writes every click to Postgres")
+    parser.add_argument("--validate", type=int, default=0, metavar="N",
+                        help="before the run, replay N queries through both engines and compare the results")
+    parser.add_argument("--seed", type=int, default=0, help="base seed; run i uses seed + i")
+    parser.add_argument("--runs", type=int, default=1, help="independent seeded repetitions of every experiment")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes; every (experiment, strategy, seed) job has its own feedback namespace")
+    args = parser.parse_args()
+
     init_db()
     check_db_data()
     user_id = get_default_user_id()
+    run_id = uuid.uuid4().hex[:8]
     
     strategies = ["log", "linear", "sigmoid"]
     full_dataset = get_valid_queries(limit=None)
     subset = full_dataset[:40]
 
-    all_data = []
+    simulator = None
+    if args.engine == "memory" or args.validate:
+        logger.info(f"Loading candidate sets for {len(full_dataset)} queries...")
+        with Session(engine) as session:
+            simulator = ClickSimulator.from_database(session, full_dataset)
 
-    logger.info("Starting Exp 1: Efficiency...")
-    data1 = run_detailed_experiment(
-        "Efficiency", strategies, full_dataset, 
-        max_clicks=5, noise_prob=0.0, checkpoints=[0, 5], user_id=user_id
-    )
-    all_data.extend(data1)
+    if args.validate:
+        if not validate_simulation(simulator, full_dataset[: args.validate], strategies, user_id, args.seed):
+            logger.error("In-memory simulation diverges from the database path.")
+            sys.exit(1)
 
-    logger.info("Starting Exp 2: Noise...")
-    data2 = run_detailed_experiment(
-        "Noise", strategies, subset, 
-        max_clicks=5, noise_prob=0.2, checkpoints=[0, 5], user_id=user_id
-    )
-    all_data.extend(data2)
+    experiments = [
+        ("Efficiency", full_dataset, {"max_clicks": 5, "noise_prob": 0.0, "checkpoints": [0, 5]}),
+        ("Noise", subset, {"max_clicks": 5, "noise_prob": 0.2, "checkpoints": [0, 5]}),
+        ("Saturation", subset, {"max_clicks": 20, "noise_prob": 0.0, "checkpoints": [0, 1, 3, 5, 10, 15, 20]}),
+    ]
+    jobs = [
+        {
+            "engine": args.engine, "run_id": run_id, "user_id": user_id, "seed": args.seed + run,
+            "experiment": exp_name, "queries": queries, "params": params, "strategy": strategy,
+        }
+        for run in range(args.runs)
+        for exp_name, queries, params in experiments
+        for strategy in strategies
+    ]
+    logger.info(f"Running {len(jobs)} jobs on {args.workers} worker(s) (run {run_id})...")
 
-    logger.info("Starting Exp 3: Saturation...")
-    data3 = run_detailed_experiment(
-        "Saturation", strategies, subset, 
-        max_clicks=20, noise_prob=0.0, 
-        checkpoints=[0, 1, 3, 5, 10, 15, 20], user_id=user_id
-    )
-    all_data.extend(data3)
+    candidates = None
+    if simulator is not None:
+        candidates = list(zip(simulator.ids, simulator.similarities))
+    all_data = []
+    if args.workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(full_dataset, candidates if args.engine == "memory" else None),
+        ) as executor:
+            for rows in tqdm(executor.map(run_job, jobs), total=len(jobs), desc="Jobs"):
+                all_data.extend(rows)
+    else:
+        _init_worker(full_dataset, candidates if args.engine == "memory" else None)
+        for job in tqdm(jobs, desc="Jobs"):
+            all_data.extend(run_job(job))
 
     output_path = "data/benchmark_raw_data.json"
     with open(output_path, "w") as f:
@@ -0,0 +1,97 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+
+from src.ml import BACKENDS, export_onnx, get_model_name, load_model
+from src.scripts.benchmark import get_valid_queries
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("encoder_backends")
+
+def profile_backend(name: str, backend: str, texts: list, batch_size: int) -> dict:
+    start = time.perf_counter()
+    model = load_model(name, backend)
+    model.encode(["warmup"])
+    load_s = time.perf_counter() - start
+
+    single = []
+    for text in texts:
+        start = time.perf_counter()
+        model.encode([text])
+        single.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    embeddings = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    batch_s = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "single_p50_ms": float(np.percentile(single, 50)),
+        "single_p95_ms": float(np.percentile(single, 95)),
+        "batch_texts_per_s": len(texts) / batch_s,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "embeddings": embeddings,
+    }
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {"cosine_mean": float(cosines.mean()), "cosine_min": float(cosines.min())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch and ONNX query encoders: parity, latency and memory")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--model", default=None, help="defaults to EMBEDDING_MODEL")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="fail if any backend's mean cosine to torch is below this")
+    parser.add_argument("--export-only", action="store_true", help="only export (and quantize) the ONNX model")
+    parser.add_argument("--output", default="data/encoder_backends.json")
+    args = parser.parse_args()
+
+    name = args.model or get_model_name()
+    export_onnx(name, quantize="onnx-int8" in args.backends)
+    if args.export_only:
+        return
+
+    texts = [q_text for _, q_text in get_valid_queries(limit=args.queries)]
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    ctx = multiprocessing.get_context("spawn")
+    profiles = {}
+    for backend in backends:
+        logger.info(f"Profiling {backend} in a fresh process...")
+        with ctx.Pool(1) as pool:
+            profiles[backend] = pool.apply(profile_backend, (name, backend, texts, args.batch_size))
+
+    reference = profiles["torch"]["embeddings"]
+    report = []
+    for backend in backends:
+        row = {k: v for k, v in profiles[backend].items() if k != "embeddings"}
+        row.update(cosine_agreement(reference, profiles[backend]["embeddings"]))
+        report.append(row)
+
+    with open(args.output, "w") as f:
+        json.dump({"model": name, "queries": len(texts), "backends": report}, f, indent=2)
+
+    print(f"{'backend':>10} | {'load s':>6} | {'p50 ms':>6} | {'p95 ms':>6} | {'texts/s':>8} | {'RSS MB':>7} | cos mean / min")
+    for row in report:
+        print(
+            f"{row['backend']:>10} | {row['load_s']:6.2f} | {row['single_p50_ms']:6.2f} | {row['single_p95_ms']:6.2f} | "
+            f"{row['batch_texts_per_s']:8.1f} | {row['peak_rss_mb']:7.0f} | {row['cosine_mean']:.4f} / {row['cosine_min']:.4f}"
+        )
+    logger.info(f"Report saved: {args.output}")
+
+    failed = [row["backend"] for row in report if row["cosine_mean"] < args.min_cosine]
+    if failed:
+        logger.error(f"Parity check failed for {failed} (mean cosine < {args.min_cosine})")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import argparse
+import logging
+import sys
+
+from sqlmodel import Session
+
+from src.database import engine, init_db
+from src.feedback import rebuild_feedback_aggregate, verify_feedback_aggregate
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("feedback_aggregate")
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or verify the document_feedback and query_feedback aggregates")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args()
+
+    init_db()
+    with Session(engine) as session:
+        if args.command == "rebuild":
+            rebuild_feedback_aggregate(session)
+            return
+
+        mismatches = verify_feedback_aggregate(session)
+        if not mismatches:
+            logger.info("Feedback aggregate is consistent with interactions.")
+            return
+        for row in mismatches[:20]:
+            logger.error(f"Mismatch: {row}")
+        logger.error(f"{len(mismatches)} aggregate rows differ. Run with 'rebuild' to fix.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from sqlmodel import Session, text
+
+from src.database import engine, init_db
+from src.index import category_counts, create_category_indexes, partial_index_categories
+from src.ml import encode_queries
+from src.search import SearchFilters, explain_candidates, search_documents
+from src.scripts.benchmark import check_db_data, get_valid_queries
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("filter_benchmark")
+
+MODES = {"iterative": "1", "post_filter": "0"}
+
+def filter_cases(session: Session, min_rows: int) -> dict:
+    counts = {category: count for category, count in category_counts().items() if count >= min_rows}
+    total = sum(category_counts().values()) or 1
+    cases = {}
+    if counts:
+        rare = min(counts, key=counts.get)
+        common = max(counts, key=counts.get)
+        cases["selective_category"] = (SearchFilters(category=rare), counts[rare] / total)
+        cases["broad_category"] = (SearchFilters(category=common), counts[common] / total)
+    cutoff = session.exec(text(
+        "SELECT percentile_disc(0.9) WITHIN GROUP (ORDER BY created_at) FROM documents"
+    )).scalar()
+    if cutoff is not None:
+        cases["recent_10pct"] = (SearchFilters(created_after=cutoff), 0.1)
+    return cases
+
+def exact_results(session: Session, queries, k: int, strategy: str, filters: SearchFilters):
+    results = []
+    for query in queries:
+        session.exec(text("SELECT set_config('enable_indexscan', 'off', true)"))
+        results.append([doc["id"] for doc in search_documents(session, query, k, strategy, ranking="sql", quantization="none", filters=filters)])
+        session.rollback()
+    return results
+
+def measure_mode(session: Session, queries, k: int, strategy: str, filters: SearchFilters, exact, repeats: int):
+    latencies, recalls, filled = [], [], []
+    for query, truth in zip(queries, exact):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            found = search_documents(session, query, k, strategy, ranking="sql", quantization="none", filters=filters)
+            latencies.append((time.perf_counter() - start) * 1000)
+            session.rollback()
+        recalls.append(len({doc["id"] for doc in found} & set(truth)) / max(len(truth), 1))
+        filled.append(len(found) >= min(k, len(truth)))
+    plan = explain_candidates(session, queries[0], k, "none", filters)
+    session.rollback()
+    return {
+        **plan,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "fill_rate": float(np.mean(filled)),
+        f"recall@{k}": float(np.mean(recalls)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare filtered ANN search via partial indexes, iterative scans and post-filtering")
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=sorted(MODES))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--strategy", default="log")
+    parser.add_argument("--min-rows", type=int, default=100, help="ignore categories smaller than this")
+    parser.add_argument("--build-partial", action="store_true", help="create partial indexes for selective categories first")
+    parser.add_argument("--output", default="data/filter_benchmark.json")
+    args = parser.parse_args()
+
+    init_db()
+    check_db_data()
+    if args.build_partial:
+        create_category_indexes(min_rows=args.min_rows)
+
+    queries = [q_text for _, q_text in get_valid_queries(limit=args.queries)]
+    encode_queries(queries)
+
+    report = []
+    with Session(engine) as session:
+        cases = filter_cases(session, args.min_rows)
+        partial = partial_index_categories(ttl=0)
+        for case, (filters, selectivity) in cases.items():
+            logger.info(f"Computing exact top-k for '{case}' with a sequential scan...")
+            exact = exact_results(session, queries, args.k, args.strategy, filters)
+            for mode in args.modes:
+                os.environ["FILTER_ITERATIVE_SCAN"] = MODES[mode]
+                logger.info(f"Measuring '{case}' with {mode}...")
+                row = {"case": case, "mode": mode, "selectivity": selectivity, "partial_index": filters.category in partial}
+                row.update(measure_mode(session, queries, args.k, args.strategy, filters, exact, args.repeats))
+                report.append(row)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'case':>20} | {'mode':>11} | {'sel':>6} | {'path':>14} | {'p50 ms':>7} | {'p95 ms':>7} | {'fill':>5} | recall@{args.k}")
+    for row in report:
+        print(
+            f"{row['case']:>20} | {row['mode']:>11} | {row['selectivity']:6.3f} | {row['filter_path']:>14} | "
+            f"{row['p50_ms']:7.2f} | {row['p95_ms']:7.2f} | {row['fill_rate']:5.2f} | {row[f'recall@{args.k}']:.3f}"
+        )
+    logger.info(f"Report saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
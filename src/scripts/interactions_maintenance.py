@@ -0,0 +1,35 @@
+import argparse
+import json
+import logging
+from datetime import date
+
+from sqlmodel import Session, text
+
+from src.database import engine, init_db
+from src.partitions import maintain_interactions, partition_status
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("interactions_maintenance")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage monthly interactions partitions and their daily rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    sub.add_parser("maintain", help="create upcoming partitions, compact expired ones into rollups")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "maintain":
+        print(json.dumps(maintain_interactions(), indent=2))
+        return
+
+    with Session(engine) as session:
+        rollups = session.exec(text("SELECT count(*), min(day), max(day) FROM interaction_rollups")).one()
+        status = {
+            "partitions": partition_status(session),
+            "rollups": {"rows": rollups[0], "first_day": rollups[1], "last_day": rollups[2]},
+        }
+    print(json.dumps(status, indent=2, default=lambda value: value.isoformat() if isinstance(value, date) else str(value)))
+
+if __name__ == "__main__":
+    main()
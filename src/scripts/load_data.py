@@ -1,20 +1,37 @@
+import argparse
+import json
 import logging
+import multiprocessing
 import sys
 import os
-from typing import List
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
 
+import numpy as np
+import pyarrow.parquet as pq
+import torch
 from datasets import load_dataset
+from pgvector.psycopg import register_vector
 from sentence_transformers import SentenceTransformer
-from sqlmodel import Session, select, text
+from sqlmodel import Session, select, text, func
 from tqdm import tqdm
 from huggingface_hub import login
 
 from src.database import Document, User, engine, init_db
+from src.index import ANN_KINDS, QUANTIZATIONS, create_index, drop_index, ensure_default_index, index_name, list_ann_indexes
+from src.ml import get_model_name
+from src.embeddings import refresh_active_model
 from src.security import get_password_hash
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+Record = Tuple[str, Optional[str]]
+
+_worker_model = None
+
 def check_db_connection():
     try:
         with Session(engine) as session:
@@ -39,59 +56,184 @@ def create_default_user():
             session.add(admin)
             session.commit()
 
-def load_nfcorpus():
+def iter_nfcorpus() -> Iterator[Record]:
     hf_token = os.getenv("HF_TOKEN")
     if hf_token:
         logger.info("Authenticating with Hugging Face...")
         login(token=hf_token.strip())
-    
-    create_default_user()
-
-    with Session(engine) as session:
-        try:
-            statement = select(Document).limit(1)
-            result = session.exec(statement).first()
-            if result:
-                logger.info("Database already contains data. Skipping load.")
-                return
-        except Exception as e:
-            logger.warning(f"Error checking data: {e}")
 
     logger.info("Loading NFCorpus dataset...")
     dataset = load_dataset("BeIR/nfcorpus", "corpus", split="corpus")
-    
-    logger.info("Loading SentenceTransformer model...")
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    
-    batch_size = 64
-    documents_buffer: List[Document] = []
-    
-    logger.info("Starting encoding...")
-    
+    for row in dataset:
+        yield f"{row['title']} {row['text']}".strip(), "nutrition"
+
+def iter_jsonl(path: str, text_field: str, title_field: Optional[str], category_field: Optional[str], default_category: Optional[str]) -> Iterator[Record]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            yield record_from_row(row, text_field, title_field, category_field, default_category)
+
+def iter_parquet(path: str, text_field: str, title_field: Optional[str], category_field: Optional[str], default_category: Optional[str]) -> Iterator[Record]:
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=1024):
+        for row in batch.to_pylist():
+            yield record_from_row(row, text_field, title_field, category_field, default_category)
+
+def record_from_row(row: dict, text_field: str, title_field: Optional[str], category_field: Optional[str], default_category: Optional[str]) -> Record:
+    content = str(row[text_field])
+    if title_field and row.get(title_field):
+        content = f"{row[title_field]} {content}"
+    category = row.get(category_field) if category_field else None
+    return content.strip(), category if category is not None else default_category
+
+def open_source(args) -> Tuple[str, Iterator[Record]]:
+    if args.source == "nfcorpus":
+        return "nfcorpus", iter_nfcorpus()
+    path = os.path.abspath(args.source)
+    fields = (args.text_field, args.title_field, args.category_field, args.default_category)
+    if path.endswith(".jsonl") or path.endswith(".json"):
+        return path, iter_jsonl(path, *fields)
+    if path.endswith(".parquet"):
+        return path, iter_parquet(path, *fields)
+    raise ValueError(f"Unsupported source '{args.source}', expected nfcorpus, .jsonl or .parquet")
+
+def _init_worker(model_name: str, threads: Optional[int] = None):
+    global _worker_model
+    if threads:
+        torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_model.encode(texts, batch_size=len(texts)), dtype=np.float32)
+
+def batched(records: Iterator[Record], size: int) -> Iterator[List[Record]]:
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+def get_checkpoint(source: str) -> int:
     with Session(engine) as session:
-        for i in tqdm(range(0, len(dataset), batch_size), desc="Processing batches"):
-            batch = dataset[i : i + batch_size]
-            titles = batch["title"]
-            texts = batch["text"]
-            
-            combined_texts = [f"{t} {txt}".strip() for t, txt in zip(titles, texts)]
-            embeddings = model.encode(combined_texts)
-            
-            for j, text_content in enumerate(combined_texts):
-                doc = Document(
-                    content=text_content,
-                    category="nutrition",
-                    embedding=embeddings[j].tolist()
-                )
-                documents_buffer.append(doc)
-            
-            session.add_all(documents_buffer)
-            session.commit()
-            documents_buffer.clear()
-            
-    logger.info("Data loading completed!")
+        row = session.exec(
+            text("SELECT rows_done FROM load_checkpoints WHERE source = :source"),
+            params={"source": source},
+        ).first()
+    return row[0] if row else 0
+
+def reset_checkpoint(source: str):
+    with Session(engine) as session:
+        session.exec(text("DELETE FROM load_checkpoints WHERE source = :source"), params={"source": source})
+        session.commit()
+
+def copy_batch(conn, source: str, rows_done: int, batch: List[Record], embeddings: np.ndarray, model_name: str):
+    now = datetime.utcnow()
+    with conn.cursor() as cur:
+        with cur.copy("COPY documents (content, category, embedding, embedding_model, created_at) FROM STDIN WITH (FORMAT BINARY)") as copy:
+            copy.set_types(["text", "text", "vector", "text", "timestamp"])
+            for (content, category), embedding in zip(batch, embeddings):
+                copy.write_row((content, category, embedding, model_name, now))
+        cur.execute(
+            """
+            INSERT INTO load_checkpoints (source, rows_done, updated_at) VALUES (%s, %s, %s)
+            ON CONFLICT (source) DO UPDATE SET rows_done = EXCLUDED.rows_done, updated_at = EXCLUDED.updated_at
+            """,
+            (source, rows_done, now),
+        )
+    conn.commit()
+
+def make_executor(workers: int) -> Executor:
+    model_name = get_model_name()
+    if workers > 0:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, threads),
+        )
+    _init_worker(model_name)
+    return ThreadPoolExecutor(max_workers=1)
+
+def corpus_size() -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.count(Document.id))).one()
+
+def load_corpus(args):
+    source, records = open_source(args)
+    if args.restart:
+        reset_checkpoint(source)
+    skip = get_checkpoint(source)
+    existing = corpus_size()
+    if skip:
+        logger.info(f"Resuming '{source}' after {skip} already loaded rows.")
+        records = islice(records, skip, None)
+    elif existing and not args.append:
+        logger.info("Database already contains data. Skipping load (use --append to add this source).")
+        return
+
+    deferred = []
+    if args.defer_index == "always" or (args.defer_index == "auto" and not existing):
+        managed = {index_name(kind, quantization=q): (kind, q) for kind in ANN_KINDS for q in QUANTIZATIONS}
+        for index in list_ann_indexes():
+            if index["name"] in managed:
+                logger.info(f"Dropping {index['name']} until the load finishes...")
+                drop_index(index["name"])
+                deferred.append(managed[index["name"]])
+
+    workers = max(args.workers, 0)
+    in_flight = max(workers, 1) * 2
+    rows_done = skip
+    model_name = get_model_name()
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        register_vector(conn)
+        with make_executor(workers) as executor, tqdm(desc="Loading", unit="docs", initial=skip) as progress:
+            pending = []
+            batches = batched(records, args.batch_size)
+            for batch in batches:
+                pending.append((batch, executor.submit(_encode_batch, [content for content, _ in batch])))
+                if len(pending) < in_flight:
+                    continue
+                batch, future = pending.pop(0)
+                rows_done += len(batch)
+                copy_batch(conn, source, rows_done, batch, future.result(), model_name)
+                progress.update(len(batch))
+            for batch, future in pending:
+                rows_done += len(batch)
+                copy_batch(conn, source, rows_done, batch, future.result(), model_name)
+                progress.update(len(batch))
+    finally:
+        raw.close()
+
+    for kind, quantization in deferred:
+        create_index(kind, quantization=quantization)
+    logger.info(f"Data loading completed! {rows_done - skip} new rows from '{source}'.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a corpus into the documents table")
+    parser.add_argument("--source", default="nfcorpus", help="'nfcorpus' or a path to a .jsonl/.parquet file")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--title-field", default="title")
+    parser.add_argument("--category-field", default="category")
+    parser.add_argument("--default-category", default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=0, help="encoder processes; 0 encodes in a background thread")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and load the source again")
+    parser.add_argument("--append", action="store_true", help="load into a corpus that already has documents")
+    parser.add_argument("--defer-index", choices=["auto", "always", "never"], default="auto",
+                        help="drop ANN indexes during the load and rebuild them afterwards (auto: only into an empty corpus)")
+    args = parser.parse_args()
 
-if __name__ == "__main__":
     init_db()
     check_db_connection()
-    load_nfcorpus()
+    create_default_user()
+    refresh_active_model()
+    load_corpus(args)
+    ensure_default_index()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+PERCENTILES = {"p50": 50, "p90": 90, "p99": 99, "p999": 99.9}
+
+def load_queries(path: str) -> Tuple[List[str], List[float]]:
+    queries, weights = [], []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                row = json.loads(line)
+                queries.append(row["query"])
+                weights.append(float(row.get("weight", row.get("count", 1))))
+            else:
+                queries.append(line)
+                weights.append(1.0)
+    if not queries:
+        raise ValueError(f"No queries in {path}")
+    return queries, weights
+
+def summarize(latencies: List[float], errors: int) -> Dict:
+    total = len(latencies) + errors
+    summary = {"count": total, "ok": len(latencies), "errors": errors, "error_rate": errors / total if total else 0.0}
+    if latencies:
+        values = np.asarray(latencies)
+        summary.update({name: float(np.percentile(values, q)) for name, q in PERCENTILES.items()})
+        summary.update(mean=float(values.mean()), max=float(values.max()))
+    return summary
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, args, queries: List[str], weights: List[float]):
+        self.client = client
+        self.base_url = args.url.rstrip("/") + ("/api/v1/async" if args.endpoint == "async" else "/api/v1")
+        self.limit = args.limit
+        self.feedback_ratio = args.feedback_ratio
+        self.timeout = args.timeout
+        self.rng = random.Random(args.seed)
+        self.queries = queries
+        self.cum_weights = list(np.cumsum(weights))
+        self.recent: Deque[Tuple[str, int]] = deque(maxlen=1000)
+        self.reset()
+
+    def reset(self) -> None:
+        self.latencies: Dict[str, List[float]] = {"search": [], "feedback": []}
+        self.errors: Dict[str, int] = {"search": 0, "feedback": 0}
+        self.status_codes: Dict[str, int] = {}
+        self.recording = True
+
+    async def operation(self, scheduled: Optional[float] = None) -> None:
+        start = scheduled if scheduled is not None else time.perf_counter()
+        if self.recent and self.rng.random() < self.feedback_ratio:
+            op = "feedback"
+            query, doc_id = self.rng.choice(self.recent)
+            request = self.client.post(
+                f"{self.base_url}/feedback",
+                json={"document_id": doc_id, "query": query, "score_delta": 1},
+                timeout=self.timeout,
+            )
+        else:
+            op = "search"
+            query = self.rng.choices(self.queries, cum_weights=self.cum_weights)[0]
+            request = self.client.post(
+                f"{self.base_url}/search",
+                json={"query": query, "limit": self.limit},
+                timeout=self.timeout,
+            )
+        try:
+            response = await request
+            code = str(response.status_code)
+            ok = response.status_code == 200
+            if ok and op == "search":
+                results = response.json()["results"]
+                if results:
+                    self.recent.append((query, self.rng.choice(results)["id"]))
+        except httpx.HTTPError as e:
+            code, ok = type(e).__name__, False
+        elapsed = (time.perf_counter() - start) * 1000
+        if not self.recording:
+            return
+        self.status_codes[code] = self.status_codes.get(code, 0) + 1
+        if ok:
+            self.latencies[op].append(elapsed)
+        else:
+            self.errors[op] += 1
+
+    def report(self, duration: float, **extra) -> Dict:
+        ok = sum(len(v) for v in self.latencies.values())
+        return {
+            **extra,
+            "duration_s": duration,
+            "achieved_rps": ok / duration if duration else 0.0,
+            "overall": summarize([latency for v in self.latencies.values() for latency in v], sum(self.errors.values())),
+            "by_op": {op: summarize(self.latencies[op], self.errors[op]) for op in self.latencies},
+            "status_codes": self.status_codes,
+        }
+
+async def run_closed(workload: Workload, concurrency: int, duration: float, warmup: float) -> Dict:
+    deadline = time.perf_counter() + warmup + duration
+
+    async def user():
+        while time.perf_counter() < deadline:
+            await workload.operation()
+
+    workload.recording = False
+    tasks = [asyncio.create_task(user()) for _ in range(concurrency)]
+    await asyncio.sleep(warmup)
+    workload.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    return workload.report(time.perf_counter() - started, mode="closed", concurrency=concurrency)
+
+async def run_open(workload: Workload, rate: float, arrival: str, duration: float, warmup: float, max_in_flight: int) -> Dict:
+    rng = random.Random(workload.rng.random())
+    in_flight = set()
+    dropped = 0
+    peak_in_flight = 0
+
+    async def schedule(length: float, record: bool):
+        nonlocal dropped, peak_in_flight
+        begin = time.perf_counter()
+        next_at = begin
+        while next_at < begin + length:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                dropped += record
+            else:
+                task = asyncio.create_task(workload.operation(scheduled=next_at))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                peak_in_flight = max(peak_in_flight, len(in_flight))
+            next_at += rng.expovariate(rate) if arrival == "poisson" else 1 / rate
+
+    workload.recording = False
+    await schedule(warmup, record=False)
+    workload.reset()
+    dropped, peak_in_flight = 0, 0
+    started = time.perf_counter()
+    await schedule(duration, record=True)
+    await asyncio.gather(*list(in_flight))
+    report = workload.report(
+        time.perf_counter() - started,
+        mode="open", arrival=arrival, offered_rps=rate, dropped=dropped, peak_in_flight=peak_in_flight,
+    )
+    report["overall"]["errors"] += dropped
+    report["overall"]["count"] += dropped
+    total = report["overall"]["count"]
+    report["overall"]["error_rate"] = report["overall"]["errors"] / total if total else 0.0
+    return report
+
+def sustained(result: Dict, slo_ms: float, max_error_rate: float) -> bool:
+    overall = result["overall"]
+    return (
+        overall["error_rate"] <= max_error_rate
+        and overall.get("p99", float("inf")) <= slo_ms
+        and result["achieved_rps"] >= 0.95 * result["offered_rps"]
+    )
+
+async def run_saturation(workload: Workload, args) -> Tuple[List[Dict], Optional[float]]:
+    results, best = [], None
+    rate = args.rate
+    while rate <= args.max_rate:
+        result = await run_open(workload, rate, args.arrival, args.duration, args.warmup, args.max_in_flight)
+        result["sustained"] = sustained(result, args.slo_ms, args.max_error_rate)
+        results.append(result)
+        print_result(result)
+        if not result["sustained"]:
+            break
+        best = result["achieved_rps"]
+        rate *= args.step
+    return results, best
+
+def print_result(result: Dict) -> None:
+    overall = result["overall"]
+    label = f"{result['concurrency']} users" if result["mode"] == "closed" else f"{result['offered_rps']:.0f} rps offered"
+    print(
+        f"{label:>18} | {result['achieved_rps']:8.1f} rps | "
+        + " | ".join(f"{name} {overall.get(name, float('nan')):8.1f}" for name in PERCENTILES)
+        + f" ms | errors {overall['error_rate']:.2%}"
+    )
+
+def compare(current: Dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path}:")
+    for old, new in zip(baseline["results"], current["results"]):
+        for op in ("search", "feedback"):
+            deltas = []
+            for name in list(PERCENTILES) + ["error_rate"]:
+                before, after = old["by_op"][op].get(name), new["by_op"][op].get(name)
+                if before and after is not None:
+                    deltas.append(f"{name} {100 * (after - before) / before:+.1f}%")
+            if deltas:
+                print(f"  {op:>8}: " + ", ".join(deltas))
+    if baseline.get("saturation_rps") and current.get("saturation_rps"):
+        change = 100 * (current["saturation_rps"] - baseline["saturation_rps"]) / baseline["saturation_rps"]
+        print(f"  saturation: {baseline['saturation_rps']:.1f} -> {current['saturation_rps']:.1f} rps ({change:+.1f}%)")
+
+async def main_async(args) -> Dict:
+    queries, weights = load_queries(args.queries)
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in {"output", "compare"}},
+        "queries": {"distinct": len(queries), "total_weight": float(sum(weights))},
+        "results": [],
+    }
+    async with httpx.AsyncClient(limits=limits) as client:
+        workload = Workload(client, args, queries, weights)
+        if args.mode == "closed":
+            for concurrency in args.concurrency:
+                result = await run_closed(workload, concurrency, args.duration, args.warmup)
+                report["results"].append(result)
+                print_result(result)
+        elif args.mode == "open":
+            result = await run_open(workload, args.rate, args.arrival, args.duration, args.warmup, args.max_in_flight)
+            report["results"].append(result)
+            print_result(result)
+        else:
+            report["results"], report["saturation_rps"] = await run_saturation(workload, args)
+            print(f"Saturation throughput: {report['saturation_rps'] or 0:.1f} rps (p99 <= {args.slo_ms} ms)")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a query distribution against the search API")
+    parser.add_argument("--queries", required=True, help=".txt (one query per line) or .jsonl with 'query' and optional 'weight'/'count'")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=["sync", "async"], default="sync")
+    parser.add_argument("--mode", choices=["closed", "open", "saturation"], default="closed")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="closed-loop virtual users")
+    parser.add_argument("--rate", type=float, default=50, help="open-loop arrivals per second (saturation: starting rate)")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="poisson")
+    parser.add_argument("--step", type=float, default=1.5, help="saturation: rate multiplier between steps")
+    parser.add_argument("--max-rate", type=float, default=5000)
+    parser.add_argument("--slo-ms", type=float, default=250, help="saturation: p99 latency that still counts as sustained")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--feedback-ratio", type=float, default=0.1, help="share of operations that post feedback")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--max-in-flight", type=int, default=512, help="open loop: arrivals beyond this are dropped and counted as errors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="data/load_test.json")
+    parser.add_argument("--compare", help="previous report to diff against")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved: {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
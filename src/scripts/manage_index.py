@@ -0,0 +1,79 @@
+import argparse
+import json
+import logging
+
+from src.database import init_db
+from src.index import (
+    QUANTIZATIONS,
+    create_category_indexes,
+    create_index,
+    drop_category_indexes,
+    drop_index,
+    index_name,
+    index_status,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("manage_index")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the ANN index on documents.embedding")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("status")
+
+    for command in ("create", "rebuild"):
+        p = sub.add_parser(command)
+        p.add_argument("--kind", choices=["hnsw", "ivfflat"], default="hnsw")
+        p.add_argument("--quantization", choices=sorted(QUANTIZATIONS), default="none")
+        p.add_argument("--m", type=int)
+        p.add_argument("--ef-construction", type=int)
+        p.add_argument("--lists", type=int)
+        p.add_argument("--maintenance-work-mem", help="e.g. 1GB")
+        p.add_argument("--blocking", action="store_true", help="build without CONCURRENTLY")
+
+    p = sub.add_parser("drop")
+    p.add_argument("--kind", choices=["hnsw", "ivfflat"], default="hnsw")
+    p.add_argument("--quantization", choices=sorted(QUANTIZATIONS), default="none")
+
+    p = sub.add_parser("partial-categories", help="build per-category partial indexes for selective categories")
+    p.add_argument("--kind", choices=["hnsw", "ivfflat"], default="hnsw")
+    p.add_argument("--m", type=int)
+    p.add_argument("--ef-construction", type=int)
+    p.add_argument("--lists", type=int)
+    p.add_argument("--max-fraction", type=float, default=0.2, help="skip categories above this share of rows")
+    p.add_argument("--min-rows", type=int, default=1000, help="skip categories below this many rows")
+    p.add_argument("--blocking", action="store_true", help="build without CONCURRENTLY")
+
+    sub.add_parser("drop-partial")
+
+    args = parser.parse_args()
+    init_db()
+
+    if args.command == "status":
+        print(json.dumps(index_status(), indent=2, default=str))
+    elif args.command == "drop":
+        name = index_name(args.kind, quantization=args.quantization)
+        drop_index(name)
+        logger.info(f"Dropped {name}")
+    elif args.command == "partial-categories":
+        params = {"m": args.m, "ef_construction": args.ef_construction} if args.kind == "hnsw" else {"lists": args.lists}
+        names = create_category_indexes(
+            args.kind, params, args.max_fraction, args.min_rows, concurrently=not args.blocking
+        )
+        logger.info(f"Built {len(names)} partial indexes")
+    elif args.command == "drop-partial":
+        logger.info(f"Dropped {len(drop_category_indexes())} partial indexes")
+    else:
+        params = {"m": args.m, "ef_construction": args.ef_construction} if args.kind == "hnsw" else {"lists": args.lists}
+        create_index(
+            args.kind,
+            params,
+            concurrently=not args.blocking,
+            rebuild=args.command == "rebuild",
+            maintenance_work_mem=args.maintenance_work_mem,
+            quantization=args.quantization,
+        )
+
+if __name__ == "__main__":
+    main()
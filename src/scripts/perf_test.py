@@ -1,28 +1,56 @@
+import argparse
 import asyncio
+import json
 import time
 import httpx
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 API_URL = "http://localhost:8000/api/v1/search"
+ASYNC_API_URL = "http://localhost:8000/api/v1/async/search"
+STATS_URL = "http://localhost:8000/api/v1/stats"
 CONFIG = {
     1: 1000,
     2: 1000,
     4: 1000,
-    8: 1000
+    8: 1000,
+    16: 1000
 }
+COMPARE_LEVELS = [1, 2, 4, 8, 16, 32, 64]
+COMPARE_REQUESTS = 500
+TOPICS = [
+    "nutrition and health",
+    "vitamin d deficiency",
+    "iron rich foods",
+    "sleep and recovery",
+    "heart disease risk",
+    "protein intake for athletes",
+    "gut microbiome",
+    "blood sugar control",
+]
 
-async def measure(client, semaphore, query):
+def query_set(count, tag):
+    return [f"{TOPICS[i % len(TOPICS)]} {tag} {i}" for i in range(count)]
+
+async def measure(client, semaphore, query, url=API_URL):
     async with semaphore:
         start = time.perf_counter()
         try:
-            resp = await client.post(API_URL, json={"query": query, "limit": 10}, timeout=20.0)
+            resp = await client.post(url, json={"query": query, "limit": 10}, timeout=20.0)
             elapsed = (time.perf_counter() - start) * 1000
             return elapsed if resp.status_code == 200 else None
-        except:
+        except Exception:
             return None
 
+async def fetch_encoder_stats(client):
+    try:
+        resp = await client.get(STATS_URL, timeout=5.0)
+        return resp.json().get("encoder")
+    except (httpx.HTTPError, ValueError):
+        return None
+
 async def run_test():
     all_data = []
     async with httpx.AsyncClient() as client:
@@ -31,26 +59,79 @@ async def run_test():
         for level, count in CONFIG.items():
             print(f"Test: {level} User(s), {count} requests...")
             semaphore = asyncio.Semaphore(level)
+            stats_before = await fetch_encoder_stats(client)
             
             start_level = time.perf_counter()
-            tasks = [measure(client, semaphore, "nutrition and health") for _ in range(count)]
+            tasks = [measure(client, semaphore, query) for query in query_set(count, f"c{level}")]
             latencies = await asyncio.gather(*tasks)
             total_duration = time.perf_counter() - start_level
             
             valid_latencies = [l for l in latencies if l is not None]
             rps = len(valid_latencies) / total_duration
+
+            stats_after = await fetch_encoder_stats(client)
+            if stats_before and stats_after:
+                batches = stats_after["batches"] - stats_before["batches"]
+                items = stats_after["items"] - stats_before["items"]
+                avg_batch = items / batches if batches else 0.0
+                print(f"  RPS: {rps:.1f} | encoder batches: {batches} | avg batch size: {avg_batch:.2f} | queue depth: {stats_after['queue_depth']}")
             
             for l in valid_latencies:
                 all_data.append({"concurrency": level, "latency": l, "rps": rps})
     
     return pd.DataFrame(all_data)
 
+async def run_level(client, url, level, count, tag):
+    semaphore = asyncio.Semaphore(level)
+    start_level = time.perf_counter()
+    latencies = await asyncio.gather(*[measure(client, semaphore, query, url) for query in query_set(count, tag)])
+    total_duration = time.perf_counter() - start_level
+    valid_latencies = [l for l in latencies if l is not None]
+    return valid_latencies, len(latencies) - len(valid_latencies), len(valid_latencies) / total_duration
+
+async def run_compare():
+    rows = []
+    limits = httpx.Limits(max_connections=max(COMPARE_LEVELS), max_keepalive_connections=max(COMPARE_LEVELS))
+    async with httpx.AsyncClient(limits=limits) as client:
+        for mode, url in {"sync": API_URL, "async": ASYNC_API_URL}.items():
+            await client.post(url, json={"query": "warmup", "limit": 1})
+            for level in COMPARE_LEVELS:
+                latencies, errors, rps = await run_level(client, url, level, COMPARE_REQUESTS, f"{mode}{level}")
+                row = {
+                    "mode": mode,
+                    "concurrency": level,
+                    "p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+                    "p99_ms": float(np.percentile(latencies, 99)) if latencies else None,
+                    "rps": rps,
+                    "errors": errors,
+                }
+                rows.append(row)
+                print(f"{mode:>5} | {level:>3} users | p50 {row['p50_ms'] or 0:7.1f} ms | p99 {row['p99_ms'] or 0:7.1f} ms | {rps:7.1f} RPS | {errors} errors")
+    return pd.DataFrame(rows)
+
+async def compare_main():
+    df = await run_compare()
+
+    with open("data/perf_compare.json", "w") as f:
+        json.dump(df.to_dict(orient="records"), f, indent=2)
+
+    fig = make_subplots(rows=1, cols=3, subplot_titles=("p50 latency (ms)", "p99 latency (ms)", "Throughput (RPS)"))
+    colors = {"sync": "#636EFA", "async": "#EF553B"}
+    for mode, mode_df in df.groupby("mode"):
+        for col, metric in enumerate(["p50_ms", "p99_ms", "rps"], start=1):
+            fig.add_trace(go.Scatter(x=mode_df["concurrency"], y=mode_df[metric], mode="lines+markers",
+                                     name=mode, marker_color=colors[mode], showlegend=col == 1), row=1, col=col)
+    fig.update_xaxes(type="log", title_text="Concurrent clients")
+    fig.update_layout(title="Sync vs Async Serving", template="plotly_white")
+    fig.write_image("data/performance_sync_vs_async.png")
+    print("Report saved: data/perf_compare.json, data/performance_sync_vs_async.png")
+
 async def main():
     df = await run_test()
     
     fig = make_subplots(rows=1, cols=2, subplot_titles=("Latency (ms)", "Throughput (RPS)"))
     
-    colors = {1: "#636EFA", 2: "#EF553B", 4: "#00CC96", 8: "#AB63FA"}
+    colors = {1: "#636EFA", 2: "#EF553B", 4: "#00CC96", 8: "#AB63FA", 16: "#FFA15A"}
     
     for level in CONFIG.keys():
         lvl_df = df[df["concurrency"] == level]
@@ -67,4 +148,7 @@ async def main():
     print("Report saved: data/performance_final.png")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compare", action="store_true", help="compare sync and async endpoints at 1-64 clients")
+    args = parser.parse_args()
+    asyncio.run(compare_main() if args.compare else main())
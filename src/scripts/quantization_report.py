@@ -0,0 +1,95 @@
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+from sqlmodel import Session, text
+
+from src.database import EMBEDDING_DIM, engine, init_db
+from src.index import QUANTIZATIONS, create_index, index_name, list_ann_indexes, resolve_quantization
+from src.ml import encode_queries
+from src.search import search_documents
+from src.scripts.benchmark import check_db_data, get_valid_queries
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("quantization_report")
+
+def vector_storage(session: Session, quantization: str) -> dict:
+    expression = resolve_quantization(quantization)["expression"].format(column="embedding", dim=EMBEDDING_DIM)
+    row = session.exec(text(f"SELECT avg(pg_column_size({expression})), sum(pg_column_size({expression})) FROM documents")).one()
+    return {"bytes_per_vector": float(row[0] or 0), "vector_bytes": int(row[1] or 0)}
+
+def index_storage(quantization: str) -> dict:
+    names = {index_name(kind, quantization=quantization) for kind in ("hnsw", "ivfflat")}
+    indexes = [row for row in list_ann_indexes() if row["name"] in names and row["valid"]]
+    return {"indexes": [row["name"] for row in indexes], "index_bytes": sum(row["size_bytes"] for row in indexes)}
+
+def exact_results(session: Session, queries, k: int, strategy: str):
+    results = []
+    for query in queries:
+        session.exec(text("SELECT set_config('enable_indexscan', 'off', true)"))
+        results.append([doc["id"] for doc in search_documents(session, query, k, strategy, ranking="sql", quantization="none")])
+        session.rollback()
+    return results
+
+def measure_mode(session: Session, queries, k: int, strategy: str, quantization: str, exact, repeats: int):
+    latencies, recalls = [], []
+    for query, truth in zip(queries, exact):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            found = search_documents(session, query, k, strategy, ranking="sql", quantization=quantization)
+            latencies.append((time.perf_counter() - start) * 1000)
+            session.rollback()
+        recalls.append(len({doc["id"] for doc in found} & set(truth)) / max(len(truth), 1))
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        f"recall@{k}": float(np.mean(recalls)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare storage, latency and recall of quantized candidate generation")
+    parser.add_argument("--modes", nargs="+", choices=sorted(QUANTIZATIONS), default=["none", "halfvec", "binary"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--strategy", default="log")
+    parser.add_argument("--kind", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--build", action="store_true", help="create missing quantized indexes before measuring")
+    parser.add_argument("--output", default="data/quantization_report.json")
+    args = parser.parse_args()
+
+    init_db()
+    check_db_data()
+    if args.build:
+        for quantization in args.modes:
+            create_index(args.kind, quantization=quantization)
+
+    queries = [q_text for _, q_text in get_valid_queries(limit=args.queries)]
+    encode_queries(queries)
+
+    report = []
+    with Session(engine) as session:
+        logger.info("Computing exact top-k with a sequential scan...")
+        exact = exact_results(session, queries, args.k, args.strategy)
+        for quantization in args.modes:
+            logger.info(f"Measuring '{quantization}'...")
+            row = {"mode": quantization, **vector_storage(session, quantization), **index_storage(quantization)}
+            row.update(measure_mode(session, queries, args.k, args.strategy, quantization, exact, args.repeats))
+            report.append(row)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'mode':>8} | {'vec bytes':>9} | {'index MB':>8} | {'p50 ms':>7} | {'p95 ms':>7} | recall@{args.k}")
+    for row in report:
+        print(
+            f"{row['mode']:>8} | {row['bytes_per_vector']:9.0f} | {row['index_bytes'] / 2**20:8.1f} | "
+            f"{row['p50_ms']:7.2f} | {row['p95_ms']:7.2f} | {row[f'recall@{args.k}']:.3f}"
+        )
+    logger.info(f"Report saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
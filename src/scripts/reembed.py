@@ -0,0 +1,40 @@
+import argparse
+import json
+import logging
+
+from sqlmodel import Session
+
+from src.database import engine, init_db
+from src.embeddings import ReembedJob, list_versions, refresh_active_model
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("reembed")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-embed the corpus with a new model of the same dimension (EMBEDDING_DIM) without downtime"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    p = sub.add_parser("run")
+    p.add_argument("--model", required=True)
+    p.add_argument("--batch-size", type=int, default=128)
+    p.add_argument("--sleep-ms", type=float, default=50, help="pause between batches to throttle DB load")
+    p.add_argument("--index-kind", choices=["hnsw", "ivfflat"], default="hnsw")
+    p.add_argument("--no-switch", action="store_true", help="fill the shadow column and index but keep serving the old model")
+    args = parser.parse_args()
+
+    init_db()
+    refresh_active_model()
+
+    if args.command == "status":
+        with Session(engine) as session:
+            print(json.dumps([v.model_dump() for v in list_versions(session)], indent=2, default=str))
+        return
+
+    job = ReembedJob(args.model, args.batch_size, args.sleep_ms, args.index_kind)
+    if job.run(switch=not args.no_switch):
+        logger.info(f"Serving workers were notified to switch to {args.model}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session
+
+from src.index import default_quantization
+from src.ml import encode_queries
+from src.ranking import score_candidates
+from src.search import batch_candidates, candidates_limit_for
+
+MISSING_RANK = 21
+
+def load_candidates(
+    session: Session,
+    queries: List[tuple],
+    limit: int = 20,
+    batch_size: int = 64,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    candidates = []
+    for i in range(0, len(queries), batch_size):
+        vectors = encode_queries([q_text for _, q_text in queries[i : i + batch_size]])
+        for query_candidates in batch_candidates(session, vectors, candidates_limit_for(limit), quantization=default_quantization()):
+            ids = np.array([doc_id for doc_id, _ in query_candidates], dtype=np.int64)
+            similarities = 1 - np.array([distance for _, distance in query_candidates], dtype=np.float64)
+            candidates.append((ids, similarities))
+    return candidates
+
+class ClickSimulator:
+    def __init__(self, queries: List[tuple], candidates: List[Tuple[np.ndarray, np.ndarray]], limit: int = 20):
+        self.limit = limit
+        self.index = {q_id: i for i, (q_id, _) in enumerate(queries)}
+        self.ids = [ids for ids, _ in candidates]
+        self.similarities = [similarities for _, similarities in candidates]
+        self.doc_ids = np.unique(np.concatenate(self.ids)) if self.ids else np.array([], dtype=np.int64)
+        self.slots = [np.searchsorted(self.doc_ids, ids) for ids in self.ids]
+
+    @classmethod
+    def from_database(cls, session: Session, queries: List[tuple], limit: int = 20) -> "ClickSimulator":
+        return cls(queries, load_candidates(session, queries, limit), limit)
+
+    def rank(self, q: int, strategy: str, feedback: np.ndarray) -> np.ndarray:
+        scores = score_candidates(strategy, self.similarities[q], feedback[self.slots[q]])
+        return self.ids[q][np.argsort(-scores, kind="stable")[: self.limit]]
+
+    def rank_of(self, ranked: np.ndarray, doc_id: int) -> int:
+        hits = np.flatnonzero(ranked == doc_id)
+        return int(hits[0]) + 1 if len(hits) else MISSING_RANK
+
+    def run(
+        self,
+        exp_name: str,
+        strategies: List[str],
+        queries: List[tuple],
+        max_clicks: int,
+        noise_prob: float,
+        checkpoints: List[int],
+        rng: Optional[random.Random] = None,
+    ) -> List[Dict]:
+        rng = rng or random
+        checkpoints = set(checkpoints)
+        raw_data = []
+
+        for strategy in strategies:
+            feedback = np.zeros(len(self.doc_ids), dtype=np.int64)
+            initial = [self.rank(self.index[q_id], strategy, feedback) for q_id, _ in queries]
+
+            for (q_id, _), results_init in zip(queries, initial):
+                if len(results_init) < 5:
+                    continue
+                q = self.index[q_id]
+                target_id = int(results_init[4])
+                distractor_id = int(results_init[0])
+                if distractor_id == target_id and len(results_init) > 1:
+                    distractor_id = int(results_init[1])
+                target_slot = int(np.searchsorted(self.doc_ids, target_id))
+                distractor_slot = int(np.searchsorted(self.doc_ids, distractor_id))
+
+                if 0 in checkpoints:
+                    raw_data.append({
+                        "experiment": exp_name,
+                        "strategy": strategy,
+                        "query_id": q_id,
+                        "clicks": 0,
+                        "target_rank": 5,
+                        "distractor_rank": 1,
+                        "is_noisy": False
+                    })
+
+                for clicks in range(1, max_clicks + 1):
+                    is_noise = rng.random() < noise_prob
+                    feedback[distractor_slot if is_noise else target_slot] += 1
+
+                    if clicks in checkpoints:
+                        ranked = self.rank(q, strategy, feedback)
+                        raw_data.append({
+                            "experiment": exp_name,
+                            "strategy": strategy,
+                            "query_id": q_id,
+                            "clicks": clicks,
+                            "target_rank": self.rank_of(ranked, target_id),
+                            "distractor_rank": self.rank_of(ranked, distractor_id),
+                            "is_noisy": is_noise
+                        })
+
+        return raw_data
@@ -0,0 +1,34 @@
+import argparse
+import glob
+import json
+import logging
+import os
+
+from src.database import init_db
+from src.embeddings import refresh_active_model
+from src.snapshot import get_snapshot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("vector_snapshot")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export documents.embedding to the memory-mapped candidate snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    sub.add_parser("refresh", help="append documents added since the last watermark")
+    sub.add_parser("rebuild", help="drop the snapshot files and export from scratch")
+    args = parser.parse_args()
+
+    init_db()
+    snapshot = get_snapshot(refresh_active_model())
+    if args.command == "rebuild":
+        for path in glob.glob(f"{glob.escape(snapshot.prefix)}.*"):
+            if not path.endswith(".lock"):
+                os.remove(path)
+    if args.command in ("refresh", "rebuild"):
+        logger.info(f"Appended {snapshot.refresh()} rows")
+    snapshot.load()
+    print(json.dumps(snapshot.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,1045 @@
-import math
-from typing import List, Dict, Any
-from sqlmodel import Session, select, text, func
-from src.database import Document, Interaction
-from src.ml import get_model
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Float, Integer, bindparam
+from sqlmodel import Session, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.database import Document, ANN_EF_SEARCH, DEFAULT_NAMESPACE
+from src.feedback import (
+    FEEDBACK_SCOPES,
+    decay_enabled,
+    default_feedback_scope,
+    feedback_value_sql,
+    get_max_feedback,
+    get_max_feedback_async,
+    get_scoped_feedback_maps,
+    get_scoped_feedback_maps_async,
+    global_feedback_weight,
+    query_key,
+)
+from src.index import (
+    default_quantization,
+    iterative_scan_enabled,
+    partial_index_categories,
+    quantized_distance_sql,
+    resolve_quantization,
+)
+from src.metrics import collect_timings, set_label, stage
+from src.ml import encode_query, encode_query_async, encode_queries, get_model_name
+from src.ranking import get_strategy, score_candidates, score_sql, score_upper_bound
+from src.snapshot import ENGINES, default_engine, ensure_snapshot
 
 def calculate_boost(strategy: str, similarity: float, feedback: int) -> float:
-    safe_feedback = max(0, feedback)
-    
-    if strategy == "log":
-        return similarity * (1 + 0.05 * math.log(1 + safe_feedback))
-        
-    elif strategy == "linear":
-        return similarity + (0.001 * safe_feedback)
-        
-    elif strategy == "sigmoid":
-        k = 50
-        boost = safe_feedback / (safe_feedback + k)
-        return similarity * (1 + 0.5 * boost)
-        
-    return similarity
-
-def search_documents(session: Session, query: str, limit: int = 10, strategy: str = "log") -> List[Dict[str, Any]]:
-    model = get_model()
-    query_vector = model.encode(query).tolist()
-    
-    candidates_limit = max(50, limit * 2)
-    stmt = select(
-        Document, 
-        (Document.embedding.cosine_distance(query_vector)).label("distance")
-    ).order_by(text("distance ASC")).limit(candidates_limit)
-    
-    results = session.exec(stmt).all()
-    if not results:
+    return float(score_candidates(strategy, [similarity], [feedback])[0])
+
+HNSW_MAX_EF_SEARCH = 1000
+
+def candidates_limit_for(limit: int) -> int:
+    return max(50, limit * 2)
+
+def rescore_factor() -> int:
+    return int(os.getenv("QUANTIZED_RESCORE_FACTOR", "4"))
+
+def approx_limit_for(candidates_limit: int, quantization: str) -> int:
+    if quantization == "none":
+        return candidates_limit
+    return candidates_limit * rescore_factor()
+
+@dataclass(frozen=True)
+class SearchFilters:
+    category: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    def __bool__(self) -> bool:
+        return any(value is not None for value in (self.category, self.created_after, self.created_before))
+
+    def conditions(self, alias: str = "") -> List[str]:
+        prefix = f"{alias}." if alias else ""
+        conditions = []
+        if self.category is not None:
+            conditions.append(f"{prefix}category = :filter_category")
+        if self.created_after is not None:
+            conditions.append(f"{prefix}created_at >= :filter_created_after")
+        if self.created_before is not None:
+            conditions.append(f"{prefix}created_at < :filter_created_before")
+        return conditions
+
+    def where(self, alias: str = "", keyword: str = "WHERE") -> str:
+        conditions = self.conditions(alias)
+        return f"{keyword} {' AND '.join(conditions)}" if conditions else ""
+
+    def params(self) -> Dict[str, Any]:
+        params = {
+            "filter_category": self.category,
+            "filter_created_after": self.created_after,
+            "filter_created_before": self.created_before,
+        }
+        return {key: value for key, value in params.items() if value is not None}
+
+    def clauses(self) -> List[Any]:
+        clauses = []
+        if self.category is not None:
+            clauses.append(Document.category == self.category)
+        if self.created_after is not None:
+            clauses.append(Document.created_at >= self.created_after)
+        if self.created_before is not None:
+            clauses.append(Document.created_at < self.created_before)
+        return clauses
+
+NO_FILTERS = SearchFilters()
+FILTER_PATHS = ("unfiltered", "partial_index", "iterative_scan", "post_filter")
+
+def filter_path(filters: SearchFilters) -> str:
+    if not filters:
+        return "unfiltered"
+    if filters.category is not None and filters.category in partial_index_categories():
+        return "partial_index"
+    if iterative_scan_enabled():
+        return "iterative_scan"
+    return "post_filter"
+
+def filter_settings(path: str) -> Dict[str, str]:
+    if path == "unfiltered":
+        return {}
+    settings = {"plan_cache_mode": "force_custom_plan"}
+    if path != "post_filter" and iterative_scan_enabled():
+        settings["hnsw.iterative_scan"] = "strict_order"
+        settings["ivfflat.iterative_scan"] = "relaxed_order"
+    return settings
+
+def filtered_ef_search() -> int:
+    return int(os.getenv("FILTER_EF_SEARCH", "1000"))
+
+def resolve_filters(
+    filters: Optional[SearchFilters], ef_search: Optional[int]
+) -> Tuple[SearchFilters, Optional[int], Dict[str, str]]:
+    filters = filters or NO_FILTERS
+    path = filter_path(filters)
+    if path != "unfiltered":
+        set_label("filter_path", path)
+    if path == "post_filter" and ef_search is None:
+        ef_search = filtered_ef_search()
+    return filters, ef_search, filter_settings(path)
+
+def ann_settings_statement(
+    candidates_limit: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    extra: Optional[Dict[str, str]] = None,
+) -> Optional[Tuple[Any, Dict[str, str]]]:
+    if ef_search is None and candidates_limit > ANN_EF_SEARCH:
+        ef_search = candidates_limit
+
+    settings = {}
+    if ef_search is not None:
+        settings["hnsw.ef_search"] = str(min(int(ef_search), HNSW_MAX_EF_SEARCH))
+    if candidates_limit > HNSW_MAX_EF_SEARCH and iterative_scan_enabled():
+        settings["hnsw.iterative_scan"] = "strict_order"
+    if probes is not None:
+        settings["ivfflat.probes"] = str(int(probes))
+    settings.update(extra or {})
+    if not settings:
+        return None
+
+    calls = ", ".join(f"set_config('{name}', :v{i}, true)" for i, name in enumerate(settings))
+    params = {f"v{i}": value for i, value in enumerate(settings.values())}
+    return text(f"SELECT {calls}"), params
+
+def default_ranking() -> str:
+    return os.getenv("SEARCH_RANKING", "sql")
+
+DEPTHS = ("fixed", "adaptive")
+
+def resolve_depth(depth: Optional[str], quantization: str) -> str:
+    depth = depth or os.getenv("CANDIDATE_DEPTH", "fixed")
+    if depth not in DEPTHS:
+        raise ValueError(f"Unknown candidate depth '{depth}', expected one of {list(DEPTHS)}")
+    if depth == "adaptive" and quantization != "none":
+        raise ValueError("Adaptive candidate depth requires quantization 'none'")
+    return depth
+
+def adaptive_max_depth() -> int:
+    return int(os.getenv("ADAPTIVE_MAX_DEPTH", "1000"))
+
+def resolve_engine(engine: Optional[str], depth: str, filters: Optional[SearchFilters]) -> str:
+    engine = engine or default_engine()
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown candidate engine '{engine}', expected one of {list(ENGINES)}")
+    if engine == "snapshot" and (depth == "adaptive" or filters):
+        raise ValueError("The snapshot candidate engine supports neither adaptive depth nor filters")
+    return engine
+
+def candidates_cte(quantization: str = "none", filters: SearchFilters = NO_FILTERS) -> str:
+    if quantization == "none":
+        return f"""
+            candidates AS (
+                SELECT id, embedding <=> CAST(:query_vector AS vector) AS distance
+                FROM documents
+                {filters.where()}
+                ORDER BY embedding <=> CAST(:query_vector AS vector)
+                LIMIT :candidates_limit
+            )"""
+    return f"""
+            approx AS (
+                SELECT id, embedding
+                FROM documents
+                {filters.where()}
+                ORDER BY {quantized_distance_sql(quantization, "embedding", "CAST(:query_vector AS vector)")}
+                LIMIT :approx_limit
+            ), candidates AS (
+                SELECT a.id, a.embedding <=> CAST(:query_vector AS vector) AS distance
+                FROM approx a
+                ORDER BY distance
+                LIMIT :candidates_limit
+            )"""
+
+def resolve_feedback_scope(scope: Optional[str]) -> str:
+    scope = scope or default_feedback_scope()
+    if scope not in FEEDBACK_SCOPES:
+        raise ValueError(f"Unknown feedback scope '{scope}', expected one of {list(FEEDBACK_SCOPES)}")
+    return scope
+
+FEEDBACK_JOINS = {
+    "global": "LEFT JOIN document_feedback f ON f.namespace = :namespace AND f.document_id = c.id",
+    "query": "LEFT JOIN query_feedback qf ON qf.namespace = :namespace AND qf.query_key = :query_key AND qf.document_id = c.id",
+}
+FEEDBACK_EXPRESSIONS = {
+    "global": "COALESCE({f}, 0)",
+    "query": "COALESCE({qf}, 0)",
+    "blend": "COALESCE({qf}, :global_weight * COALESCE({f}, 0))",
+}
+
+def feedback_params(scope: str, key: str) -> Dict[str, Any]:
+    params = {}
+    if scope != "global":
+        params["query_key"] = key
+    if scope == "blend":
+        params["global_weight"] = global_feedback_weight()
+    return params
+
+def sql_ranking_statement(
+    strategy: str,
+    quantization: str = "none",
+    scope: str = "global",
+    decay: bool = False,
+    with_candidates: bool = False,
+    filters: SearchFilters = NO_FILTERS,
+):
+    score_expr = score_sql(strategy, "s.similarity", "s.feedback")
+    joins = "\n            ".join(FEEDBACK_JOINS[kind] for kind in ("global", "query") if scope in (kind, "blend"))
+    feedback_expr = FEEDBACK_EXPRESSIONS[scope].format(f=feedback_value_sql("f", decay), qf=feedback_value_sql("qf", decay))
+    candidate_ids = ",\n               (SELECT array_agg(id) FROM candidates) AS candidate_ids" if with_candidates else ""
+    return text(f"""
+        WITH {candidates_cte(quantization, filters)}, scored AS (
+            SELECT c.id, c.distance, 1 - c.distance AS similarity,
+                   {feedback_expr} AS feedback
+            FROM candidates c
+            {joins}
+        ), ranked AS (
+            SELECT s.id, s.distance, s.similarity, s.feedback, {score_expr} AS score
+            FROM scored s
+            ORDER BY score DESC, s.distance ASC
+            LIMIT :limit
+        )
+        SELECT r.id, d.content, d.category, r.score,
+               r.similarity AS original_score, r.feedback AS feedback_score{candidate_ids}
+        FROM ranked r
+        JOIN documents d ON d.id = r.id
+        ORDER BY r.score DESC, r.distance ASC
+    """).bindparams(bindparam("query_vector", type_=Vector()))
+
+def candidates_statement(
+    query_vector: List[float],
+    candidates_limit: int,
+    quantization: str = "none",
+    approx_limit: Optional[int] = None,
+    filters: SearchFilters = NO_FILTERS,
+):
+    if quantization == "none":
+        return select(
+            Document, 
+            (Document.embedding.cosine_distance(query_vector)).label("distance")
+        ).where(*filters.clauses()).order_by(text("distance ASC")).limit(candidates_limit)
+
+    rescored = text(f"""
+        SELECT a.id, a.embedding <=> CAST(:query_vector AS vector) AS distance
+        FROM (
+            SELECT id, embedding FROM documents
+            {filters.where()}
+            ORDER BY {quantized_distance_sql(quantization, "embedding", "CAST(:query_vector AS vector)")}
+            LIMIT :approx_limit
+        ) a
+        ORDER BY distance
+        LIMIT :candidates_limit
+    """).bindparams(
+        bindparam("query_vector", value=query_vector, type_=Vector()),
+        approx_limit=approx_limit or candidates_limit,
+        candidates_limit=candidates_limit,
+        **filters.params(),
+    ).columns(id=Integer, distance=Float).subquery("rescored")
+    return select(Document, rescored.c.distance).join(rescored, Document.id == rescored.c.id).order_by(rescored.c.distance)
+
+def rerank_candidates(results, feedback_map: Dict[int, int], strategy: str, limit: int) -> List[Dict[str, Any]]:
+    similarities = 1 - np.array([distance for _, distance in results], dtype=np.float64)
+    feedbacks = np.array([feedback_map.get(doc.id, 0) for doc, _ in results], dtype=np.float64)
+    scores = score_candidates(strategy, similarities, feedbacks)
+    order = np.argsort(-scores, kind="stable")[:limit]
+
+    return [
+        {
+            "id": results[i][0].id,
+            "content": results[i][0].content,
+            "category": results[i][0].category,
+            "score": float(scores[i]),
+            "original_score": float(similarities[i]),
+            "feedback_score": float(feedbacks[i]),
+        }
+        for i in order
+    ]
+
+def keyset_candidates_statement(filters: SearchFilters = NO_FILTERS):
+    return text(f"""
+        SELECT id, embedding <=> CAST(:query_vector AS vector) AS distance
+        FROM documents
+        WHERE embedding <=> CAST(:query_vector AS vector) >= :last_distance
+        {filters.where(keyword="AND")}
+        ORDER BY embedding <=> CAST(:query_vector AS vector)
+        LIMIT :page_size
+    """).bindparams(bindparam("query_vector", type_=Vector()))
+
+class AdaptiveDepth:
+    def __init__(self, strategy: str, limit: int, max_feedback: float, max_depth: int):
+        self.strategy = strategy
+        self.limit = limit
+        self.max_feedback = max_feedback
+        self.max_depth = max(max_depth, limit)
+        self.ids: List[int] = []
+        self.distances: List[float] = []
+        self.feedbacks: List[float] = []
+        self.scores = np.empty(0)
+        self.page_size = limit
+        self.last_distance = -1.0
+        self.done = limit <= 0
+
+    def request_size(self) -> int:
+        ties = sum(1 for distance in reversed(self.distances) if distance == self.last_distance) if self.distances else 0
+        return self.page_size + ties
+
+    def ann_depth(self) -> int:
+        return len(self.ids) + self.request_size()
+
+    def params(self, query_vector: List[float]) -> Dict[str, Any]:
+        return {"query_vector": query_vector, "last_distance": self.last_distance, "page_size": self.request_size()}
+
+    def accept(self, rows) -> List[Tuple[int, float]]:
+        seen = set(self.ids)
+        fresh = [(doc_id, distance) for doc_id, distance in rows if doc_id not in seen][: self.page_size]
+        if len(rows) < self.request_size() or not fresh:
+            self.done = True
+        return fresh
+
+    def add(self, rows: List[Tuple[int, float]], feedback_map: Dict[int, float]) -> None:
+        for doc_id, distance in rows:
+            self.ids.append(doc_id)
+            self.distances.append(distance)
+            self.feedbacks.append(feedback_map.get(doc_id, 0))
+        if not self.ids:
+            return
+        self.last_distance = self.distances[-1]
+        similarities = 1 - np.array(self.distances, dtype=np.float64)
+        self.scores = score_candidates(self.strategy, similarities, self.feedbacks)
+        if len(self.ids) >= self.limit:
+            kth = np.partition(self.scores, -self.limit)[-self.limit]
+            if kth >= score_upper_bound(self.strategy, [1 - self.last_distance], self.max_feedback)[0]:
+                self.done = True
+        if len(self.ids) >= self.max_depth:
+            self.done = True
+        self.page_size = min(len(self.ids), self.max_depth - len(self.ids))
+
+    def winners(self) -> List[int]:
+        return [int(i) for i in np.argsort(-self.scores, kind="stable")[: self.limit]]
+
+    def results(self, docs: Dict[int, Any]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": self.ids[i],
+                "content": docs[self.ids[i]].content,
+                "category": docs[self.ids[i]].category,
+                "score": float(self.scores[i]),
+                "original_score": float(1 - self.distances[i]),
+                "feedback_score": float(self.feedbacks[i]),
+            }
+            for i in self.winners()
+        ]
+
+def winner_documents_statement(doc_ids: List[int]):
+    return select(Document.id, Document.content, Document.category).where(Document.id.in_(doc_ids))
+
+def snapshot_candidates(query_vector: List[float], candidates_limit: int, quantization: str) -> Tuple[np.ndarray, np.ndarray]:
+    mode = "binary" if quantization == "binary" else "exact"
+    snapshot = ensure_snapshot(get_model_name())
+    return snapshot.search(query_vector, candidates_limit, mode, approx_limit_for(candidates_limit, quantization))
+
+def rank_candidate_ids(
+    ids: np.ndarray, distances: np.ndarray, feedback_map: Dict[int, float], strategy: str, limit: int
+) -> List[Tuple[int, float, float, float]]:
+    similarities = 1 - distances
+    feedbacks = np.array([feedback_map.get(int(doc_id), 0) for doc_id in ids], dtype=np.float64)
+    scores = score_candidates(strategy, similarities, feedbacks)
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [(int(ids[i]), float(scores[i]), float(similarities[i]), float(feedbacks[i])) for i in order]
+
+def ranked_results(ranked: List[Tuple[int, float, float, float]], docs: Dict[int, Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": doc_id,
+            "content": docs[doc_id].content,
+            "category": docs[doc_id].category,
+            "score": score,
+            "original_score": similarity,
+            "feedback_score": feedback,
+        }
+        for doc_id, score, similarity, feedback in ranked
+        if doc_id in docs
+    ]
+
+@dataclass
+class SearchPlan:
+    key: str
+    limit: int
+    strategy: str
+    quantization: str
+    scope: str
+    decay: bool
+    depth: str
+    engine: str
+    ranking: str
+    candidates_limit: int
+    approx_limit: int
+    namespace: str
+    filters: SearchFilters
+    ef_search: Optional[int]
+    probes: Optional[int]
+    extra: Dict[str, str]
+
+    def settings(self, candidates_limit: Optional[int] = None) -> Optional[Tuple[Any, Dict[str, str]]]:
+        return ann_settings_statement(candidates_limit or self.approx_limit, self.ef_search, self.probes, self.extra)
+
+    def feedback_args(self, doc_ids: List[int]) -> tuple:
+        return doc_ids, [self.key], self.namespace, self.scope, self.decay
+
+def plan_search(
+    query: str,
+    limit: int = 10,
+    strategy: str = "log",
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    ranking: Optional[str] = None,
+    quantization: Optional[str] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+    feedback_scope: Optional[str] = None,
+    decay: Optional[bool] = None,
+    depth: Optional[str] = None,
+    filters: Optional[SearchFilters] = None,
+    engine: Optional[str] = None,
+    candidates_limit: Optional[int] = None,
+) -> SearchPlan:
+    get_strategy(strategy)
+    quantization = quantization or default_quantization()
+    resolve_quantization(quantization)
+    scope = resolve_feedback_scope(feedback_scope)
+    depth = resolve_depth(depth, quantization)
+    engine = resolve_engine(engine, depth, filters)
+    filters, ef_search, extra = resolve_filters(filters, ef_search)
+    candidates_limit = candidates_limit or candidates_limit_for(limit)
+    return SearchPlan(
+        key=query_key(query),
+        limit=limit,
+        strategy=strategy,
+        quantization=quantization,
+        scope=scope,
+        decay=decay_enabled() if decay is None else decay,
+        depth=depth,
+        engine=engine,
+        ranking=ranking or default_ranking(),
+        candidates_limit=candidates_limit,
+        approx_limit=approx_limit_for(candidates_limit, quantization),
+        namespace=namespace,
+        filters=filters,
+        ef_search=ef_search,
+        probes=probes,
+        extra=extra,
+    )
+
+def execute_settings(session: Session, settings: Optional[Tuple[Any, Dict[str, str]]]) -> None:
+    if settings is not None:
+        stmt, params = settings
+        session.exec(stmt, params=params)
+
+async def execute_settings_async(session: AsyncSession, settings: Optional[Tuple[Any, Dict[str, str]]]) -> None:
+    if settings is not None:
+        stmt, params = settings
+        await session.exec(stmt, params=params)
+
+def ranked_documents(session: Session, ranked: List[Tuple[int, float, float, float]]) -> List[Dict[str, Any]]:
+    if not ranked:
+        return []
+    docs = {row.id: row for row in session.exec(winner_documents_statement([doc_id for doc_id, *_ in ranked])).all()}
+    return ranked_results(ranked, docs)
+
+async def ranked_documents_async(session: AsyncSession, ranked: List[Tuple[int, float, float, float]]) -> List[Dict[str, Any]]:
+    if not ranked:
         return []
+    docs = {row.id: row for row in (await session.exec(winner_documents_statement([doc_id for doc_id, *_ in ranked]))).all()}
+    return ranked_results(ranked, docs)
+
+def search_documents(
+    session: Session,
+    query: str,
+    limit: int = 10,
+    strategy: str = "log",
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    ranking: Optional[str] = None,
+    quantization: Optional[str] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+    feedback_scope: Optional[str] = None,
+    decay: Optional[bool] = None,
+    candidates_out: Optional[List[int]] = None,
+    depth: Optional[str] = None,
+    filters: Optional[SearchFilters] = None,
+    engine: Optional[str] = None,
+    candidates_limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    plan = plan_search(
+        query, limit, strategy, ef_search, probes, ranking, quantization, namespace, feedback_scope, decay, depth,
+        filters, engine, candidates_limit,
+    )
+    with stage("encode"):
+        query_vector = encode_query(query).tolist()
+    if plan.engine == "snapshot":
+        return rank_snapshot(session, plan, query_vector, candidates_out)
+    if plan.depth == "adaptive":
+        return rank_adaptive(session, plan, query_vector, candidates_out)
+    with stage("ann_settings"):
+        execute_settings(session, plan.settings())
+    if plan.ranking == "sql":
+        return rank_in_sql(session, plan, query_vector, candidates_out)
+    return rank_in_python(session, plan, query_vector, candidates_out)
+
+async def search_documents_async(
+    session: AsyncSession,
+    query: str,
+    limit: int = 10,
+    strategy: str = "log",
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    ranking: Optional[str] = None,
+    quantization: Optional[str] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+    feedback_scope: Optional[str] = None,
+    decay: Optional[bool] = None,
+    candidates_out: Optional[List[int]] = None,
+    depth: Optional[str] = None,
+    filters: Optional[SearchFilters] = None,
+    engine: Optional[str] = None,
+    candidates_limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    plan = plan_search(
+        query, limit, strategy, ef_search, probes, ranking, quantization, namespace, feedback_scope, decay, depth,
+        filters, engine, candidates_limit,
+    )
+    with stage("encode"):
+        query_vector = (await encode_query_async(query)).tolist()
+    if plan.engine == "snapshot":
+        return await rank_snapshot_async(session, plan, query_vector, candidates_out)
+    if plan.depth == "adaptive":
+        return await rank_adaptive_async(session, plan, query_vector, candidates_out)
+    with stage("ann_settings"):
+        await execute_settings_async(session, plan.settings())
+    if plan.ranking == "sql":
+        return await rank_in_sql_async(session, plan, query_vector, candidates_out)
+    return await rank_in_python_async(session, plan, query_vector, candidates_out)
+
+def sql_ranking_query(plan: SearchPlan, query_vector: List[float], with_candidates: bool) -> Tuple[Any, Dict[str, Any]]:
+    statement = sql_ranking_statement(plan.strategy, plan.quantization, plan.scope, plan.decay, with_candidates, plan.filters)
+    return statement, {
+        "query_vector": query_vector,
+        "candidates_limit": plan.candidates_limit,
+        "approx_limit": plan.approx_limit,
+        "limit": plan.limit,
+        "namespace": plan.namespace,
+        **feedback_params(plan.scope, plan.key),
+        **plan.filters.params(),
+    }
+
+def collect_sql_rows(rows, candidates_out: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    results = [dict(row) for row in rows]
+    if candidates_out is not None and results:
+        candidates_out.extend(results[0]["candidate_ids"])
+        for row in results:
+            del row["candidate_ids"]
+    return results
 
+def rank_in_sql(
+    session: Session, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    statement, params = sql_ranking_query(plan, query_vector, candidates_out is not None)
+    with stage("sql_rank"):
+        rows = session.exec(statement, params=params).mappings().all()
+    return collect_sql_rows(rows, candidates_out)
+
+async def rank_in_sql_async(
+    session: AsyncSession, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    statement, params = sql_ranking_query(plan, query_vector, candidates_out is not None)
+    with stage("sql_rank"):
+        rows = (await session.exec(statement, params=params)).mappings().all()
+    return collect_sql_rows(rows, candidates_out)
+
+def plan_candidates_statement(plan: SearchPlan, query_vector: List[float]):
+    return candidates_statement(query_vector, plan.candidates_limit, plan.quantization, plan.approx_limit, plan.filters)
+
+def candidate_ids(results, candidates_out: Optional[List[int]] = None) -> List[int]:
     doc_ids = [doc.id for doc, _ in results]
-    
-    feedback_stmt = select(
-        Interaction.document_id,
-        func.sum(Interaction.score_delta).label("total_score")
-    ).where(Interaction.document_id.in_(doc_ids)).group_by(Interaction.document_id)
-    
-    feedback_map = {row.document_id: row.total_score for row in session.exec(feedback_stmt).all()}
-
-    processed_results = []
-    for doc, distance in results:
-        similarity = 1 - distance
-        feedback = feedback_map.get(doc.id, 0)
-        
-        final_score = calculate_boost(strategy, similarity, feedback)
-        
-        processed_results.append({
-            "id": doc.id,
-            "content": doc.content,
-            "category": doc.category,
-            "score": final_score,
-            "original_score": similarity,
-            "feedback_score": feedback
+    if candidates_out is not None:
+        candidates_out.extend(doc_ids)
+    return doc_ids
+
+def rank_in_python(
+    session: Session, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    with stage("candidates"):
+        results = session.exec(plan_candidates_statement(plan, query_vector)).all()
+    if not results:
+        return []
+    doc_ids = candidate_ids(results, candidates_out)
+    with stage("feedback"):
+        feedback_map = get_scoped_feedback_maps(session, *plan.feedback_args(doc_ids))[plan.key]
+    with stage("rerank"):
+        return rerank_candidates(results, feedback_map, plan.strategy, plan.limit)
+
+async def rank_in_python_async(
+    session: AsyncSession, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    with stage("candidates"):
+        results = (await session.exec(plan_candidates_statement(plan, query_vector))).all()
+    if not results:
+        return []
+    doc_ids = candidate_ids(results, candidates_out)
+    with stage("feedback"):
+        feedback_map = (await get_scoped_feedback_maps_async(session, *plan.feedback_args(doc_ids)))[plan.key]
+    with stage("rerank"):
+        return rerank_candidates(results, feedback_map, plan.strategy, plan.limit)
+
+def adaptive_winners(ranker: AdaptiveDepth, candidates_out: Optional[List[int]] = None) -> List[int]:
+    if candidates_out is not None:
+        candidates_out.extend(ranker.ids)
+    return [ranker.ids[i] for i in ranker.winners()]
+
+def rank_adaptive(
+    session: Session, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    with stage("feedback"):
+        max_feedback = get_max_feedback(session, plan.namespace, plan.scope, plan.key, plan.decay)
+    ranker = AdaptiveDepth(plan.strategy, plan.limit, max_feedback, adaptive_max_depth())
+    statement = keyset_candidates_statement(plan.filters)
+    while not ranker.done:
+        with stage("candidates"):
+            execute_settings(session, plan.settings(ranker.ann_depth()))
+            rows = ranker.accept(session.exec(statement, params={**ranker.params(query_vector), **plan.filters.params()}).all())
+        if not rows:
+            break
+        with stage("feedback"):
+            feedback_map = get_scoped_feedback_maps(session, *plan.feedback_args([doc_id for doc_id, _ in rows]))[plan.key]
+        with stage("rerank"):
+            ranker.add(rows, feedback_map)
+
+    winners = adaptive_winners(ranker, candidates_out)
+    if not winners:
+        return []
+    with stage("content"):
+        docs = {row.id: row for row in session.exec(winner_documents_statement(winners)).all()}
+    return ranker.results(docs)
+
+async def rank_adaptive_async(
+    session: AsyncSession, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    with stage("feedback"):
+        max_feedback = await get_max_feedback_async(session, plan.namespace, plan.scope, plan.key, plan.decay)
+    ranker = AdaptiveDepth(plan.strategy, plan.limit, max_feedback, adaptive_max_depth())
+    statement = keyset_candidates_statement(plan.filters)
+    while not ranker.done:
+        with stage("candidates"):
+            await execute_settings_async(session, plan.settings(ranker.ann_depth()))
+            params = {**ranker.params(query_vector), **plan.filters.params()}
+            rows = ranker.accept((await session.exec(statement, params=params)).all())
+        if not rows:
+            break
+        with stage("feedback"):
+            doc_ids = [doc_id for doc_id, _ in rows]
+            feedback_map = (await get_scoped_feedback_maps_async(session, *plan.feedback_args(doc_ids)))[plan.key]
+        with stage("rerank"):
+            ranker.add(rows, feedback_map)
+
+    winners = adaptive_winners(ranker, candidates_out)
+    if not winners:
+        return []
+    with stage("content"):
+        docs = {row.id: row for row in (await session.exec(winner_documents_statement(winners))).all()}
+    return ranker.results(docs)
+
+def snapshot_ids(ids: np.ndarray, candidates_out: Optional[List[int]] = None) -> List[int]:
+    doc_ids = [int(doc_id) for doc_id in ids]
+    if candidates_out is not None:
+        candidates_out.extend(doc_ids)
+    return doc_ids
+
+def rank_snapshot(
+    session: Session, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    with stage("candidates"):
+        ids, distances = snapshot_candidates(query_vector, plan.candidates_limit, plan.quantization)
+    if not len(ids):
+        return []
+    doc_ids = snapshot_ids(ids, candidates_out)
+    with stage("feedback"):
+        feedback_map = get_scoped_feedback_maps(session, *plan.feedback_args(doc_ids))[plan.key]
+    with stage("rerank"):
+        ranked = rank_candidate_ids(ids, distances, feedback_map, plan.strategy, plan.limit)
+    with stage("content"):
+        return ranked_documents(session, ranked)
+
+async def rank_snapshot_async(
+    session: AsyncSession, plan: SearchPlan, query_vector: List[float], candidates_out: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    with stage("candidates"):
+        ids, distances = await asyncio.to_thread(snapshot_candidates, query_vector, plan.candidates_limit, plan.quantization)
+    if not len(ids):
+        return []
+    doc_ids = snapshot_ids(ids, candidates_out)
+    with stage("feedback"):
+        feedback_map = (await get_scoped_feedback_maps_async(session, *plan.feedback_args(doc_ids)))[plan.key]
+    with stage("rerank"):
+        ranked = rank_candidate_ids(ids, distances, feedback_map, plan.strategy, plan.limit)
+    with stage("content"):
+        return await ranked_documents_async(session, ranked)
+
+def keyset_plan(
+    query: str,
+    limit: int,
+    strategy: str,
+    ef_search: Optional[int],
+    probes: Optional[int],
+    namespace: str,
+    feedback_scope: Optional[str],
+    decay: Optional[bool],
+    filters: Optional[SearchFilters],
+) -> SearchPlan:
+    return plan_search(
+        query, limit, strategy, ef_search, probes, None, "none", namespace, feedback_scope, decay, "fixed", filters,
+        "postgres",
+    )
+
+def keyset_page_query(
+    plan: SearchPlan, query_vector: List[float], last_distance: float, seen: List[int], offset: int
+) -> Tuple[Optional[Tuple[Any, Dict[str, str]]], Any, Dict[str, Any]]:
+    page_size = plan.limit + len(seen)
+    extra = plan.extra
+    if iterative_scan_enabled():
+        extra = {**extra, "hnsw.iterative_scan": "strict_order"}
+    ef_search = min(offset + page_size, HNSW_MAX_EF_SEARCH) if plan.ef_search is None else plan.ef_search
+    params = {"query_vector": query_vector, "last_distance": last_distance, "page_size": page_size, **plan.filters.params()}
+    return ann_settings_statement(page_size, ef_search, plan.probes, extra), keyset_candidates_statement(plan.filters), params
+
+def keyset_page_rows(rows, seen: List[int], limit: int) -> List[Tuple[int, float]]:
+    excluded = set(seen)
+    return [(doc_id, distance) for doc_id, distance in rows if doc_id not in excluded][:limit]
+
+def rank_rows(
+    rows: List[Tuple[int, float]], feedback_map: Dict[int, float], strategy: str, limit: int
+) -> List[Tuple[int, float, float, float]]:
+    ids, distances = (np.array(column) for column in zip(*rows))
+    return rank_candidate_ids(ids, distances, feedback_map, strategy, limit)
+
+def search_keyset_page(
+    session: Session,
+    query: str,
+    limit: int,
+    last_distance: float,
+    seen: List[int],
+    offset: int = 0,
+    strategy: str = "log",
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+    feedback_scope: Optional[str] = None,
+    decay: Optional[bool] = None,
+    filters: Optional[SearchFilters] = None,
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, float]], bool]:
+    plan = keyset_plan(query, limit, strategy, ef_search, probes, namespace, feedback_scope, decay, filters)
+    with stage("encode"):
+        query_vector = encode_query(query).tolist()
+    settings, statement, params = keyset_page_query(plan, query_vector, last_distance, seen, offset)
+    with stage("candidates"):
+        execute_settings(session, settings)
+        fetched = session.exec(statement, params=params).all()
+    rows = keyset_page_rows(fetched, seen, limit)
+    if not rows:
+        return [], [], True
+    with stage("feedback"):
+        feedback_map = get_scoped_feedback_maps(session, *plan.feedback_args([doc_id for doc_id, _ in rows]))[plan.key]
+    with stage("rerank"):
+        ranked = rank_rows(rows, feedback_map, strategy, limit)
+    with stage("content"):
+        return ranked_documents(session, ranked), rows, len(fetched) < params["page_size"]
+
+async def search_keyset_page_async(
+    session: AsyncSession,
+    query: str,
+    limit: int,
+    last_distance: float,
+    seen: List[int],
+    offset: int = 0,
+    strategy: str = "log",
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+    feedback_scope: Optional[str] = None,
+    decay: Optional[bool] = None,
+    filters: Optional[SearchFilters] = None,
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, float]], bool]:
+    plan = keyset_plan(query, limit, strategy, ef_search, probes, namespace, feedback_scope, decay, filters)
+    with stage("encode"):
+        query_vector = (await encode_query_async(query)).tolist()
+    settings, statement, params = keyset_page_query(plan, query_vector, last_distance, seen, offset)
+    with stage("candidates"):
+        await execute_settings_async(session, settings)
+        fetched = (await session.exec(statement, params=params)).all()
+    rows = keyset_page_rows(fetched, seen, limit)
+    if not rows:
+        return [], [], True
+    with stage("feedback"):
+        doc_ids = [doc_id for doc_id, _ in rows]
+        feedback_map = (await get_scoped_feedback_maps_async(session, *plan.feedback_args(doc_ids)))[plan.key]
+    with stage("rerank"):
+        ranked = rank_rows(rows, feedback_map, strategy, limit)
+    with stage("content"):
+        return await ranked_documents_async(session, ranked), rows, len(fetched) < params["page_size"]
+
+def explain_statement(quantization: str = "none", filters: SearchFilters = NO_FILTERS):
+    return text(
+        f"EXPLAIN (FORMAT JSON) WITH {candidates_cte(quantization, filters)} SELECT id, distance FROM candidates"
+    ).bindparams(bindparam("query_vector", type_=Vector()))
+
+def plan_summary(plan: Dict[str, Any]) -> Dict[str, Any]:
+    index_names, node_types = set(), set()
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        node_types.add(node["Node Type"])
+        if "Index Name" in node:
+            index_names.add(node["Index Name"])
+        nodes.extend(node.get("Plans", []))
+    return {"index_names": sorted(index_names), "node_types": sorted(node_types)}
+
+def explain_plan(
+    query: str,
+    limit: int,
+    quantization: Optional[str],
+    filters: Optional[SearchFilters],
+    ef_search: Optional[int],
+    probes: Optional[int],
+) -> SearchPlan:
+    return plan_search(
+        query, limit, ef_search=ef_search, probes=probes, quantization=quantization, feedback_scope="global",
+        decay=False, depth="fixed", filters=filters, engine="postgres",
+    )
+
+def explain_query(plan: SearchPlan, query_vector: List[float]) -> Tuple[Any, Dict[str, Any]]:
+    return explain_statement(plan.quantization, plan.filters), {
+        "query_vector": query_vector,
+        "candidates_limit": plan.candidates_limit,
+        "approx_limit": plan.approx_limit,
+        **plan.filters.params(),
+    }
+
+def explain_result(plan: SearchPlan, explained) -> Dict[str, Any]:
+    return {"filter_path": filter_path(plan.filters), **plan_summary(explained[0]["Plan"])}
+
+def explain_candidates(
+    session: Session,
+    query: str,
+    limit: int = 10,
+    quantization: Optional[str] = None,
+    filters: Optional[SearchFilters] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> Dict[str, Any]:
+    plan = explain_plan(query, limit, quantization, filters, ef_search, probes)
+    statement, params = explain_query(plan, encode_query(query).tolist())
+    execute_settings(session, plan.settings())
+    return explain_result(plan, session.exec(statement, params=params).scalar())
+
+async def explain_candidates_async(
+    session: AsyncSession,
+    query: str,
+    limit: int = 10,
+    quantization: Optional[str] = None,
+    filters: Optional[SearchFilters] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> Dict[str, Any]:
+    plan = explain_plan(query, limit, quantization, filters, ef_search, probes)
+    statement, params = explain_query(plan, (await encode_query_async(query)).tolist())
+    await execute_settings_async(session, plan.settings())
+    return explain_result(plan, (await session.exec(statement, params=params)).scalar())
+
+BATCH_CANDIDATES_SQL = text("""
+    WITH q AS (
+        SELECT t.ord, CAST(t.vec AS vector) AS vec
+        FROM unnest(CAST(:ords AS int[]), CAST(:vecs AS text[])) AS t(ord, vec)
+    )
+    SELECT q.ord, c.id, c.distance
+    FROM q
+    CROSS JOIN LATERAL (
+        SELECT d.id, d.embedding <=> q.vec AS distance
+        FROM documents d
+        ORDER BY d.embedding <=> q.vec
+        LIMIT :candidates_limit
+    ) c
+    ORDER BY q.ord, c.distance
+""")
+
+def batch_candidates_statement(quantization: str = "none"):
+    if quantization == "none":
+        return BATCH_CANDIDATES_SQL
+    return text(f"""
+        WITH q AS (
+            SELECT t.ord, CAST(t.vec AS vector) AS vec
+            FROM unnest(CAST(:ords AS int[]), CAST(:vecs AS text[])) AS t(ord, vec)
+        )
+        SELECT q.ord, c.id, c.distance
+        FROM q
+        CROSS JOIN LATERAL (
+            SELECT a.id, a.embedding <=> q.vec AS distance
+            FROM (
+                SELECT d.id, d.embedding
+                FROM documents d
+                ORDER BY {quantized_distance_sql(quantization, "d.embedding", "q.vec")}
+                LIMIT :approx_limit
+            ) a
+            ORDER BY distance
+            LIMIT :candidates_limit
+        ) c
+        ORDER BY q.ord, c.distance
+    """)
+
+def vector_literal(vector) -> str:
+    values = np.asarray(vector, dtype=np.float32)
+    return "[" + ",".join(np.format_float_positional(x, unique=True, trim="0") for x in values) + "]"
+
+def batch_candidates(
+    session: Session,
+    vectors: List[np.ndarray],
+    candidates_limit: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    quantization: str = "none",
+) -> List[List[Tuple[int, float]]]:
+    approx_limit = approx_limit_for(candidates_limit, quantization)
+    execute_settings(session, ann_settings_statement(approx_limit, ef_search, probes))
+    rows = session.exec(batch_candidates_statement(quantization), params={
+        "ords": list(range(len(vectors))),
+        "vecs": [vector_literal(v) for v in vectors],
+        "candidates_limit": candidates_limit,
+        "approx_limit": approx_limit,
+    }).all()
+    candidates: List[List[Tuple[int, float]]] = [[] for _ in vectors]
+    for ord_, doc_id, distance in rows:
+        candidates[ord_].append((doc_id, distance))
+    return candidates
+
+def search_documents_batch(
+    session: Session,
+    queries: List[str],
+    limit: int = 10,
+    strategy: str = "log",
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    quantization: Optional[str] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+    feedback_scope: Optional[str] = None,
+    decay: Optional[bool] = None,
+) -> Dict[str, Any]:
+    get_strategy(strategy)
+    quantization = quantization or default_quantization()
+    resolve_quantization(quantization)
+    scope = resolve_feedback_scope(feedback_scope)
+    decay = decay_enabled() if decay is None else decay
+    if not queries:
+        return {"results": [], "timings": {}}
+
+    with collect_timings() as request_timings:
+        before = dict(request_timings.stages)
+        with stage("encode"):
+            vectors = encode_queries(queries)
+
+        with stage("candidates"):
+            candidates = batch_candidates(session, vectors, candidates_limit_for(limit), ef_search, probes, quantization)
+
+        with stage("feedback"):
+            keys = [query_key(query) for query in queries]
+            doc_ids = list({doc_id for query_candidates in candidates for doc_id, _ in query_candidates})
+            feedback_maps = get_scoped_feedback_maps(session, doc_ids, list(set(keys)), namespace, scope, decay)
+
+        ranked = []
+        rank_times = []
+        with stage("rerank"):
+            for key, query_candidates in zip(keys, candidates):
+                start = time.perf_counter()
+                feedback_map = feedback_maps[key]
+                ids = np.array([doc_id for doc_id, _ in query_candidates], dtype=np.int64)
+                similarities = 1 - np.array([distance for _, distance in query_candidates], dtype=np.float64)
+                feedbacks = np.array([feedback_map.get(int(doc_id), 0) for doc_id in ids], dtype=np.float64)
+                scores = score_candidates(strategy, similarities, feedbacks)
+                order = np.argsort(-scores, kind="stable")[:limit]
+                ranked.append([(int(ids[i]), float(scores[i]), float(similarities[i]), float(feedbacks[i])) for i in order])
+                rank_times.append((time.perf_counter() - start) * 1000)
+
+        with stage("content"):
+            winner_ids = list({doc_id for query_ranked in ranked for doc_id, *_ in query_ranked})
+            docs = {}
+            if winner_ids:
+                docs = {row.id: row for row in session.exec(winner_documents_statement(winner_ids)).all()}
+        timings = {
+            f"{name}_ms": request_timings.stages.get(name, 0.0) - before.get(name, 0.0)
+            for name in ("encode", "candidates", "feedback", "content")
+        }
+
+    shared_ms = sum(timings.values()) / len(queries)
+    results = []
+    for query, query_ranked, rank_ms in zip(queries, ranked, rank_times):
+        results.append({
+            "query": query,
+            "results": [
+                {
+                    "id": doc_id,
+                    "content": docs[doc_id].content,
+                    "category": docs[doc_id].category,
+                    "score": score,
+                    "original_score": similarity,
+                    "feedback_score": feedback,
+                }
+                for doc_id, score, similarity, feedback in query_ranked
+            ],
+            "execution_time_ms": round(shared_ms + rank_ms, 3),
         })
-        
-    processed_results.sort(key=lambda x: x["score"], reverse=True)
-    
-    return processed_results[:limit]
+    timings["rank_ms"] = sum(rank_times)
+    return {"results": results, "timings": {k: round(v, 3) for k, v in timings.items()}}
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import psycopg
+from sqlmodel import text
+
+from src.cache import TaggedCache
+from src.database import engine
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "search_invalidate"
+NOTIFY_CHUNK = 500
+
+_cache: Optional[TaggedCache] = None
+_listener: Optional[threading.Thread] = None
+
+def response_cache_enabled() -> bool:
+    return os.getenv("RESPONSE_CACHE", "0") == "1"
+
+def get_response_cache() -> TaggedCache:
+    global _cache
+    if _cache is None:
+        ttl = float(os.getenv("RESPONSE_CACHE_TTL", "300")) or None
+        _cache = TaggedCache(int(os.getenv("RESPONSE_CACHE_SIZE", "2048")), ttl)
+    return _cache
+
+def namespace_tag(namespace: str) -> Tuple[str, None]:
+    return (namespace, None)
+
+def document_tags(namespace: str, doc_ids: List[int], namespace_wide: bool = False) -> List[Tuple[str, Optional[int]]]:
+    tags: List[Tuple[str, Optional[int]]] = [(namespace, doc_id) for doc_id in doc_ids]
+    if namespace_wide:
+        tags.append(namespace_tag(namespace))
+    return tags
+
+def touched_documents(interactions) -> Dict[str, List[int]]:
+    touched = defaultdict(set)
+    for inter in interactions:
+        touched[inter.namespace].add(inter.document_id)
+    return {namespace: sorted(ids) for namespace, ids in touched.items()}
+
+def notify_statements(touched: Dict[str, List[int]]):
+    for namespace, ids in touched.items():
+        for i in range(0, len(ids), NOTIFY_CHUNK):
+            payload = json.dumps({"namespace": namespace, "ids": ids[i : i + NOTIFY_CHUNK]})
+            yield text("SELECT pg_notify(:channel, :payload)"), {"channel": INVALIDATION_CHANNEL, "payload": payload}
+
+def notify_clear_statement():
+    return text("SELECT pg_notify(:channel, :payload)"), {"channel": INVALIDATION_CHANNEL, "payload": json.dumps({"ids": None})}
+
+def invalidate_documents(touched: Dict[str, List[int]]) -> int:
+    tags: List[Hashable] = [
+        tag for namespace, ids in touched.items() for tag in document_tags(namespace, ids, namespace_wide=True)
+    ]
+    return get_response_cache().invalidate(tags)
+
+def handle_notification(payload: str) -> int:
+    message = json.loads(payload)
+    if message["ids"] is None:
+        get_response_cache().clear()
+        return 0
+    return invalidate_documents({message["namespace"]: message["ids"]})
+
+def listener_url() -> str:
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+def start_invalidation_listener(reconnect_s: float = 1.0) -> None:
+    global _listener
+    if _listener is not None:
+        return
+
+    def run():
+        while True:
+            try:
+                with psycopg.connect(listener_url(), autocommit=True) as conn:
+                    conn.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                    get_response_cache().clear()
+                    for notify in conn.notifies():
+                        handle_notification(notify.payload)
+            except Exception:
+                logger.exception("Search cache invalidation listener failed, reconnecting")
+                time.sleep(reconnect_s)
+
+    _listener = threading.Thread(target=run, name="search-cache-listener", daemon=True)
+    _listener.start()
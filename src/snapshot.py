@@ -0,0 +1,286 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import DateTime, Integer
+from sqlmodel import Session, text
+
+from src.database import EMBEDDING_DIM, engine
+
+logger = logging.getLogger(__name__)
+
+DTYPES = {"float32": np.float32, "float16": np.float16}
+ENGINES = ("postgres", "snapshot")
+HALF_CHUNK_ROWS = 8192
+MIN_CAPACITY = 1024
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+CATCH_UP_SQL = text("""
+    SELECT id, embedding, created_at
+    FROM documents
+    WHERE (id > :max_id OR created_at >= :since) AND id > :after AND embedding IS NOT NULL
+    ORDER BY id
+    LIMIT :batch_size
+""").columns(id=Integer, embedding=Vector(EMBEDDING_DIM), created_at=DateTime)
+
+_snapshots: Dict[str, "VectorSnapshot"] = {}
+_snapshots_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+
+def default_engine() -> str:
+    return os.getenv("CANDIDATE_ENGINE", "postgres")
+
+def snapshot_enabled() -> bool:
+    return default_engine() == "snapshot"
+
+def snapshot_dir() -> str:
+    return os.getenv("SNAPSHOT_DIR", "data/.cache/snapshot")
+
+def snapshot_dtype() -> str:
+    return os.getenv("SNAPSHOT_DTYPE", "float32")
+
+def refresh_interval() -> float:
+    return float(os.getenv("SNAPSHOT_REFRESH_S", "5"))
+
+def commit_lag_seconds() -> float:
+    return float(os.getenv("SNAPSHOT_COMMIT_LAG_S", "60"))
+
+def normalize_rows(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def binary_codes(vectors) -> np.ndarray:
+    return np.packbits(np.atleast_2d(vectors) > 0, axis=1)
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    return POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32)
+
+def top_k(values: np.ndarray, k: int, largest: bool = True) -> np.ndarray:
+    keys = -values if largest else values
+    if k < len(keys):
+        picked = np.argpartition(keys, k)[:k]
+        return picked[np.argsort(keys[picked], kind="stable")]
+    return np.argsort(keys, kind="stable")
+
+class VectorSnapshot:
+    def __init__(self, directory: str, model: str, dim: int = EMBEDDING_DIM, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown snapshot dtype '{dtype}', expected one of {sorted(DTYPES)}")
+        os.makedirs(directory, exist_ok=True)
+        self.model = model
+        self.dim = dim
+        self.dtype = np.dtype(DTYPES[dtype])
+        self.prefix = os.path.join(directory, f"{model.replace('/', '__')}.{dtype}")
+        self.meta: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._arrays: Tuple[Any, Any, Any] = (None, None, None)
+
+    def path(self, generation: int, ext: str) -> str:
+        return f"{self.prefix}.g{generation}.{ext}"
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self.prefix}.json"
+
+    @property
+    def rows(self) -> int:
+        return self.meta["rows"] if self.meta else 0
+
+    def read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_meta(self, meta: Dict[str, Any]) -> None:
+        tmp = f"{self.meta_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def open_arrays(self, generation: int, capacity: int, mode: str = "r"):
+        return (
+            np.memmap(self.path(generation, "vec"), dtype=self.dtype, mode=mode, shape=(capacity, self.dim)),
+            np.memmap(self.path(generation, "ids"), dtype=np.int64, mode=mode, shape=(capacity,)),
+            np.memmap(self.path(generation, "bits"), dtype=np.uint8, mode=mode, shape=(capacity, (self.dim + 7) // 8)),
+        )
+
+    def load(self) -> bool:
+        meta = self.read_meta()
+        if meta is None or meta == self.meta:
+            return False
+        arrays = self._arrays
+        if self.meta is None or (self.meta["generation"], self.meta["capacity"]) != (meta["generation"], meta["capacity"]):
+            arrays = self.open_arrays(meta["generation"], meta["capacity"])
+        with self._lock:
+            self._arrays = arrays
+            self.meta = meta
+        return True
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            rows = self.rows
+            vectors, ids, codes = self._arrays
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return np.empty((0, self.dim), dtype=self.dtype), empty, np.empty((0, (self.dim + 7) // 8), dtype=np.uint8)
+        return vectors[:rows], ids[:rows], codes[:rows]
+
+    def append(self, ids, vectors, created_at=()) -> int:
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return 0
+        meta = self.read_meta() or {
+            "model": self.model, "dim": self.dim, "dtype": self.dtype.name,
+            "generation": 0, "rows": 0, "capacity": 0, "max_id": 0, "max_created_at": None,
+        }
+        vectors = normalize_rows(vectors)
+        maybe_known = ids <= meta["max_id"]
+        if maybe_known.any():
+            fresh = ~(maybe_known & np.isin(ids, self.known_ids(meta)))
+            ids, vectors = ids[fresh], vectors[fresh]
+        if not len(ids):
+            return 0
+
+        rows, capacity, generation = meta["rows"], meta["capacity"], meta["generation"]
+        if rows + len(ids) > capacity:
+            new_capacity = max(rows + len(ids), 2 * capacity, MIN_CAPACITY)
+            arrays = self.open_arrays(generation + 1, new_capacity, "w+")
+            if rows:
+                for target, source in zip(arrays, self.open_arrays(generation, capacity)):
+                    target[:rows] = source[:rows]
+            meta.update(generation=generation + 1, capacity=new_capacity)
+        else:
+            arrays = self.open_arrays(generation, capacity, "r+")
+
+        end = rows + len(ids)
+        arrays[0][rows:end] = vectors.astype(self.dtype)
+        arrays[1][rows:end] = ids
+        arrays[2][rows:end] = binary_codes(vectors)
+        for array in arrays:
+            array.flush()
+
+        stamps = [stamp for stamp in created_at if stamp is not None]
+        if meta["max_created_at"]:
+            stamps.append(datetime.fromisoformat(meta["max_created_at"]))
+        latest = max(stamps, default=None)
+        meta.update(
+            rows=end, max_id=max(meta["max_id"], int(ids.max())), max_created_at=latest.isoformat() if latest else None
+        )
+        self.write_meta(meta)
+        if meta["generation"] != generation:
+            for ext in ("vec", "ids", "bits"):
+                try:
+                    os.remove(self.path(generation, ext))
+                except FileNotFoundError:
+                    pass
+        self.load()
+        return len(ids)
+
+    def known_ids(self, meta: Dict[str, Any]) -> np.ndarray:
+        if not meta["rows"]:
+            return np.empty(0, dtype=np.int64)
+        return self.open_arrays(meta["generation"], meta["capacity"])[1][: meta["rows"]]
+
+    def refresh(self, batch_size: int = 5000) -> int:
+        with open(f"{self.prefix}.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.load()
+                return 0
+            meta = self.read_meta() or {"max_id": 0, "max_created_at": None}
+            since = datetime.min
+            if meta["max_created_at"]:
+                since = datetime.fromisoformat(meta["max_created_at"]) - timedelta(seconds=commit_lag_seconds())
+            added, after = 0, 0
+            with Session(engine) as session:
+                while True:
+                    rows = session.exec(CATCH_UP_SQL, params={
+                        "max_id": meta["max_id"], "since": since, "after": after, "batch_size": batch_size,
+                    }).all()
+                    if not rows:
+                        break
+                    added += self.append(
+                        [row.id for row in rows], [np.asarray(row.embedding) for row in rows], [row.created_at for row in rows]
+                    )
+                    after = rows[-1].id
+            self.load()
+        if added:
+            logger.info(f"Vector snapshot for {self.model} caught up by {added} rows ({self.rows} total).")
+        return added
+
+    def search(self, query_vector, k: int, mode: str = "exact", approx_limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        vectors, ids, codes = self.view()
+        if not len(ids) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        query = normalize_rows(query_vector)[0]
+
+        if mode == "binary":
+            rows = np.sort(top_k(hamming_distances(codes, binary_codes(query)[0]), approx_limit or k, largest=False))
+            similarities = vectors[rows].astype(np.float32) @ query
+        else:
+            rows = None
+            if vectors.dtype == np.float32:
+                similarities = np.asarray(vectors @ query)
+            else:
+                similarities = np.empty(len(ids), dtype=np.float32)
+                for start in range(0, len(ids), HALF_CHUNK_ROWS):
+                    chunk = slice(start, start + HALF_CHUNK_ROWS)
+                    similarities[chunk] = vectors[chunk].astype(np.float32) @ query
+
+        best = top_k(similarities, k)
+        picked = best if rows is None else rows[best]
+        return np.asarray(ids[picked]), 1 - similarities[best].astype(np.float64)
+
+    def stats(self) -> Dict[str, Any]:
+        meta = self.meta or {}
+        return {
+            "model": self.model,
+            "dtype": self.dtype.name,
+            "rows": meta.get("rows", 0),
+            "capacity": meta.get("capacity", 0),
+            "generation": meta.get("generation", 0),
+            "max_id": meta.get("max_id", 0),
+            "bytes": meta.get("capacity", 0) * self.dim * self.dtype.itemsize,
+        }
+
+def get_snapshot(model: str) -> VectorSnapshot:
+    with _snapshots_lock:
+        snapshot = _snapshots.get(model)
+        if snapshot is None:
+            snapshot = _snapshots[model] = VectorSnapshot(snapshot_dir(), model, EMBEDDING_DIM, snapshot_dtype())
+    return snapshot
+
+def ensure_snapshot(model: str) -> VectorSnapshot:
+    snapshot = get_snapshot(model)
+    if not snapshot.rows:
+        snapshot.load()
+    if not snapshot.rows:
+        snapshot.refresh()
+    return snapshot
+
+def start_snapshot_refresher(model_name, interval: float = 5.0) -> None:
+    global _refresher
+    if _refresher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                get_snapshot(model_name()).refresh()
+            except Exception:
+                logger.exception("Failed to refresh the vector snapshot")
+
+    _refresher = threading.Thread(target=run, name="vector-snapshot-refresher", daemon=True)
+    _refresher.start()
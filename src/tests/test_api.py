@@ -1,8 +1,14 @@
+from datetime import datetime, timedelta
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, delete
+from sqlmodel import Session, text
 from src.main import app
 from src.database import get_session, engine, Interaction
+from src.feedback import record_feedback, reset_feedback, verify_feedback_aggregate, get_feedback_map, FeedbackBuffer
+from src.pagination import get_cursor_store
+from src.partitions import list_partitions, maintain_interactions
+from src.search import search_documents
 
 client = TestClient(app)
 
@@ -25,8 +31,7 @@ def test_search_basic():
     assert "execution_time_ms" in data
 
 def test_feedback_loop_scenario(session: Session):
-    session.exec(delete(Interaction))
-    session.commit()
+    reset_feedback(session)
 
     query = "vitamin"
     
@@ -56,3 +61,250 @@ def test_feedback_loop_scenario(session: Session):
     
     assert updated_doc["score"] > initial_score
     assert updated_doc["feedback_score"] == 50
+
+def test_feedback_namespaces_are_isolated(session: Session):
+    reset_feedback(session, "test:isolated")
+    doc_id = client.post("/api/v1/search", json={"query": "vitamin", "limit": 5}).json()["results"][2]["id"]
+    live_before = get_feedback_map(session, [doc_id]).get(doc_id, 0)
+
+    response = client.post("/api/v1/feedback", json={
+        "document_id": doc_id, "query": "vitamin", "score_delta": 9, "namespace": "test:isolated"
+    })
+    assert response.status_code == 200
+
+    scoped = client.post("/api/v1/search", json={"query": "vitamin", "limit": 5, "namespace": "test:isolated"}).json()["results"]
+    assert next(d for d in scoped if d["id"] == doc_id)["feedback_score"] == 9
+    assert get_feedback_map(session, [doc_id]).get(doc_id, 0) == live_before
+
+    reset_feedback(session, "test:isolated")
+    assert get_feedback_map(session, [doc_id], "test:isolated") == {}
+
+def test_query_embedding_cache_hits():
+    before = client.get("/api/v1/stats").json()["embedding_cache"]
+    client.post("/api/v1/search", json={"query": "Omega-3  Fatty Acids", "limit": 3})
+    client.post("/api/v1/search", json={"query": "omega-3 fatty acids", "limit": 3})
+    after = client.get("/api/v1/stats").json()["embedding_cache"]
+
+    assert after["hits"] >= before["hits"] + 1
+
+def test_search_with_recall_knobs():
+    payload = {"query": "nutrition", "limit": 5, "ef_search": 200, "probes": 20}
+    response = client.post("/api/v1/search", json=payload)
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 5
+
+def test_index_status():
+    response = client.get("/api/v1/admin/index")
+    assert response.status_code == 200
+    data = response.json()
+    assert "indexes" in data
+    assert "build" in data
+
+def test_embedding_versions_status():
+    response = client.get("/api/v1/admin/embeddings")
+    assert response.status_code == 200
+    data = response.json()
+    active = [v for v in data["versions"] if v["status"] == "active"]
+    assert len(active) == 1
+    assert active[0]["model"] == data["active_model"]
+
+def test_feedback_aggregate_matches_interactions(session: Session):
+    reset_feedback(session)
+    doc_id = client.post("/api/v1/search", json={"query": "vitamin", "limit": 1}).json()["results"][0]["id"]
+
+    for delta in (1, 3, -1):
+        client.post("/api/v1/feedback", json={"document_id": doc_id, "query": "vitamin", "score_delta": delta})
+
+    assert verify_feedback_aggregate(session) == []
+    session.exec(text("UPDATE query_feedback SET total_score = total_score + 1 WHERE document_id = :id"), params={"id": doc_id})
+    session.commit()
+    assert [row["aggregate"] for row in verify_feedback_aggregate(session)] == ["query_feedback"]
+    reset_feedback(session)
+
+def test_buffered_feedback_flush(session: Session):
+    reset_feedback(session)
+    doc_id = client.post("/api/v1/search", json={"query": "vitamin", "limit": 1}).json()["results"][0]["id"]
+
+    buffer = FeedbackBuffer(flush_size=2)
+    buffer.load_known_ids()
+    assert buffer.is_known(session, doc_id)
+    for _ in range(3):
+        buffer.add(Interaction(document_id=doc_id, query_text="vitamin", score_delta=2))
+    assert buffer.pending == 3
+
+    assert buffer.flush() == 3
+    assert buffer.pending == 0
+    assert buffer.flushes == 2
+    assert get_feedback_map(session, [doc_id]) == {doc_id: 6}
+    assert verify_feedback_aggregate(session) == []
+
+@pytest.mark.parametrize("strategy", ["log", "linear", "sigmoid"])
+def test_sql_ranking_matches_python_reference(session: Session, strategy: str):
+    doc_id = client.post("/api/v1/search", json={"query": "vitamin", "limit": 5}).json()["results"][3]["id"]
+    client.post("/api/v1/feedback", json={"document_id": doc_id, "query": "vitamin", "score_delta": 7})
+
+    python_results = search_documents(session, "vitamin", limit=10, strategy=strategy, ranking="python")
+    sql_results = search_documents(session, "vitamin", limit=10, strategy=strategy, ranking="sql")
+
+    assert [r["id"] for r in sql_results] == [r["id"] for r in python_results]
+    for sql_row, py_row in zip(sql_results, python_results):
+        assert sql_row["score"] == pytest.approx(py_row["score"])
+        assert sql_row["feedback_score"] == py_row["feedback_score"]
+        assert sql_row["content"] == py_row["content"]
+
+@pytest.mark.parametrize("quantization", ["halfvec", "binary"])
+def test_quantized_search_rescores_with_full_precision(session: Session, quantization: str):
+    exact = {r["id"]: r for r in search_documents(session, "vitamin", limit=50, quantization="none")}
+    sql_results = search_documents(session, "vitamin", limit=10, quantization=quantization, ranking="sql")
+    python_results = search_documents(session, "vitamin", limit=10, quantization=quantization, ranking="python")
+
+    assert len(sql_results) == 10
+    assert [r["id"] for r in sql_results] == [r["id"] for r in python_results]
+    for row in sql_results:
+        if row["id"] in exact:
+            assert row["original_score"] == pytest.approx(exact[row["id"]]["original_score"])
+    assert len({r["id"] for r in sql_results} & set(list(exact)[:10])) >= 5
+
+def test_unknown_strategy_is_rejected():
+    response = client.post("/api/v1/search", json={"query": "vitamin", "strategy": 'magic"\n'})
+    assert response.status_code == 400
+    metrics = client.get("/metrics").text
+    assert 'strategy="invalid"' in metrics
+    assert "magic" not in metrics
+
+def test_async_search_matches_sync():
+    payload = {"query": "vitamin d deficiency", "limit": 5}
+    with TestClient(app) as async_client:
+        sync_data = async_client.post("/api/v1/search", json=payload).json()
+        async_response = async_client.post("/api/v1/async/search", json=payload)
+
+    assert async_response.status_code == 200
+    async_data = async_response.json()
+    assert [r["id"] for r in async_data["results"]] == [r["id"] for r in sync_data["results"]]
+
+def test_batch_search_matches_single_queries():
+    queries = ["vitamin", "nutrition", "breast cancer risk"]
+    response = client.post("/api/v1/search/batch", json={"queries": queries, "limit": 5})
+    assert response.status_code == 200
+    data = response.json()
+
+    assert [item["query"] for item in data["results"]] == queries
+    for item in data["results"]:
+        single = client.post("/api/v1/search", json={"query": item["query"], "limit": 5}).json()["results"]
+        assert [r["id"] for r in item["results"]] == [r["id"] for r in single]
+        assert item["execution_time_ms"] >= 0
+    assert "encode_ms" in data["timings"]
+    assert 'endpoint="/api/v1/search/batch",stage="candidates"' in client.get("/metrics").text
+
+def test_search_timings_and_metrics():
+    response = client.post("/api/v1/search", json={"query": "vitamin", "limit": 3, "include_timings": True})
+    assert response.status_code == 200
+    assert "encode" in response.json()["timings"]
+    assert "total;dur=" in response.headers["server-timing"]
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert 'endpoint="/api/v1/search",stage="total"' in metrics.text
+    assert "db_pool_connections" in metrics.text
+
+def test_query_scoped_feedback(session: Session):
+    reset_feedback(session, "test:scoped")
+    doc_id = client.post("/api/v1/search", json={"query": "vitamin", "limit": 5}).json()["results"][2]["id"]
+    client.post("/api/v1/feedback", json={
+        "document_id": doc_id, "query": "Vitamin ", "score_delta": 8, "namespace": "test:scoped"
+    })
+
+    def feedback_for(query, scope):
+        results = search_documents(session, query, limit=50, namespace="test:scoped", feedback_scope=scope)
+        return next((d["feedback_score"] for d in results if d["id"] == doc_id), None)
+
+    assert feedback_for("vitamin", "query") == 8
+    assert feedback_for("vitamin", "blend") == 8
+    assert feedback_for("VITAMIN", "global") == 8
+    assert feedback_for("vitamins and minerals", "query") in (0, None)
+    reset_feedback(session, "test:scoped")
+
+def test_decayed_feedback_matches_fresh_clicks(session: Session):
+    reset_feedback(session, "test:decay")
+    doc_id = client.post("/api/v1/search", json={"query": "vitamin", "limit": 5}).json()["results"][2]["id"]
+    client.post("/api/v1/feedback", json={"document_id": doc_id, "query": "vitamin", "score_delta": 6, "namespace": "test:decay"})
+
+    for ranking in ("sql", "python"):
+        results = search_documents(session, "vitamin", limit=10, ranking=ranking, namespace="test:decay", decay=True)
+        assert next(d for d in results if d["id"] == doc_id)["feedback_score"] == pytest.approx(6, rel=1e-3)
+    reset_feedback(session, "test:decay")
+
+def test_response_cache_invalidated_by_feedback(session: Session, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE", "1")
+    reset_feedback(session, "test:cache")
+    payload = {"query": "vitamin", "limit": 5, "namespace": "test:cache"}
+    first = client.post("/api/v1/search", json=payload).json()["results"]
+    hits = client.get("/api/v1/stats").json()["response_cache"]["hits"]
+    assert client.post("/api/v1/search", json=payload).json()["results"] == first
+    assert client.get("/api/v1/stats").json()["response_cache"]["hits"] == hits + 1
+
+    doc_id = first[-1]["id"]
+    client.post("/api/v1/feedback", json={"document_id": doc_id, "query": "vitamin", "score_delta": 4, "namespace": "test:cache"})
+    refreshed = client.post("/api/v1/search", json=payload).json()["results"]
+    assert next(d for d in refreshed if d["id"] == doc_id)["feedback_score"] == 4
+    reset_feedback(session, "test:cache")
+
+def test_adaptive_depth_reports_candidates():
+    response = client.post("/api/v1/search", json={"query": "vitamin", "limit": 5, "depth": "adaptive"})
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 5
+    assert response.json()["candidate_depth"] >= 5
+
+    rejected = client.post("/api/v1/search", json={"query": "vitamin", "depth": "adaptive", "quantization": "binary"})
+    assert rejected.status_code == 400
+
+def test_category_filter_only_returns_matching_documents():
+    category = client.post("/api/v1/search", json={"query": "vitamin", "limit": 1}).json()["results"][0]["category"]
+    response = client.post("/api/v1/search", json={"query": "vitamin", "limit": 5, "category": category, "explain": True})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"] and all(d["category"] == category for d in data["results"])
+    assert data["plan"]["filter_path"] in ("partial_index", "iterative_scan", "post_filter")
+
+def test_snapshot_engine_agrees_with_postgres(session: Session, monkeypatch, tmp_path):
+    monkeypatch.setenv("SNAPSHOT_DIR", str(tmp_path))
+    postgres = search_documents(session, "vitamin", limit=10, ranking="python")
+    snapshot = search_documents(session, "vitamin", limit=10, engine="snapshot")
+
+    assert len(snapshot) == 10
+    assert len({r["id"] for r in snapshot} & {r["id"] for r in postgres}) >= 8
+
+def test_cursor_pagination_serves_disjoint_pages(monkeypatch):
+    monkeypatch.setenv("PAGINATION_DEPTH", "10")
+    payload = {"query": "vitamin", "limit": 4, "paginate": True}
+    first = client.post("/api/v1/search", json=payload).json()
+    second = client.post("/api/v1/search", json={**payload, "cursor": first["next_cursor"]}).json()
+    get_cursor_store().clear()
+    third = client.post("/api/v1/search", json={**payload, "cursor": second["next_cursor"]}).json()
+
+    pages = [[r["id"] for r in page["results"]] for page in (first, second, third)]
+    assert [len(page) for page in pages] == [4, 4, 4]
+    assert len(set(sum(pages, []))) == 12
+    assert third["next_cursor"]
+
+    mismatched = client.post("/api/v1/search", json={**payload, "query": "nutrition", "cursor": first["next_cursor"]})
+    assert mismatched.status_code == 400
+
+def test_expired_interactions_compact_into_rollups(session: Session, monkeypatch):
+    reset_feedback(session)
+    doc_id = client.post("/api/v1/search", json={"query": "vitamin", "limit": 1}).json()["results"][0]["id"]
+    old = datetime.utcnow() - timedelta(days=200)
+    for delta, age in ((2, 0), (3, 1), (-1, 40)):
+        interaction = Interaction(document_id=doc_id, query_text="vitamin", score_delta=delta, created_at=old - timedelta(days=age))
+        record_feedback(session, [interaction])
+    client.post("/api/v1/feedback", json={"document_id": doc_id, "query": "vitamin", "score_delta": 1})
+    before = get_feedback_map(session, [doc_id])
+
+    monkeypatch.setenv("INTERACTIONS_RETENTION_DAYS", "90")
+    report = maintain_interactions()
+    assert report["compacted"]
+    assert all(name not in list_partitions(session) for name in report["compacted"] if name != "interactions_default")
+    assert session.exec(text("SELECT count(*) FROM interactions WHERE created_at < (now() AT TIME ZONE 'utc') - interval '90 days'")).scalar() == 0
+    assert session.exec(text("SELECT sum(interactions) FROM interaction_rollups")).scalar() == 3
+    assert get_feedback_map(session, [doc_id]) == before
+    assert verify_feedback_aggregate(session) == []
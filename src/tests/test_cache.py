@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+
+from src import search_cache
+from src.cache import LRUCache, SqliteVectorStore, TaggedCache
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+def test_lru_ttl_expiry():
+    cache = LRUCache(max_entries=10, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_sqlite_vector_store_roundtrip(tmp_path):
+    store = SqliteVectorStore(str(tmp_path / "embeddings.db"))
+    vector = np.arange(4, dtype=np.float32)
+    store.set("model\x00query", vector)
+
+    reopened = SqliteVectorStore(str(tmp_path / "embeddings.db"))
+    assert np.array_equal(reopened.get("model\x00query"), vector)
+    assert reopened.get("missing") is None
+
+def test_tagged_cache_invalidates_only_matching_entries():
+    cache = TaggedCache(max_entries=2)
+    cache.set_tagged("vitamin", [1], [("live", 1), ("live", 2)])
+    cache.set_tagged("zinc", [3], [("live", 3)])
+
+    assert cache.invalidate([("live", 2), ("other", 3)]) == 1
+    assert cache.get("vitamin") is None
+    assert cache.get("zinc") == [3]
+
+    cache.set_tagged("iron", [4], [("live", 4)])
+    cache.set_tagged("calcium", [5], [("live", 5)])
+    assert cache.invalidate([("live", 3)]) == 0
+    assert cache.stats()["invalidations"] == 1
+
+def test_tagged_cache_rejects_writes_raced_by_invalidation():
+    cache = TaggedCache()
+    since = cache.sequence
+    cache.invalidate([("live", 1)])
+
+    assert not cache.set_tagged("vitamin", [1], [("live", 1)], since)
+    assert cache.set_tagged("zinc", [2], [("live", 2)], since)
+    assert cache.get("vitamin") is None
+    assert cache.stats()["stale_writes"] == 1
+
+def test_feedback_invalidates_namespace_wide_entries(monkeypatch):
+    cache = TaggedCache()
+    monkeypatch.setattr(search_cache, "_cache", cache)
+    cache.set_tagged("fixed", [1], search_cache.document_tags("live", [1]))
+    cache.set_tagged("adaptive", [1], search_cache.document_tags("live", [1], namespace_wide=True))
+    cache.set_tagged("other", [1], search_cache.document_tags("other", [1], namespace_wide=True))
+
+    assert search_cache.invalidate_documents({"live": [9]}) == 1
+    assert cache.get("adaptive") is None
+    assert cache.get("fixed") == [1]
+    assert cache.get("other") == [1]
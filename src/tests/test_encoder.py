@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from src.encoder import BatchEncoder
+
+def test_concurrent_requests_are_batched():
+    calls = []
+
+    def fake_encode(texts):
+        calls.append(len(texts))
+        return np.array([[len(t), 0.0] for t in texts])
+
+    encoder = BatchEncoder(fake_encode, max_batch_size=8, max_wait_ms=50)
+    results = {}
+
+    def worker(text):
+        results[text] = encoder.encode(text)
+
+    threads = [threading.Thread(target=worker, args=("q" * i,)) for i in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    encoder.stop()
+
+    assert sum(calls) == 8
+    assert len(calls) < 8
+    for text, vector in results.items():
+        assert vector[0] == len(text)
+    assert encoder.stats()["items"] == 8
+
+def test_encode_errors_propagate_to_callers():
+    def failing_encode(texts):
+        raise RuntimeError("boom")
+
+    encoder = BatchEncoder(failing_encode, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        encoder.encode("query")
+    encoder.stop()
+
+def test_stop_fails_requests_queued_behind_the_stop_marker():
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_encode(texts):
+        started.set()
+        release.wait(1)
+        return np.zeros((len(texts), 2))
+
+    encoder = BatchEncoder(blocking_encode, max_wait_ms=0)
+    first = encoder.submit("a")
+    assert started.wait(1)
+    stopper = threading.Thread(target=encoder.stop)
+    stopper.start()
+    while encoder._queue.qsize() == 0:
+        time.sleep(0.001)
+    late: Future = Future()
+    encoder._queue.put(("b", late))
+    release.set()
+    stopper.join(1)
+
+    assert first.result(1).shape == (2,)
+    with pytest.raises(RuntimeError, match="stopped"):
+        late.result(1)
+
+def test_cancelled_requests_do_not_break_the_batch():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def blocking_encode(texts):
+        calls.append(list(texts))
+        started.set()
+        release.wait(1)
+        return np.array([[len(t), 0.0] for t in texts])
+
+    encoder = BatchEncoder(blocking_encode, max_batch_size=8, max_wait_ms=0)
+    first = encoder.submit("a")
+    assert started.wait(1)
+    cancelled, kept = encoder.submit("bb"), encoder.submit("ccc")
+    assert cancelled.cancel()
+    release.set()
+
+    assert first.result(1)[0] == 1
+    assert kept.result(1)[0] == 3
+    assert encoder.encode("dddd")[0] == 4
+    assert all("bb" not in batch for batch in calls)
+    encoder.stop()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import Interaction, QueryFeedback
+from src.feedback import BULK_INSERT_CHUNK, aggregate_upsert_statements, assign_query_keys, blend_feedback, decay_weight, query_key
+
+def test_query_key_ignores_case_and_whitespace():
+    assert query_key("Omega-3  Fatty Acids") == query_key("omega-3 fatty acids")
+    assert query_key("vitamin") != query_key("vitamin d")
+    assert len(query_key("vitamin")) == 16
+
+def test_blend_prefers_query_feedback_and_falls_back_to_global(monkeypatch):
+    monkeypatch.setenv("GLOBAL_FEEDBACK_WEIGHT", "0.5")
+    global_map = {1: 40, 2: 10}
+    query_map = {1: 3}
+    assert blend_feedback(global_map, query_map, "global") == global_map
+    assert blend_feedback(global_map, query_map, "query") == query_map
+    assert blend_feedback(global_map, query_map, "blend") == {1: 3, 2: pytest.approx(5.0)}
+
+def test_query_aggregate_groups_by_query_key():
+    interactions = [
+        Interaction(user_id=1, document_id=7, query_text="Vitamin", score_delta=1),
+        Interaction(user_id=1, document_id=7, query_text="vitamin ", score_delta=2),
+        Interaction(user_id=1, document_id=7, query_text="zinc", score_delta=1),
+    ]
+    assign_query_keys(interactions)
+    rows = aggregate_upsert_statements(QueryFeedback, interactions)[0].compile().params
+    assert interactions[0].query_key == interactions[1].query_key
+    assert sorted(v for k, v in rows.items() if k.startswith("total_score")) == [1, 3]
+
+def test_decayed_score_halves_every_half_life(monkeypatch):
+    monkeypatch.setenv("FEEDBACK_HALF_LIFE_HOURS", "24")
+    assert decay_weight(0) == 1.0
+    assert decay_weight(-5) == 1.0
+    assert decay_weight(48 * 3600) == pytest.approx(0.25)
+
+    week_old = Interaction(
+        user_id=1, document_id=7, query_text="vitamin", score_delta=8, created_at=datetime.utcnow() - timedelta(days=7)
+    )
+    fresh = Interaction(user_id=1, document_id=7, query_text="vitamin", score_delta=1)
+    params = aggregate_upsert_statements(QueryFeedback, [week_old, fresh])[0].compile().params
+    assert params["total_score_m0"] == 9
+    assert params["decayed_score_m0"] == pytest.approx(1 + 8 / 128, rel=1e-3)
+
+def test_aggregate_upsert_is_chunked_below_the_parameter_limit():
+    interactions = [
+        Interaction(user_id=1, document_id=i, query_text="vitamin", score_delta=1) for i in range(2 * BULK_INSERT_CHUNK + 1)
+    ]
+    assign_query_keys(interactions)
+    statements = aggregate_upsert_statements(QueryFeedback, interactions)
+    assert len(statements) == 3
+    assert max(len(stmt.compile().params) for stmt in statements) < 65535
+    assert aggregate_upsert_statements(QueryFeedback, []) == []
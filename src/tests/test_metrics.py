@@ -0,0 +1,48 @@
+from src.metrics import (
+    MetricsRegistry,
+    RequestTimings,
+    collect_timings,
+    current_timings,
+    format_labels,
+    server_timing_header,
+    stage,
+)
+
+def test_stage_is_noop_without_request():
+    assert current_timings() is None
+    with stage("encode"):
+        pass
+    assert current_timings() is None
+
+def test_collect_timings_records_outside_requests():
+    with collect_timings() as timings:
+        with stage("encode"):
+            pass
+        with collect_timings() as nested:
+            assert nested is timings
+    assert "encode" in timings.stages
+    assert current_timings() is None
+
+def test_registry_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    timings = RequestTimings()
+    timings.add("encode", 0.3)
+    timings.add("sql_rank", 7.0)
+    registry.observe_request("/api/v1/search", timings, 12.0)
+
+    lines = registry.render("search_stage_duration_ms")
+    assert lines[0] == "# TYPE search_stage_duration_ms histogram"
+    prefix = 'search_stage_duration_ms_bucket{endpoint="/api/v1/search",stage="sql_rank",strategy=""'
+    assert f'{prefix},le="5"}} 0' in lines
+    assert f'{prefix},le="10"}} 1' in lines
+    assert f'{prefix},le="+Inf"}} 1' in lines
+    assert 'search_stage_duration_ms_count{endpoint="/api/v1/search",stage="total",strategy=""} 1' in lines
+
+def test_server_timing_header():
+    timings = RequestTimings()
+    timings.add("encode", 1.0)
+    timings.add("encode", 0.5)
+    assert server_timing_header(timings, 4.0) == "encode;dur=1.50, total;dur=4.00"
+
+def test_label_values_are_escaped():
+    assert format_labels([("strategy", 'a"b\\c\nd')]) == 'strategy="a\\"b\\\\c\\nd"'
@@ -0,0 +1,61 @@
+import pytest
+
+from src.pagination import (
+    continuation,
+    decode_cursor,
+    encode_cursor,
+    get_cursor_store,
+    keyset_cursor,
+    session_page,
+    start_session,
+)
+
+def results(n):
+    return [{"id": i, "score": 1 - i / 100, "original_score": 1 - i / 50, "feedback_score": 0.0} for i in range(1, n + 1)]
+
+def test_cursor_round_trip_and_validation():
+    cursor = encode_cursor({"sid": "abc", "fp": "f1", "offset": 5, "distance": 0.25, "seen": [(3, 0.3)]})
+    assert decode_cursor(cursor, "f1")["seen"] == [(3, 0.3)]
+    with pytest.raises(ValueError, match="does not belong"):
+        decode_cursor(cursor, "f2")
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("not-a-cursor", "f1")
+
+def test_continuation_excludes_shown_rows_past_the_boundary():
+    rows = [(1, 0.1), (2, 0.4), (3, 0.2), (4, 0.3)]
+    assert continuation(rows, 2) == (0.2, [(2, 0.4)])
+    assert continuation(rows, 4) == (0.4, [(2, 0.4)])
+
+def test_session_pages_walk_the_window_then_hand_over_to_keyset():
+    get_cursor_store().clear()
+    cursor = start_session("fp", results(12), 5, depth=12)
+    pages = []
+    while True:
+        payload = decode_cursor(cursor, "fp")
+        served = session_page(payload, 5)
+        if served is None:
+            break
+        page, cursor = served
+        pages.append([doc_id for doc_id, *_ in page])
+    assert pages == [[6, 7, 8, 9, 10], [11, 12]]
+    assert payload["offset"] == 12 and payload["seen"] == [(12, pytest.approx(0.24))]
+
+def test_short_window_has_no_next_cursor():
+    assert start_session("fp", results(3), 5, depth=200) is None
+
+def test_keyset_cursor_accumulates_ties_at_the_same_boundary():
+    payload = {"fp": "fp", "offset": 10, "distance": 0.5, "seen": [(1, 0.5)]}
+    cursor = decode_cursor(keyset_cursor(payload, [(2, 0.5), (3, 0.5)], exhausted=False), "fp")
+    assert cursor["seen"] == [(1, 0.5), (2, 0.5), (3, 0.5)] and cursor["offset"] == 12
+    assert keyset_cursor(payload, [(2, 0.6)], exhausted=True) is None
+
+def test_boosted_far_document_stays_excluded_after_keyset_handoff():
+    window = [(1, 0.10), (20, 0.30), (2, 0.12), (3, 0.15), (4, 0.18)]
+    boundary, seen = continuation(window, 3)
+    assert boundary == 0.15 and (20, 0.30) in seen
+    payload = {"fp": "fp", "offset": 3, "distance": boundary, "seen": seen}
+    for page in ([(3, 0.15), (4, 0.18)], [(5, 0.22), (6, 0.25)]):
+        excluded = {doc_id for doc_id, _ in payload["seen"]}
+        assert not excluded & {doc_id for doc_id, _ in page}
+        payload = decode_cursor(keyset_cursor(payload, page, exhausted=False), "fp")
+    assert payload["distance"] == 0.25 and (20, 0.30) in payload["seen"]
@@ -0,0 +1,15 @@
+from datetime import date
+
+from src.partitions import add_months, month_start, partition_month, partition_name
+
+def test_add_months_rolls_over_years():
+    assert add_months(date(2024, 11, 1), 2) == date(2025, 1, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert add_months(date(2024, 6, 1), 0) == date(2024, 6, 1)
+
+def test_partition_names_round_trip():
+    month = month_start(date(2024, 3, 17))
+    assert month == date(2024, 3, 1)
+    assert partition_name(month) == "interactions_p202403"
+    assert partition_month(partition_name(month)) == month
+    assert partition_month("interactions_default") is None
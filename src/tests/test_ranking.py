@@ -0,0 +1,53 @@
+import math
+
+import numpy as np
+import pytest
+
+from src import ranking
+from src.ranking import (
+    LinearStrategy,
+    RankingStrategy,
+    UnknownStrategyError,
+    configure_strategy,
+    get_strategy,
+    register_strategy,
+    score_candidates,
+    score_sql,
+)
+
+def reference_boost(strategy, similarity, feedback):
+    feedback = max(0, feedback)
+    if strategy == "log":
+        return similarity * (1 + 0.05 * math.log(1 + feedback))
+    if strategy == "linear":
+        return similarity + 0.001 * feedback
+    return similarity * (1 + 0.5 * feedback / (feedback + 50))
+
+@pytest.mark.parametrize("strategy", ["log", "linear", "sigmoid"])
+def test_vectorized_scores_match_reference(strategy):
+    similarity = np.array([0.9, 0.5, 0.31, 0.7])
+    feedback = np.array([0, 10, 500, -3])
+    scores = score_candidates(strategy, similarity, feedback)
+    expected = [reference_boost(strategy, s, f) for s, f in zip(similarity, feedback)]
+    assert scores == pytest.approx(expected)
+
+def test_unknown_strategy_raises():
+    with pytest.raises(UnknownStrategyError):
+        score_candidates("nope", [0.5], [1])
+
+def test_custom_strategy_and_params(monkeypatch):
+    monkeypatch.setattr(ranking, "_registry", dict(ranking._registry))
+    register_strategy("steep_linear", LinearStrategy(beta=0.01))
+    assert score_candidates("steep_linear", [0.5], [10])[0] == pytest.approx(0.6)
+    assert "0.01" in score_sql("steep_linear", "sim", "fb")
+
+    configure_strategy("steep_linear", beta=0.02)
+    assert get_strategy("steep_linear").params() == {"beta": 0.02}
+
+def test_incomplete_strategy_cannot_be_registered():
+    class ScoreOnly(RankingStrategy):
+        def score(self, similarity, feedback):
+            return similarity
+
+    with pytest.raises(TypeError):
+        register_strategy("score_only", ScoreOnly())
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.index import PARTIAL_PREDICATE, category_index_name
+from src.ranking import score_candidates, score_upper_bound
+from src.search import AdaptiveDepth, SearchFilters, ann_settings_statement, plan_summary
+
+def drive(ranker, corpus, feedback):
+    while not ranker.done:
+        page = [(doc_id, d) for doc_id, d in corpus if d >= ranker.last_distance][: ranker.request_size()]
+        rows = ranker.accept(page)
+        if not rows:
+            break
+        ranker.add(rows, feedback)
+    return [ranker.ids[i] for i in ranker.winners()]
+
+@pytest.mark.parametrize("strategy", ["log", "linear", "sigmoid"])
+def test_upper_bound_dominates_any_feedback(strategy):
+    similarity = np.array([0.9, 0.2, -0.3])
+    bound = score_upper_bound(strategy, similarity, 200)
+    for feedback in (0, 5, 200):
+        assert np.all(score_candidates(strategy, similarity, np.full(3, feedback)) <= bound + 1e-12)
+
+@pytest.mark.parametrize("strategy", ["log", "linear", "sigmoid"])
+def test_adaptive_depth_matches_exhaustive_ranking(strategy):
+    rng = np.random.default_rng(7)
+    distances = np.sort(rng.uniform(0.1, 0.9, 500))
+    corpus = [(i, float(d)) for i, d in enumerate(distances)]
+    feedback = {i: int(rng.integers(0, 400)) for i in rng.choice(500, 20, replace=False)}
+
+    ranker = AdaptiveDepth(strategy, 10, max(feedback.values()), 1000)
+    adaptive = drive(ranker, corpus, feedback)
+
+    scores = score_candidates(strategy, 1 - distances, [feedback.get(i, 0) for i in range(500)])
+    assert adaptive == [int(i) for i in np.argsort(-scores, kind="stable")[:10]]
+
+def test_adaptive_depth_stops_after_first_page_without_feedback():
+    corpus = [(i, 0.1 + i / 1000) for i in range(500)]
+    ranker = AdaptiveDepth("log", 10, 0, 1000)
+    assert drive(ranker, corpus, {}) == list(range(10))
+    assert len(ranker.ids) == 10
+
+def test_search_filters_render_bound_conditions():
+    assert not SearchFilters()
+    filters = SearchFilters(category="Health", created_after=datetime(2024, 1, 1))
+    assert filters.where("d") == "WHERE d.category = :filter_category AND d.created_at >= :filter_created_after"
+    assert filters.where(keyword="AND") == "AND category = :filter_category AND created_at >= :filter_created_after"
+    assert filters.params() == {"filter_category": "Health", "filter_created_after": datetime(2024, 1, 1)}
+    assert len(filters.clauses()) == 2
+
+def test_partial_index_names_fit_and_round_trip():
+    name = category_index_name("Women's Health & Nutrition / Long Category Name", "hnsw")
+    assert len(name) <= 63
+    assert name != category_index_name("Women's Health & Nutrition / Long Category Name 2", "hnsw")
+    definition = "CREATE INDEX x ON public.documents USING hnsw (embedding vector_cosine_ops) WHERE ((category)::text = 'Women''s Health'::text)"
+    assert PARTIAL_PREDICATE.search(definition).group(1).replace("''", "'") == "Women's Health"
+
+def test_ann_settings_accept_extra_gucs():
+    stmt, params = ann_settings_statement(10, 40, None, {"hnsw.iterative_scan": "strict_order"})
+    assert "hnsw.iterative_scan" in str(stmt)
+    assert params == {"v0": "40", "v1": "strict_order"}
+
+def test_ann_settings_clamp_ef_search(monkeypatch):
+    monkeypatch.setenv("FILTER_ITERATIVE_SCAN", "0")
+    assert ann_settings_statement(2000)[1] == {"v0": "1000"}
+    assert ann_settings_statement(10, 5000)[1] == {"v0": "1000"}
+    monkeypatch.setenv("FILTER_ITERATIVE_SCAN", "1")
+    assert ann_settings_statement(2000)[1] == {"v0": "1000", "v1": "strict_order"}
+
+def test_plan_summary_collects_nested_indexes():
+    plan = {
+        "Node Type": "Limit",
+        "Plans": [{"Node Type": "Index Scan", "Index Name": "documents_cat_health_0123456789_hnsw_idx"}],
+    }
+    assert plan_summary(plan) == {
+        "index_names": ["documents_cat_health_0123456789_hnsw_idx"],
+        "node_types": ["Index Scan", "Limit"],
+    }
@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+
+from src.scripts.simulation import MISSING_RANK, ClickSimulator
+
+def make_simulator(limit=20):
+    queries = [("q1", "first"), ("q2", "second")]
+    ids = np.arange(100, 130, dtype=np.int64)
+    similarities = np.linspace(0.9, 0.6, len(ids))
+    candidates = [(ids, similarities), (ids[::-1].copy(), similarities)]
+    return queries, ClickSimulator(queries, candidates, limit)
+
+def test_initial_ranking_follows_similarity():
+    queries, simulator = make_simulator(limit=5)
+    feedback = np.zeros(len(simulator.doc_ids), dtype=np.int64)
+    assert simulator.rank(0, "log", feedback).tolist() == [100, 101, 102, 103, 104]
+    assert simulator.rank(1, "log", feedback).tolist() == [129, 128, 127, 126, 125]
+
+def test_clicks_promote_target_and_schema_matches_benchmark():
+    queries, simulator = make_simulator()
+    rows = simulator.run("Efficiency", ["linear"], queries[:1], max_clicks=200, noise_prob=0.0, checkpoints=[0, 200])
+    assert [row["clicks"] for row in rows] == [0, 200]
+    assert set(rows[0]) == {"experiment", "strategy", "query_id", "clicks", "target_rank", "distractor_rank", "is_noisy"}
+    assert rows[1]["target_rank"] == 1
+    assert rows[1]["distractor_rank"] == 2
+
+def test_rank_outside_top_k_is_missing():
+    queries, simulator = make_simulator(limit=5)
+    ranked = simulator.rank(0, "log", np.zeros(len(simulator.doc_ids), dtype=np.int64))
+    assert simulator.rank_of(ranked, 102) == 3
+    assert simulator.rank_of(ranked, 129) == MISSING_RANK
+
+def test_seeded_runs_are_reproducible():
+    queries, simulator = make_simulator()
+    first = simulator.run("Noise", ["log", "sigmoid"], queries, 5, 0.3, [0, 5], rng=random.Random(7))
+    second = simulator.run("Noise", ["log", "sigmoid"], queries, 5, 0.3, [0, 5], rng=random.Random(7))
+    assert first == second
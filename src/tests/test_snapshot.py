@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import numpy as np
+
+from src.snapshot import MIN_CAPACITY, VectorSnapshot, normalize_rows
+
+def corpus(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.arange(1, n + 1), rng.normal(size=(n, dim)).astype(np.float32)
+
+def exact_top(vectors, query, k):
+    similarities = normalize_rows(vectors) @ normalize_rows(query)[0]
+    return np.argsort(-similarities, kind="stable")[:k]
+
+def test_exact_search_matches_brute_force(tmp_path):
+    ids, vectors = corpus(300)
+    snapshot = VectorSnapshot(str(tmp_path), "test/model", dim=16)
+    assert snapshot.append(ids, vectors) == 300
+
+    query = vectors[7] + 0.1
+    found, distances = snapshot.search(query, 10)
+    assert list(found) == list(ids[exact_top(vectors, query, 10)])
+    assert np.all(np.diff(distances) >= 0)
+
+def test_binary_prefilter_rescores_candidates(tmp_path):
+    ids, vectors = corpus(500, dim=64)
+    snapshot = VectorSnapshot(str(tmp_path), "test/model", dim=64)
+    snapshot.append(ids, vectors)
+
+    found, _ = snapshot.search(vectors[3], 10, mode="binary", approx_limit=100)
+    assert found[0] == ids[3]
+    assert len(set(found) & set(ids[exact_top(vectors, vectors[3], 10)])) >= 5
+
+def test_appends_skip_known_ids_and_grow_generations(tmp_path):
+    ids, vectors = corpus(MIN_CAPACITY + 10)
+    writer = VectorSnapshot(str(tmp_path), "test/model", dim=16, dtype="float16")
+    writer.append(ids[:100], vectors[:100], [datetime(2024, 1, 1)] * 100)
+    assert writer.append(ids[50:100], vectors[50:100]) == 0
+    assert writer.append(ids[100:], vectors[100:], [datetime(2024, 2, 1)]) == MIN_CAPACITY - 90
+    assert writer.meta["generation"] == 2
+    assert writer.meta["max_created_at"] == "2024-02-01T00:00:00"
+
+    reader = VectorSnapshot(str(tmp_path), "test/model", dim=16, dtype="float16")
+    assert reader.load()
+    assert reader.rows == len(ids)
+    assert reader.search(vectors[-1], 1)[0][0] == ids[-1]